@@ -0,0 +1,47 @@
+# Controle adaptativo do tamanho M da amostra do passo forward (sddp.py e sddip-v2.py). A cada iteração compara a
+# semilargura do intervalo de confiança do UB estatístico com o gap entre a média das amostras e o LB: se o ruído domina o
+# gap, a estimativa do UB não distingue nada e M aumenta; se o ruído é bem menor que o gap, as amostras extras não mudam
+# nada e M diminui. M também é limitado pelo orçamento total de resoluções, estimando as resoluções da próxima iteração
+# pelas resoluções por amostra da anterior.
+
+import math
+
+FATOR = 2               # fator de aumento e de redução de M
+RUIDO = 0.5             # razão semilargura / gap acima da qual M aumenta
+PRECISAO = 0.1          # razão semilargura / gap abaixo da qual M diminui
+TOLERANCIA = 1e-5       # gap abaixo do qual o LB é considerado dentro do intervalo
+
+# Retorna o controle de uma execução que começa com M amostras por iteração, entre minimo e maximo, e pode resolver no
+# máximo orcamento subproblemas (None: sem limite)
+def criaControle(M, minimo=1, maximo=math.inf, orcamento=None):
+    return {"M": max(minimo, min(M, maximo)), "minimo": minimo, "maximo": maximo, "orcamento": orcamento, "historico": []}
+
+# Registra a iteração que usou controle["M"] amostras e retorna o M da próxima, ou 0 se o orçamento acabou
+# media, semilargura: média das amostras e semilargura do intervalo de confiança do UB
+# resolucoes: resoluções desde o início; resolucoesIteracao: resoluções da iteração
+def atualizaControle(controle, iteracao, LB, media, semilargura, resolucoes, resolucoesIteracao):
+    M = controle["M"]
+    gap = media - LB
+    razao = semilargura / gap if gap > TOLERANCIA else math.inf
+    controle["historico"].append({"iteracao": iteracao, "M": M, "semilargura": semilargura, "gap": gap,
+        "resolucoes": resolucoesIteracao})
+
+    if razao > RUIDO:
+        proximo = M * FATOR
+    elif razao < PRECISAO:
+        proximo = math.ceil(M / FATOR)
+    else:
+        proximo = M
+    proximo = max(controle["minimo"], min(proximo, controle["maximo"]))
+    if controle["orcamento"] is not None:
+        restante = controle["orcamento"] - resolucoes
+        proximo = min(proximo, int(restante * M / max(resolucoesIteracao, 1)))
+        if proximo < controle["minimo"]:
+            proximo = 0                 # nem a amostra mínima cabe no orçamento
+    controle["M"] = proximo
+    return proximo
+
+# Formata o registro de uma iteração do controle como uma linha do relatório
+def formataControle(registro):
+    return (f"M = {registro['M']}, semilargura = {registro['semilargura']:.4f}, gap = {registro['gap']:.4f}, "
+        f"resoluções = {registro['resolucoes']}")
@@ -0,0 +1,304 @@
+# Benchmark dos algoritmos (PDE, SDDP e SDDiP) sobre um conjunto de instâncias.
+# Cada execução roda em um processo separado, com semente fixa e limite de tempo, e registra tempo de parede, tempo de
+# construção dos modelos, número de subproblemas resolvidos, iterações, pico de memória, LB/UB finais e o gap em relação
+# ao ótimo do PDE da mesma instância. O modo "compara" aponta as regressões entre dois arquivos de resultados. O modo "lote"
+# executa uma lista de jobs num único processo (ou num pool de processos persistentes), que importa o Pyomo e carrega os
+# scripts dos algoritmos uma só vez, e escreve os resultados num CSV.
+
+import sys, os, json, csv, time, glob, fnmatch, argparse, platform, resource, subprocess, tempfile, importlib.util
+import contextlib, multiprocessing
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Script e função de cada algoritmo
+ALGORITMOS = {
+    "pde": ("pde.py", "pde"),
+    "pde-v2": ("pde-v2.py", "pde"),
+    "sddp": ("sddp.py", "sddp"),
+    "sddip": ("sddip-v2.py", "sddip"),
+}
+
+# Retorna a função principal do script do algoritmo (os scripts têm '-' no nome e não podem ser importados diretamente)
+def carregaAlgoritmo(algoritmo):
+    script, funcao = ALGORITMOS[algoritmo]
+    spec = importlib.util.spec_from_file_location(script[:-3].replace('-', '_'), os.path.join(DIRETORIO, script))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = modulo     # permite que o algoritmo use funções do módulo em outros processos
+    spec.loader.exec_module(modulo)
+    return getattr(modulo, funcao)
+
+# Retorna (H, g) de uma instância no formato do SDD(i)P: H é o número de namespaces e g o número de cenários do estágio 1
+def parametrosInstancia(arquivo):
+    with open(arquivo) as f:
+        texto = f.read()
+    H = texto.count("namespace t")
+    bloco = texto[texto.index("namespace t1"):] if H > 1 else texto
+    linha = bloco[bloco.index("set S :="):].split(';')[0]
+    g = len(linha.split(":=")[1].split())
+    return H, g
+
+# Retorna o arquivo do PDE correspondente a uma instância do SDD(i)P, ou None se não existir
+def arquivoPde(arquivo):
+    diretorio, nome = os.path.split(arquivo)
+    if nome.startswith("sddp-"):
+        nome = "pde-" + nome[5:]
+    elif nome.endswith("-v2.dat"):
+        nome = nome[:-7] + "-pde-v2.dat"
+    else:
+        nome = nome[:-4] + "-pde.dat"
+    pde = os.path.join(diretorio, nome)
+    return pde if os.path.exists(pde) else None
+
+# Retorna a lista de instâncias de um diretório (ou de um manifesto do gera.py), filtradas pelo padrão dado.
+# Cada instância é um dicionário com nome, H, g, o arquivo do SDD(i)P, o do PDE e o algoritmo que resolve o formato.
+def listaInstancias(diretorio, manifesto=None, padrao="*"):
+    if manifesto:
+        if manifesto.endswith(".csv"):
+            with open(manifesto, newline='') as f:
+                itens = list(csv.DictReader(f))
+        else:
+            with open(manifesto) as f:
+                itens = json.load(f)["instancias"]
+        base = os.path.dirname(os.path.abspath(manifesto))
+        return [{"nome": os.path.basename(item["sddp"]), "H": int(item["H"]), "g": int(item["g"]), "formato": "sddp",
+            "arquivo": os.path.join(base, item["sddp"]), "pde": os.path.join(base, item["pde"])} for item in itens
+            if fnmatch.fnmatch(os.path.basename(item["sddp"]), padrao)]
+
+    instancias = []
+    for arquivo in sorted(glob.glob(os.path.join(diretorio, padrao))):
+        with open(arquivo) as f:
+            texto = f.read()
+        if "namespace" not in texto:        # arquivo do PDE
+            continue
+        H, g = parametrosInstancia(arquivo)
+        instancias.append({"nome": os.path.basename(arquivo), "H": H, "g": g,
+            "formato": "sddip" if "set P1" in texto else "sddp", "arquivo": os.path.abspath(arquivo),
+            "pde": arquivoPde(os.path.abspath(arquivo))})
+    return instancias
+
+# Executa a função funcao do algoritmo e retorna o dicionário com as métricas. parametro é o g do PDE ou o M do SDD(i)P
+def resolveJob(funcao, algoritmo, arquivo, H, parametro, semente):
+    if algoritmo == "pde":
+        res = funcao(arquivo, H, parametro)
+    elif algoritmo == "pde-v2":
+        K = H if parametro == 1 else (parametro**H - 1) // (parametro - 1)
+        res = {"z": funcao(arquivo, K, [-1] + [(k - 1) // parametro for k in range(1, K)])}
+    else:
+        res = funcao(arquivo, H, parametro, semente)
+    return dict(res or {})
+
+# Executa um algoritmo no processo atual e escreve as métricas no arquivo de resultado (chamado pelo processo filho)
+def executaJob(algoritmo, arquivo, H, parametro, semente, resultado):
+    res = resolveJob(carregaAlgoritmo(algoritmo), algoritmo, arquivo, H, parametro, semente)
+    res["memoria_pico_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(resultado, 'w') as f:
+        json.dump(res, f)
+
+# Executa um algoritmo em um processo filho com limite de tempo e retorna o registro da execução
+def executa(algoritmo, instancia, arquivo, parametro, semente, limite):
+    registro = {"algoritmo": algoritmo, "instancia": instancia["nome"], "H": instancia["H"], "parametro": parametro,
+        "semente": semente}
+    with tempfile.TemporaryDirectory() as tmp:
+        resultado = os.path.join(tmp, "resultado.json")
+        comando = [sys.executable, os.path.abspath(__file__), "job", algoritmo, arquivo, str(instancia["H"]),
+            str(parametro), str(semente), resultado]
+        inicio = time.time()
+        try:
+            proc = subprocess.run(comando, cwd=tmp, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE, timeout=limite, text=True)
+            registro["status"] = "ok" if proc.returncode == 0 and os.path.exists(resultado) else "erro"
+            if registro["status"] == "erro":
+                registro["erro"] = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"código {proc.returncode}"
+        except subprocess.TimeoutExpired:
+            registro["status"] = "tempo esgotado"
+        registro["parede"] = time.time() - inicio
+        if registro["status"] == "ok":
+            with open(resultado) as f:
+                registro.update(json.load(f))
+    return registro
+
+# Executa todos os algoritmos pedidos sobre as instâncias e escreve os resultados em saida
+def benchmark(saida, instancias, algoritmos, Ms, sementes, limite):
+    registros = []
+    for instancia in instancias:
+        # Ótimo de referência: PDE da mesma instância
+        zRef = None
+        refAlg = "pde" if instancia["formato"] == "sddp" else "pde-v2"
+        if instancia["pde"] and "pde" in algoritmos:
+            registro = executa(refAlg, instancia, instancia["pde"], instancia["g"], 0, limite)
+            registros.append(registro)
+            zRef = registro.get("z")
+            print(f"{instancia['nome']} {refAlg}: {registro['status']}, z* = {zRef}, {registro['parede']:.2f}s", flush=True)
+
+        algoritmo = instancia["formato"]
+        if algoritmo not in algoritmos:
+            continue
+        for M in Ms:
+            for semente in sementes:
+                registro = executa(algoritmo, instancia, instancia["arquivo"], M, semente, limite)
+                if zRef is not None and registro["status"] == "ok":
+                    registro["z_ref"] = zRef
+                    registro["gap_LB"] = (zRef - registro["LB"]) / abs(zRef)
+                    registro["gap_UB"] = (registro["UB"] - zRef) / abs(zRef)
+                registros.append(registro)
+                print(f"{instancia['nome']} {algoritmo} M={M} semente={semente}: {registro['status']}, "
+                    f"LB = {registro.get('LB')}, UB = {registro.get('UB')}, {registro['parede']:.2f}s", flush=True)
+
+    with open(saida, 'w') as f:
+        json.dump({"maquina": platform.node(), "python": platform.python_version(), "data": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "limite": limite, "resultados": registros}, f, indent=2)
+    return registros
+
+# Compara dois arquivos de resultados. Uma execução regrediu se piorou seu status, se seu tempo de parede ou seu número de
+# subproblemas resolvidos cresceu mais que a tolerância relativa, ou se seu gap piorou. Retorna o número de regressões.
+def compara(base, novo, tolerancia, minimo):
+    def chave(r):
+        return (r["algoritmo"], r["instancia"], r["parametro"], r["semente"])
+    with open(base) as f:
+        antigos = {chave(r): r for r in json.load(f)["resultados"]}
+    with open(novo) as f:
+        novos = json.load(f)["resultados"]
+
+    regressoes = 0
+    for r in novos:
+        a = antigos.get(chave(r))
+        if a is None:
+            continue
+        problemas = []
+        if a["status"] == "ok" and r["status"] != "ok":
+            problemas.append(f"status {r['status']}")
+        elif r["status"] == "ok" and a["status"] == "ok":
+            if r["parede"] > a["parede"]*(1 + tolerancia) and r["parede"] - a["parede"] > minimo:
+                problemas.append(f"tempo {a['parede']:.2f}s -> {r['parede']:.2f}s")
+            if "resolucoes" in r and r["resolucoes"] > a["resolucoes"]*(1 + tolerancia):
+                problemas.append(f"resoluções {a['resolucoes']} -> {r['resolucoes']}")
+            for gap in ["gap_LB", "gap_UB"]:
+                if gap in r and gap in a and r[gap] > a[gap] + 1e-6:
+                    problemas.append(f"{gap} {a[gap]:.6f} -> {r[gap]:.6f}")
+        variacao = (r["parede"] / a["parede"] - 1)*100 if a["parede"] > 0 else 0
+        print(f"{'REGRESSÃO' if problemas else 'ok':10} {r['algoritmo']:7} {r['instancia']:28} {str(r['parametro']):>4} "
+            f"{a['parede']:9.2f}s {r['parede']:9.2f}s {variacao:+7.1f}%  {'; '.join(problemas)}")
+        regressoes += bool(problemas)
+    print(f"\n{regressoes} regressões")
+    return regressoes
+
+# Funções dos algoritmos já carregadas no processo do lote
+carregados = {}
+
+# Retorna os jobs de um arquivo CSV com as colunas arquivo, algoritmo, H, parametro (g do PDE ou M do SDD(i)P) e semente
+# (opcional, padrão 1). Caminhos relativos são relativos ao diretório do arquivo de jobs
+def leJobs(arquivo):
+    base = os.path.dirname(os.path.abspath(arquivo))
+    with open(arquivo, newline='') as f:
+        jobs = [{"instancia": os.path.basename(item["arquivo"]), "algoritmo": item["algoritmo"].strip(), "H": int(item["H"]),
+            "parametro": int(item["parametro"]), "semente": int(item.get("semente") or 1),
+            "arquivo": os.path.join(base, item["arquivo"].strip())} for item in csv.DictReader(f)]
+    for job in jobs:
+        if job["algoritmo"] not in ALGORITMOS:
+            raise ValueError(f"algoritmo desconhecido: {job['algoritmo']}")
+    return jobs
+
+# Prepara um processo do lote: carrega os scripts dos algoritmos (e, com eles, o Pyomo e os plugins dos solvers) e passa a
+# escrever os relatórios dos algoritmos em diretorio
+def iniciaLote(algoritmos, diretorio):
+    for algoritmo in algoritmos:
+        if algoritmo not in carregados:
+            carregados[algoritmo] = carregaAlgoritmo(algoritmo)
+    os.chdir(diretorio)
+
+# Executa um job no processo do lote e retorna seu registro, com as métricas escalares do resultado. Um erro no job não
+# interrompe o lote
+def executaLote(job):
+    registro = {chave: job[chave] for chave in ["instancia", "algoritmo", "H", "parametro", "semente"]}
+    inicio = time.time()
+    try:
+        with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+            res = resolveJob(carregados[job["algoritmo"]], job["algoritmo"], job["arquivo"], job["H"], job["parametro"],
+                job["semente"])
+        registro["status"] = "ok"
+        registro.update({chave: valor for chave, valor in res.items()
+            if valor is None or isinstance(valor, (int, float, str))})
+    except Exception as erro:
+        registro["status"] = "erro"
+        registro["erro"] = f"{type(erro).__name__}: {erro}"
+    registro["parede"] = time.time() - inicio
+    return registro
+
+# Executa os jobs do arquivo arquivoJobs em processos processos persistentes (1: no próprio processo) e escreve os
+# registros em saida (CSV, uma linha por job, na ordem do arquivo de jobs). Os relatórios dos algoritmos vão para
+# diretorio (padrão: um diretório temporário). Sem um processo por job, não há limite de tempo por execução
+def lote(arquivoJobs, saida, processos=1, diretorio=None):
+    jobs = leJobs(arquivoJobs)
+    algoritmos = sorted({job["algoritmo"] for job in jobs})
+    diretorio = os.path.abspath(diretorio) if diretorio else tempfile.mkdtemp(prefix="lote-")
+    inicio = time.time()
+    registros = []
+
+    def imprime(registro):
+        registros.append(registro)
+        print(f"{registro['instancia']} {registro['algoritmo']} {registro['parametro']} semente={registro['semente']}: "
+            f"{registro['status']}, {registro['parede']:.2f}s", flush=True)
+
+    if processos == 1:
+        atual = os.getcwd()
+        try:
+            iniciaLote(algoritmos, diretorio)
+            for job in jobs:
+                imprime(executaLote(job))
+        finally:
+            os.chdir(atual)
+    else:
+        with multiprocessing.Pool(processos, iniciaLote, (algoritmos, diretorio)) as pool:
+            for registro in pool.imap(executaLote, jobs):
+                imprime(registro)
+
+    campos = ["instancia", "algoritmo", "H", "parametro", "semente", "status", "parede"]
+    campos += sorted({chave for registro in registros for chave in registro} - set(campos))
+    with open(saida, 'w', newline='') as f:
+        escritor = csv.DictWriter(f, campos, restval="")
+        escritor.writeheader()
+        escritor.writerows(registros)
+    print(f"\n{len(jobs)} jobs em {time.time() - inicio:.2f}s ({processos} processos), resultados em {saida}")
+    return registros
+
+# Modo de execução:
+# python benchmark.py executa <saida.json> [--instancias DIR] [--manifesto ARQ] [--padrao GLOB] [--algoritmos pde,sddp,sddip]
+#                                          [--M 0 ...] [--sementes 1 ...] [--limite SEGUNDOS]
+# python benchmark.py compara <base.json> <novo.json> [--tolerancia 0.1] [--minimo 0.5]
+# python benchmark.py lote <jobs.csv> <saida.csv> [--processos 1] [--diretorio DIR]
+#   jobs.csv: colunas arquivo, algoritmo (pde, pde-v2, sddp, sddip), H, parametro (g ou M) e semente
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "job":       # execução interna, no processo filho
+        executaJob(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]), int(sys.argv[6]), sys.argv[7])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark do PDE, SDDP e SDDiP")
+    sub = parser.add_subparsers(dest="modo", required=True)
+    ex = sub.add_parser("executa", help="executa o benchmark")
+    ex.add_argument("saida", help="arquivo JSON de resultados")
+    ex.add_argument("--instancias", default=os.path.join(DIRETORIO, "instancias"), help="diretório das instâncias")
+    ex.add_argument("--manifesto", help="manifesto gerado por gera.py lote (substitui --instancias)")
+    ex.add_argument("--padrao", default="*", help="padrão dos nomes das instâncias, ex.: 'sddp-5-*'")
+    ex.add_argument("--algoritmos", default="pde,sddp,sddip", help="algoritmos a executar")
+    ex.add_argument("--M", type=int, nargs='+', default=[0], help="números de amostras do SDD(i)P")
+    ex.add_argument("--sementes", type=int, nargs='+', default=[1], help="sementes da amostragem")
+    ex.add_argument("--limite", type=float, default=600, help="limite de tempo de cada execução, em segundos")
+    co = sub.add_parser("compara", help="compara dois arquivos de resultados")
+    co.add_argument("base")
+    co.add_argument("novo")
+    co.add_argument("--tolerancia", type=float, default=0.1, help="aumento relativo tolerado no tempo e nas resoluções")
+    co.add_argument("--minimo", type=float, default=0.5, help="aumento absoluto de tempo, em segundos, abaixo do qual não há regressão")
+    lo = sub.add_parser("lote", help="executa uma lista de jobs em processos persistentes e escreve um CSV")
+    lo.add_argument("jobs", help="arquivo CSV de jobs (arquivo, algoritmo, H, parametro, semente)")
+    lo.add_argument("saida", help="arquivo CSV de resultados")
+    lo.add_argument("--processos", type=int, default=1, help="número de processos persistentes (1: o próprio processo)")
+    lo.add_argument("--diretorio", help="diretório dos relatórios dos algoritmos (padrão: temporário)")
+    args = parser.parse_args()
+
+    if args.modo == "executa":
+        benchmark(args.saida, listaInstancias(args.instancias, args.manifesto, args.padrao), args.algoritmos.split(','),
+            args.M, args.sementes, args.limite)
+    elif args.modo == "lote":
+        lote(args.jobs, args.saida, args.processos, args.diretorio)
+    else:
+        sys.exit(1 if compara(args.base, args.novo, args.tolerancia, args.minimo) else 0)
@@ -0,0 +1,73 @@
+# Pool de cortes de otimalidade de um estágio. Cada corte theta + E·x >= e é guardado como uma linha de coeficientes E sobre
+# as variáveis de estado x do estágio (numa ordem fixa), com termo independente e. Os cortes novos ficam pendentes no pool
+# e são inseridos em bloco, ao final de cada estágio do passo backward, em todos os modelos do estágio (ex.: o MIP e sua
+# relaxação linear), que assim compartilham o mesmo pool. O pool também guarda o ponto de teste de cada corte, para que os
+# cortes de uma execução possam ser salvos e revalidados numa instância parecida (ver revalidaCortes em sddp.py).
+
+import numpy as np
+from pyomo.core.expr.numeric_expr import LinearExpression
+
+CAPACIDADE = 16         # capacidade inicial do pool (dobrada quando necessário)
+
+# Retorna um pool vazio para cortes com n coeficientes
+def criaPool(n):
+    return {"e": np.zeros(CAPACIDADE), "E": np.zeros((CAPACIDADE, n)), "X": np.zeros((CAPACIDADE, n)), "n": 0,
+        "inseridos": 0}
+
+# Retorna os termos independentes dos cortes do pool, na ordem em que foram adicionados
+def termos(pool):
+    return pool["e"][:pool["n"]]
+
+# Retorna a matriz de coeficientes dos cortes do pool (um corte por linha)
+def coeficientes(pool):
+    return pool["E"][:pool["n"]]
+
+# Retorna os pontos de teste dos cortes do pool (um por linha; zeros nos cortes adicionados sem ponto)
+def pontos(pool):
+    return pool["X"][:pool["n"]]
+
+# Adiciona ao pool o corte theta + E·x >= e (ainda não inserido nos modelos), gerado no ponto de teste dado
+def adicionaCorte(pool, E, e, ponto=None):
+    if pool["n"] == len(pool["e"]):
+        pool["e"] = np.concatenate([pool["e"], np.zeros(len(pool["e"]))])
+        pool["E"] = np.vstack([pool["E"], np.zeros(pool["E"].shape)])
+        pool["X"] = np.vstack([pool["X"], np.zeros(pool["X"].shape)])
+    pool["e"][pool["n"]] = e
+    pool["E"][pool["n"]] = E
+    if ponto is not None:
+        pool["X"][pool["n"]] = ponto
+    pool["n"] += 1
+
+# Verifica se o pool já tem um corte com os mesmos coeficientes e termo independente, a menos da tolerância
+def corteExiste(pool, E, e, tolerancia):
+    n = pool["n"]
+    if n == 0:
+        return False
+    iguais = np.abs(pool["e"][:n] - e) < tolerancia
+    iguais &= (np.abs(pool["E"][:n] - E) < tolerancia).all(axis=1)
+    return bool(iguais.any())
+
+# Insere os cortes pendentes do pool em todos os modelos do estágio
+# destinos: lista de (ConstraintList de cortes, variável theta, variáveis de estado na ordem das colunas) de cada modelo
+def insereCortes(pool, destinos):
+    for i in range(pool["inseridos"], pool["n"]):
+        e = float(pool["e"][i])
+        coefs = [1.0] + pool["E"][i].tolist()
+        for lista, theta, variaveis in destinos:
+            lista.add((e, LinearExpression(constant=0, linear_coefs=coefs, linear_vars=[theta] + variaveis), None))
+    pool["inseridos"] = pool["n"]
+
+# Salva em arquivo (formato .npz do NumPy) os cortes e os pontos de teste dos pools de todos os estágios
+def salvaPools(arquivo, pools):
+    dados = {}
+    for t, pool in enumerate(pools):
+        dados[f"e{t}"], dados[f"E{t}"], dados[f"X{t}"] = termos(pool), coeficientes(pool), pontos(pool)
+    with open(arquivo, 'wb') as f:
+        np.savez(f, **dados)
+
+# Lê os pools salvos por salvaPools. Retorna uma lista com (E, e, X) de cada estágio: coeficientes, termos independentes e
+# pontos de teste dos cortes
+def carregaPools(arquivo):
+    with np.load(arquivo) as dados:
+        H = len([nome for nome in dados.files if nome.startswith("e")])
+        return [(dados[f"E{t}"], dados[f"e{t}"], dados[f"X{t}"]) for t in range(H)]
@@ -1,7 +1,8 @@
 # Gera uma instância para o problema, nos formatos do SDD(i)P e do PDE
 
-import sys
-from numpy import random
+import sys, os, json, csv, hashlib, itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 s0 = 20                         # estoque inicial
 sMin = 0                        # limite mínimo do estoque
@@ -17,93 +18,58 @@ cpMin = 5                       # custo de adiamento mínimo de cada carga
 cpMax = 12                      # custo de adiamento máximo de cada carga
 dMin = 10                       # demanda mínima de cada cenário
 dMax = 50                       # demanda máxima de cada cenário
+BUFFER = 1 << 20                # tamanho do buffer de escrita dos arquivos
 
-# Retorna um aleatório em [a, b)
-def uniforme(a, b):
-    return (b-a)*random.random() + a
+# Retorna um vetor de n aleatórios em [a, b), sorteados pelo gerador rng
+def uniforme(rng, a, b, n=None):
+    return (b-a)*rng.random(n) + a
 
-# Gera uma instância. Parâmetros:
-# id: identificador da instância
-# H: número de estágios
-# g: número de cenários por estágio (grau da árvore)
-# A: número de cargas já adquiridas
-# P: número de cargas que podem ser adquiridas
-def gera(id, H, g, A, P):
-    def escreveSet(f, nome, valores, espacos=0):
-        f.write(f"{' '*espacos}set {nome} :=")
-        for i in valores:
-            f.write(f" {i}")
-        f.write(';\n')
-
-    def escreveParam(f, nome, valor, espacos=0):
-        f.write(f"{' '*espacos}param {nome} := {valor};\n")
-
-    def escreveParamSet(f, nome, valores, espacos=0, offfset=1, decimais=2):
-        f.write(f"{' '*espacos}param {nome} :=")
-        for i in range(len(valores)):
-            f.write(f"\n{' '*espacos}    {i+offfset} %.{decimais}f" % valores[i])
-        f.write(';\n')
+# Constrói a árvore de cenários nível a nível. Retorna, para cada cenário k (na ordem do PDE):
+# stages: estágio de k (a partir de 1)
+# filho: posição de k entre os filhos de seu predecessor (k - 1) // g
+# pAbs: probabilidade absoluta de k, o produto das probabilidades dos cenários no caminho até a raiz
+def geraArvore(H, g, p):
+    tamanhos = g ** np.arange(H, dtype=np.int64)            # número de cenários em cada estágio
+    K = int(tamanhos.sum())                                 # número de cenários
+    stages = np.repeat(np.arange(1, H + 1), tamanhos)
+    filho = np.zeros(K, dtype=np.int64)
+    filho[1:] = (np.arange(K - 1) % g)
+    niveis = [p[0, :1]]
+    for t in range(1, H):
+        niveis.append(np.repeat(niveis[t-1], g) * np.tile(p[t], tamanhos[t-1]))
+    pAbs = np.concatenate(niveis)
+    return stages, filho, pAbs
 
-    C = A + P
-    viavel = False      # viabilidade no primeiro estágio
-    while not viavel:
-        # Sorteia as cargas em A entre os dois primeiros estágios
-        A1 = []
-        A2 = []
-        for c in range(1, A + 1):
-            if random.random() < 0.5:
-                A1.append(c)
-            else:
-                A2.append(c)
-        
-        q = [uniforme(qMin, qMax) for c in range(C)]
-        q0 = sum(q[c] for c in A1)
-        d = [[uniforme(dMin, dMax) for i in range(g)] for t in range(H)]
-        d[0] = [d[0][0]]
+def escreveSet(f, nome, valores, espacos=0):
+    f.write(f"{' '*espacos}set {nome} :=")
+    f.write(''.join(f" {i}" for i in valores))
+    f.write(';\n')
 
-        viavel = (q0 + s0 >= d[0][0] + sMin) and (q0 + s0 <= d[0][0] + sMax)
+def escreveParam(f, nome, valor, espacos=0):
+    f.write(f"{' '*espacos}param {nome} := {valor};\n")
 
-    ca = [uniforme(caMin, caMax) for c in range(C)]
-    cc = [uniforme(ccMin, ccMax) for c in range(C)]
-    cp = [uniforme(cpMin, cpMax) for c in range(C)]
+def escreveParamSet(f, nome, valores, espacos=0, offfset=1, decimais=2):
+    linha = f"\n{' '*espacos}    %d %.{decimais}f"
+    f.write(f"{' '*espacos}param {nome} :=")
+    f.write(''.join([linha % (i, v) for i, v in enumerate(np.asarray(valores).tolist(), offfset)]))
+    f.write(';\n')
 
-    # Probabilidades dos cenários por estágio
-    alfa = 4 / g
-    beta = 4 - alfa
-    p = []
-    p.append([1])
-    for t in range(1, H):
-        p.append([0]*g)
-        falhou = True
-        while falhou:
-            falhou = False
-            p[t][g-1] = 1
-            for i in range(g - 1):
-                p[t][i] = random.beta(alfa, beta)
-                p[t][g-1] -= p[t][i]
-                if p[t][g-1] <= 0:
-                    falhou = True
-                    print(f"FALHOU: {p[t]}")
-                    break
-
-    K = int((g**H - 1) // (g - 1))              # número de cenários
+# Escreve uma instância nos arquivos arqSddp (formato do SDD(i)P) e arqPde (formato do PDE). Parâmetros:
+# H, g: número de estágios e de cenários por estágio
+# A, P: número de cargas já adquiridas e de cargas que podem ser adquiridas
+# A1, A2: cargas já adquiridas que chegam no primeiro e no segundo estágio
+# q, ca, cc, cp: volume e custos de cada carga
+# d, p: arrays (H, g) com a demanda e a probabilidade de cada cenário, por estágio (só o primeiro cenário do estágio 0)
+# sMin, sMax, s0, h: limites e estoque inicial, custo de estoque (padrão: os valores das instâncias geradas)
+# Retorna o número de cenários da árvore
+def escreveInstancia(arqSddp, arqPde, H, g, A, P, A1, A2, q, ca, cc, cp, d, p, sMin=sMin, sMax=sMax, s0=s0, h=h):
+    C = A + P
+    stages, filho, pAbs = geraArvore(H, g, p)
+    K = len(pAbs)                                           # número de cenários
     S = range(K)
-    pred = [-1]                                 # predecessor de cada cenário
-    stages = [1]                                # estágio de cada cenário
-    for k in range(1, K):
-        pred.append((k - 1) // g)
-        stages.append(stages[pred[k]] + 1)
-    pAbs = [p[0][0]]
-    for k in range(1, K):
-        pk = 1
-        k1 = k
-        while k1 != 0:
-            pk *= p[stages[k1]-1][(k1-1) % g]
-            k1 = pred[k1]
-        pAbs.append(pk)
-    
+
     # Escreve o arquivo para o SDDP/SDDiP
-    f = open(f"instancias/sddp-{H}-{g}-{A}-{P}-{id}.dat", 'w')
+    f = open(arqSddp, 'w', buffering=BUFFER)
     escreveSet(f, 'C', range(1, C + 1))
     f.write('\n')
     escreveParamSet(f, 'q', q)
@@ -128,8 +94,8 @@ def gera(id, H, g, A, P):
             escreveSet(f, 'PAnt', range(A + 1, C + 1), 4)
         escreveSet(f, 'S', [1] if t == 0 else range(1, g + 1), 4)
         f.write('\n')
-        escreveParamSet(f, 'p', p[t], 4, decimais=10)
-        escreveParamSet(f, 'd', d[t], 4)
+        escreveParamSet(f, 'p', p[t, :1] if t == 0 else p[t], 4, decimais=10)
+        escreveParamSet(f, 'd', d[t, :1] if t == 0 else d[t], 4)
         escreveParam(f, 'h', h, 4)
         if t == 0:
             escreveParam(f, 's0', s0, 4)
@@ -137,7 +103,7 @@ def gera(id, H, g, A, P):
     f.close()
 
     # Escreve o arquivo para o PDE
-    f = open(f"instancias/pde-{H}-{g}-{A}-{P}-{id}.dat", 'w')
+    f = open(arqPde, 'w', buffering=BUFFER)
     escreveSet(f, 'C', range(1, C + 1))
     escreveSet(f, 'P', range(A + 1, C + 1))
     escreveSet(f, 'A1', A1)
@@ -151,10 +117,116 @@ def gera(id, H, g, A, P):
     escreveParam(f, 'sMin', sMin)
     escreveParam(f, 'sMax', sMax)
     escreveParam(f, 's0', s0)
-    escreveParamSet(f, 'd', [d[0][0]] + [d[stages[k]-1][(k-1) % g] for k in range(1, K)], offfset=0)
+    escreveParamSet(f, 'd', d[stages - 1, filho], offfset=0)
     escreveParamSet(f, 'h', [h]*H)
     escreveParamSet(f, 'p', pAbs, offfset=0, decimais=10)
     f.close()
 
+    return K
+
+# Gera uma instância. Parâmetros:
+# id: identificador da instância
+# H: número de estágios
+# g: número de cenários por estágio (grau da árvore)
+# A: número de cargas já adquiridas
+# P: número de cargas que podem ser adquiridas
+# semente: semente do gerador de números aleatórios (a mesma semente gera a mesma instância, bit a bit)
+# diretorio: diretório onde os arquivos são escritos
+# Retorna um dicionário com os parâmetros, o número de cenários e os arquivos gerados
+def gera(id, H, g, A, P, semente=None, diretorio="instancias"):
+    rng = np.random.default_rng(semente)
+    C = A + P
+    d = uniforme(rng, dMin, dMax, (H, g))                   # demanda de cada cenário, por estágio
+    viavel = False      # viabilidade no primeiro estágio
+    while not viavel:
+        # Sorteia as cargas em A entre os dois primeiros estágios
+        emA1 = rng.random(A) < 0.5
+        A1 = [c for c in range(1, A + 1) if emA1[c-1]]
+        A2 = [c for c in range(1, A + 1) if not emA1[c-1]]
+
+        q = uniforme(rng, qMin, qMax, C)
+        q0 = q[:A][emA1].sum()
+        d[0, 0] = uniforme(rng, dMin, dMax)
+
+        viavel = (q0 + s0 >= d[0, 0] + sMin) and (q0 + s0 <= d[0, 0] + sMax)
+
+    ca = uniforme(rng, caMin, caMax, C)
+    cc = uniforme(rng, ccMin, ccMax, C)
+    cp = uniforme(rng, cpMin, cpMax, C)
+
+    # Probabilidades dos cenários por estágio. Cada p[t][i] tem distribuição marginal Beta(alfa, 4 - alfa), sorteadas todas
+    # de uma vez por uma Dirichlet(alfa, ..., alfa), que já soma 1 em cada estágio
+    alfa = 4 / g
+    p = np.empty((H, g))
+    p[0] = 0
+    p[0, 0] = 1
+    p[1:] = rng.dirichlet(np.full(g, alfa), H - 1)
+
+    arqSddp = os.path.join(diretorio, f"sddp-{H}-{g}-{A}-{P}-{id}.dat")
+    arqPde = os.path.join(diretorio, f"pde-{H}-{g}-{A}-{P}-{id}.dat")
+    K = escreveInstancia(arqSddp, arqPde, H, g, A, P, A1, A2, q, ca, cc, cp, d, p)
+    return {"id": id, "H": H, "g": g, "A": A, "P": P, "semente": semente, "K": K, "sddp": arqSddp, "pde": arqPde}
+
+# Retorna o hash SHA-256 do conteúdo de um arquivo
+def hashArquivo(arquivo):
+    sha = hashlib.sha256()
+    with open(arquivo, 'rb') as f:
+        for bloco in iter(lambda: f.read(BUFFER), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+# Colunas do manifesto CSV (campos de cada item gerado por geraItem)
+CAMPOS_MANIFESTO = ["id", "H", "g", "A", "P", "semente", "K", "sddp", "pde", "sha256_sddp", "sha256_pde"]
+
+# Gera uma instância da família e calcula os hashes dos arquivos (executado em um processo do pool)
+def geraItem(args):
+    item = gera(*args)
+    item["sha256_sddp"] = hashArquivo(item["sddp"])
+    item["sha256_pde"] = hashArquivo(item["pde"])
+    return item
+
+# Gera em paralelo uma família de instâncias, com todas as combinações dos parâmetros da grade. Parâmetros:
+# grade: dicionário com as listas de valores de "id", "H", "g", "A" e "P"
+# manifesto: arquivo (.json ou .csv) onde é escrita a lista de instâncias geradas
+# processos: número de processos (None: número de CPUs)
+# semente: semente base. Cada instância recebe uma semente própria, derivada de uma sequência independente da semente base
+def geraLote(grade, manifesto, processos=None, semente=None, diretorio="instancias"):
+    combinacoes = list(itertools.product(grade["id"], grade["H"], grade["g"], grade["A"], grade["P"]))
+    base = np.random.SeedSequence(semente)
+    sementes = [int(ss.generate_state(1, np.uint64)[0]) for ss in base.spawn(len(combinacoes))]
+    os.makedirs(diretorio, exist_ok=True)
+    with ProcessPoolExecutor(processos) as pool:
+        itens = list(pool.map(geraItem, [(*comb, sem, diretorio) for comb, sem in zip(combinacoes, sementes)]))
+
+    if manifesto.endswith(".csv"):
+        with open(manifesto, 'w', newline='') as f:
+            escritor = csv.DictWriter(f, fieldnames=CAMPOS_MANIFESTO)
+            escritor.writeheader()
+            escritor.writerows(itens)
+    else:
+        with open(manifesto, 'w') as f:
+            json.dump({"semente_base": base.entropy, "instancias": itens}, f, indent=2)
+    return itens
+
+# Modo de execução:
+# python gera.py <id> <H> <g> <A> <P> [semente]
+#   gera uma instância (com a semente dada, para regerar uma instância do manifesto)
+# python gera.py lote <grade.json> <manifesto.json|.csv> [processos] [semente]
+#   gera em paralelo todas as combinações da grade, ex.: {"id": [1, 2, 3], "H": [5], "g": [2, 3], "A": [2], "P": [8]}
 if __name__ == '__main__':
-    gera(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5]))
+    if len(sys.argv) in [4, 5, 6] and sys.argv[1] == "lote":
+        with open(sys.argv[2]) as f:
+            grade = json.load(f)
+        itens = geraLote(grade, sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else None,
+            int(sys.argv[5]) if len(sys.argv) > 5 else None)
+        print(f"{len(itens)} instâncias geradas. Manifesto: {sys.argv[3]}")
+    elif len(sys.argv) in [6, 7]:
+        gera(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5]),
+            int(sys.argv[6]) if len(sys.argv) > 6 else None)
+    else:
+        print("Modo de execução:\npython gera.py <id> <H> <g> <A> <P> [semente]")
+        print("python gera.py lote <grade.json> <manifesto.json|.csv> [processos] [semente]\nonde:")
+        print("id: identificador da instância\nH: número de estágios\ng: número de cenários por estágio")
+        print("A: número de cargas já adquiridas\nP: número de cargas que podem ser adquiridas")
+        print("grade: arquivo JSON com as listas de valores de id, H, g, A e P")
+        print("manifesto: arquivo onde é escrita a lista de instâncias, com parâmetros, sementes e hashes")
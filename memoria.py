@@ -0,0 +1,57 @@
+# Instrumentação de memória dos algoritmos: RSS do processo, snapshots do tracemalloc e tamanho profundo das estruturas
+# de dados, para atribuir o consumo ao pool de cortes, aos buffers de solução e aos modelos Pyomo
+
+import sys, tracemalloc, resource
+
+# Retorna o tamanho profundo de um objeto em bytes, somando os objetos alcançáveis por listas, tuplas, dicionários e conjuntos
+# (cada objeto é contado uma só vez)
+def tamanhoProfundo(obj):
+    vistos = set()
+    pilha = [obj]
+    total = 0
+    while pilha:
+        o = pilha.pop()
+        if id(o) in vistos:
+            continue
+        vistos.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            pilha.extend(o.keys())
+            pilha.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            pilha.extend(o)
+    return total
+
+# Retorna o RSS atual do processo em bytes (ou o pico, se /proc não estiver disponível)
+def rssAtual():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Inicia o rastreamento das alocações
+def iniciaMemoria():
+    tracemalloc.start()
+
+# Finaliza o rastreamento das alocações
+def finalizaMemoria():
+    tracemalloc.stop()
+
+# Mede a memória do processo e retorna um dicionário com:
+# rss: RSS atual; traced, traced_pico: memória alocada pelo Python agora e no pico (tracemalloc)
+# pyomo: memória alocada por código do Pyomo ainda viva (modelos, restrições e expressões)
+# e, para cada componente nomeado em componentes, seu tamanho profundo
+def medeMemoria(componentes):
+    medida = {"rss": rssAtual()}
+    if tracemalloc.is_tracing():
+        medida["traced"], medida["traced_pico"] = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, "*pyomo*")])
+        medida["pyomo"] = sum(stat.size for stat in snapshot.statistics("filename"))
+    for nome, obj in componentes.items():
+        medida[nome] = tamanhoProfundo(obj)
+    return medida
+
+# Formata uma medida como uma linha do relatório, em MB
+def formataMemoria(medida):
+    return ", ".join(f"{nome} = {valor / 2**20:.2f}MB" for nome, valor in medida.items() if nome != "iteracao")
@@ -0,0 +1,203 @@
+# Micro-benchmarks das funções em Python puro chamadas nos laços do SDDP (sddp.py). Cada função é exercitada isoladamente,
+# sobre pools de cortes, amostras e soluções sintéticas de tamanho configurável, e o tempo é medido em função de M (amostras),
+# H (estágios), C (cargas) e do número de cortes. Para cada curva é reportado o expoente empírico de crescimento, obtido por
+# regressão no espaço log-log (tempo ~ tamanho^expoente).
+
+import json, math, time, argparse, random
+import numpy as np
+from pyomo.environ import ConcreteModel, Var, Constraint, ConstraintList, Suffix
+import sddp
+from cortes import criaPool, adicionaCorte
+
+# Retorna o menor tempo médio por chamada de f(), em segundos, entre as repetições
+def mede(f, repeticoes, minimo=0.05):
+    chamadas = 1
+    while True:         # calibra o número de chamadas por repetição
+        inicio = time.perf_counter()
+        for i in range(chamadas):
+            f()
+        if time.perf_counter() - inicio >= minimo:
+            break
+        chamadas *= 2
+    melhor = math.inf
+    for r in range(repeticoes):
+        inicio = time.perf_counter()
+        for i in range(chamadas):
+            f()
+        melhor = min(melhor, (time.perf_counter() - inicio) / chamadas)
+    return melhor
+
+# Retorna o expoente de crescimento do tempo em função do tamanho (coeficiente angular no espaço log-log)
+def expoente(tamanhos, tempos):
+    xs = [math.log(x) for x in tamanhos]
+    ys = [math.log(y) for y in tempos]
+    mx = sum(xs) / len(xs)
+    my = sum(ys) / len(ys)
+    den = sum((x - mx)**2 for x in xs)
+    return sum((x - mx)*(y - my) for x, y in zip(xs, ys)) / den if den > 0 else float("nan")
+
+# Corte sintético (E, e) sobre as cargas 1..C (metade adquiríveis, metade pré-adquiridas), com colunas s, v, x, z2 e z1
+def corteSintetico(C):
+    nA = C - C // 2
+    E = np.array([random.uniform(-100, 0)] + [random.uniform(-1e3, 0) for i in range(C // 2 + 3*nA)])
+    return E, random.uniform(0, 1e4)
+
+# Pool (cortes.py) com n cortes sintéticos
+def poolSintetico(n, C):
+    pool = criaPool(1 + C // 2 + 3*(C - C // 2))
+    for i in range(n):
+        adicionaCorte(pool, *corteSintetico(C))
+    return pool
+
+# Amostra sintética de M caminhos em uma árvore de grau g com H estágios
+def amostraSintetica(M, H, g):
+    return [[0] + [random.randint(1, g) for t in range(1, H)] for m in range(M)]
+
+# Cenários sintéticos de cada estágio, com probabilidades iguais
+def cenariosSinteticos(H, g):
+    return [[(1, 1.0)]] + [[(s, 1 / g) for s in range(1, g + 1)] for t in range(1, H)]
+
+# Modelo de um estágio intermediário com C cargas e n cortes, com as duais preenchidas (sem resolver)
+def modeloSintetico(C, n):
+    model = ConcreteModel()
+    model.P = list(range(1, C // 2 + 1))
+    model.A = list(range(C // 2 + 1, C + 1))
+    model.s = Var()
+    model.v = Var(model.P)
+    model.x = Var(model.A)
+    model.z2 = Var(model.A)
+    model.z1 = Var(model.A)
+    model.theta = Var()
+    model.balanco = Constraint(expr=model.s == 0)
+    model.limiteSMin = Constraint(expr=model.s >= 0)
+    model.limiteSMax = Constraint(expr=model.s <= 1)
+    model.aquisicao = Constraint(expr=sum(model.v[c] for c in model.P) == 0)
+    model.cancelamento = Constraint(expr=sum(model.x[c] for c in model.A) == 0)
+    model.adiamento1 = Constraint(expr=sum(model.z1[c] for c in model.A) == 0)
+    model.adiamento2 = Constraint(model.A, rule=lambda model, c: model.z1[c] == 0)
+    model.cancelamentoAdiamento = Constraint(model.A, rule=lambda model, c: model.z2[c] <= model.x[c])
+    model.limiteV = Constraint(model.P, rule=lambda model, c: model.v[c] <= 1)
+    model.limiteX = Constraint(model.A, rule=lambda model, c: model.x[c] <= 1)
+    model.limiteZ2 = Constraint(model.A, rule=lambda model, c: model.z2[c] <= 1)
+    model.cortesOtimalidade = ConstraintList()
+    for i in range(n):
+        model.cortesOtimalidade.add(expr=model.theta + random.random()*model.s >= random.random())
+    model.dual = Suffix(direction=Suffix.IMPORT)
+    for c in model.component_data_objects(Constraint):
+        model.dual[c] = random.random()
+    return model
+
+# Duais sintéticas de um cenário com C cargas e n cortes, no formato retornado por obtemDuais
+def duaisSinteticas(C, n):
+    A = range(C // 2 + 1, C + 1)
+    duais = {"balanco": random.random(), "limiteSMin": random.random(), "limiteSMax": random.random(),
+        "aquisicao": random.random(), "cancelamento": random.random(), "adiamento1": random.random(),
+        "adiamento2": {c: random.random() for c in A}, "cancelamentoAdiamento": {c: random.random() for c in A},
+        "limiteV": {c: random.random() for c in range(1, C // 2 + 1)}, "limiteX": {c: random.random() for c in A},
+        "limiteZ2": {c: random.random() for c in A}, "cortesOtimalidade": [random.random() for i in range(n)]}
+    return duais
+
+# Cada caso retorna, para um tamanho x da variável varrida, a função a ser medida. Os demais parâmetros ficam fixos.
+def casoCorteExiste(variavel, x, base):
+    C, n = (x, base["cortes"]) if variavel == "C" else (base["C"], x)
+    pool = poolSintetico(n, C)
+    E, e = corteSintetico(C)            # corte inédito: compara com todo o pool
+    return lambda: sddp.corteExiste(pool, E, e, sddp.EPSILON)
+
+def casoCenarioRepetido(variavel, x, base):
+    M, H = (x, base["H"]) if variavel == "M" else (base["M"], x)
+    amostra = amostraSintetica(M, H, base["g"])
+    def f():            # varredura completa do passo forward
+        for m in range(M):
+            for t in range(1, H):
+                sddp.cenarioRepetido(amostra, m, t, H)
+    return f
+
+def casoGeraAmostra(variavel, x, base):
+    M, H = (x, base["H"]) if variavel == "M" else (base["M"], x)
+    g = max(base["g"], math.ceil(2*M ** (1 / (H - 1))))      # árvore com caminhos suficientes para M amostras distintas
+    cenarios = cenariosSinteticos(H, g)
+    return lambda: sddp.geraAmostra(M, cenarios)
+
+def casoObtemDuais(variavel, x, base):
+    C, n = (x, base["cortes"]) if variavel == "C" else (base["C"], x)
+    model = modeloSintetico(C, n)
+    return lambda: sddp.obtemDuais(model)
+
+def casoCopiaSolucao(variavel, x, base):
+    M, H, C = base["M"], base["H"], base["C"]
+    if variavel == "M":
+        M = x
+    elif variavel == "H":
+        H = x
+    else:
+        C = x
+    origem = sddp.criaBuffers(M, H, C // 2, C - C // 2)[-1]
+    def f():            # cada amostra copia todos os estágios da amostra 0
+        for m in range(1, M):
+            for t in range(H - 1):
+                sddp.copiaSolucao(origem, t, 0, m)
+    return f
+
+def casoAcumulaCorte(variavel, x, base):
+    C, n = (x, base["cortes"]) if variavel == "C" else (base["C"], x)
+    P = range(1, C // 2 + 1)
+    A = range(C // 2 + 1, C + 1)
+    duais = duaisSinteticas(C, n)
+    eList = np.array([random.random() for i in range(n)])
+    q = {c: random.uniform(10, 50) for c in range(1, C + 1)}
+    def f():            # um corte agregado sobre os g cenários do estágio seguinte
+        corte = [0, 0, {c: 0 for c in P}, {c: 0 for c in A}, {c: 0 for c in A}, {c: 0 for c in A}]
+        for s in range(base["g"]):
+            sddp.acumulaCorte(corte, 1 / base["g"], duais, 30, 20, 0, 80, q, eList)
+    return f
+
+# Função -> (caso, variáveis que podem ser varridas)
+CASOS = {
+    "corteExiste": (casoCorteExiste, ["cortes", "C"]),
+    "cenarioRepetido": (casoCenarioRepetido, ["M", "H"]),
+    "geraAmostra": (casoGeraAmostra, ["M", "H"]),
+    "obtemDuais": (casoObtemDuais, ["cortes", "C"]),
+    "copiaSolucao": (casoCopiaSolucao, ["M", "H", "C"]),
+    "acumulaCorte": (casoAcumulaCorte, ["cortes", "C"]),
+}
+
+# Executa os micro-benchmarks e retorna as curvas de escalabilidade
+def microbench(funcoes, tamanhos, base, repeticoes):
+    curvas = []
+    for nome in funcoes:
+        caso, variaveis = CASOS[nome]
+        for variavel in variaveis:
+            tempos = []
+            for x in tamanhos[variavel]:
+                random.seed(0)
+                tempos.append(mede(caso(variavel, x, base), repeticoes))
+            k = expoente(tamanhos[variavel], tempos)
+            curvas.append({"funcao": nome, "variavel": variavel, "tamanhos": tamanhos[variavel], "tempos": tempos, "expoente": k})
+            print(f"\n{nome} x {variavel} (expoente empírico: {k:.2f})", flush=True)
+            for x, tempo in zip(tamanhos[variavel], tempos):
+                print(f"    {variavel} = {x:>7}: {tempo*1e6:12.2f} us")
+    return curvas
+
+# Modo de execução:
+# python microbench.py [--funcoes corteExiste ...] [--M 10 ...] [--H 3 ...] [--C 4 ...] [--cortes 10 ...] [--saida arq.json]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks das funções do SDDP")
+    parser.add_argument("--funcoes", nargs='+', default=list(CASOS), choices=list(CASOS))
+    parser.add_argument("--M", type=int, nargs='+', default=[10, 30, 100, 300], help="números de amostras")
+    parser.add_argument("--H", type=int, nargs='+', default=[3, 5, 10, 20], help="números de estágios")
+    parser.add_argument("--C", type=int, nargs='+', default=[4, 10, 30, 100], help="números de cargas")
+    parser.add_argument("--cortes", type=int, nargs='+', default=[10, 100, 1000, 3000], help="tamanhos do pool de cortes")
+    parser.add_argument("--g", type=int, default=3, help="grau da árvore de cenários")
+    parser.add_argument("--repeticoes", type=int, default=5, help="repetições de cada medida (é usado o menor tempo)")
+    parser.add_argument("--saida", help="arquivo JSON com as curvas medidas")
+    args = parser.parse_args()
+
+    # Valores fixos de cada variável quando outra é varrida
+    base = {"M": args.M[len(args.M) // 2], "H": args.H[len(args.H) // 2], "C": args.C[len(args.C) // 2],
+        "cortes": args.cortes[len(args.cortes) // 2], "g": args.g}
+    tamanhos = {"M": args.M, "H": args.H, "C": args.C, "cortes": args.cortes}
+    curvas = microbench(args.funcoes, tamanhos, base, args.repeticoes)
+    if args.saida:
+        with open(args.saida, 'w') as f:
+            json.dump({"base": base, "curvas": curvas}, f, indent=2)
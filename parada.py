@@ -0,0 +1,117 @@
+# Regras de parada configuráveis do SDDP (sddp.py) e do SDDiP (sddip-v2.py). Uma regra é uma lista de critérios
+# (dicionários criados pelas funções criterio*) e o algoritmo para no primeiro critério satisfeito. Os critérios de
+# convergência (gap relativo, estabilização do LB numa janela) dizem que a solução é boa o bastante; os de orçamento (tempo
+# de parede, resoluções de subproblemas, iterações) limitam a latência da execução. Ao parar, a execução escreve os melhores
+# limites e a decisão do primeiro estágio atual (incumbente), de forma que uma execução interrompida por um orçamento
+# também tem uma resposta utilizável.
+
+import time, json, math
+
+ORCAMENTOS = ["tempo", "resolucoes", "iteracoes"]       # tipos de critério que são orçamentos
+
+# Para quando (UB - LB) / |LB| < tolerancia (ou UB - LB < tolerancia, se relativo == False)
+def criterioGap(tolerancia, relativo=True):
+    return {"tipo": "gap", "tolerancia": tolerancia, "relativo": relativo}
+
+# Para quando o LB melhorou menos que tolerancia nas últimas janela iterações estáveis (ver verificaParada)
+def criterioLB(janela=1, tolerancia=1e-5):
+    return {"tipo": "lb", "janela": janela, "tolerancia": tolerancia}
+
+# Para quando o tempo de parede desde criaParada chega a segundos
+def criterioTempo(segundos):
+    return {"tipo": "tempo", "limite": segundos}
+
+# Para quando o número de subproblemas resolvidos chega a n
+def criterioResolucoes(n):
+    return {"tipo": "resolucoes", "limite": n}
+
+# Para quando o número de iterações chega a n
+def criterioIteracoes(n):
+    return {"tipo": "iteracoes", "limite": n}
+
+# Retorna a regra de parada com os critérios dados, com o relógio começando agora
+# estatistico: se True, o UB de cada iteração é o limite superior do intervalo de confiança de uma amostra nova. O mínimo
+#   desses limites é enviesado para baixo e não vale com a confiança dada, e por isso vale o UB da última iteração
+def criaParada(criterios, estatistico=False):
+    return {"criterios": criterios, "inicio": time.time(), "LBs": [], "melhorLB": -math.inf, "melhorUB": math.inf,
+        "estatistico": estatistico, "semilargura": None}
+
+# Atualiza os melhores limites da execução (com o UB estatístico, o da última iteração e a semilargura do seu intervalo)
+def registraLimites(parada, LB, UB, semilargura=None):
+    parada["melhorLB"] = max(parada["melhorLB"], LB)
+    if parada["estatistico"]:
+        parada["melhorUB"], parada["semilargura"] = UB, semilargura
+    else:
+        parada["melhorUB"] = min(parada["melhorUB"], UB)
+
+# Registra os limites de uma iteração e retorna o primeiro critério satisfeito, ou None. estavel indica se o LB desta
+# iteração conta para a estabilização (ex.: MIPs resolvidos sem gap, ponto de teste fora da região de confiança)
+def verificaParada(parada, iteracao, LB, UB, resolucoes, estavel=True, semilargura=None):
+    registraLimites(parada, LB, UB, semilargura)
+    if estavel:
+        parada["LBs"].append(LB)
+    LB, UB = parada["melhorLB"], parada["melhorUB"]
+    for criterio in parada["criterios"]:
+        tipo = criterio["tipo"]
+        if tipo == "gap":
+            gap = (UB - LB) / max(abs(LB), 1e-10) if criterio["relativo"] else UB - LB
+            if gap < criterio["tolerancia"]:
+                return criterio
+        elif tipo == "lb":
+            LBs = parada["LBs"]
+            if len(LBs) > criterio["janela"] and LBs[-1] - LBs[-1 - criterio["janela"]] < criterio["tolerancia"]:
+                return criterio
+        elif tipo == "tempo":
+            if time.time() - parada["inicio"] >= criterio["limite"]:
+                return criterio
+        elif tipo == "resolucoes":
+            if resolucoes >= criterio["limite"]:
+                return criterio
+        elif tipo == "iteracoes":
+            if iteracao >= criterio["limite"]:
+                return criterio
+    return None
+
+# Retorna a descrição de um critério para o relatório
+def descreveCriterio(criterio):
+    tipo = criterio["tipo"]
+    if tipo == "gap":
+        return f"gap {'relativo ' if criterio['relativo'] else ''}< {criterio['tolerancia']}"
+    if tipo == "lb":
+        return f"LB estável em {criterio['janela']} iterações (tolerância {criterio['tolerancia']})"
+    nomes = {"tempo": "limite de tempo ({}s)", "resolucoes": "limite de resoluções ({})", "iteracoes": "limite de iterações ({})"}
+    return nomes[tipo].format(criterio["limite"])
+
+# Escreve em arquivo (JSON) o motivo da parada, os melhores limites e a decisão do primeiro estágio. Com o UB estatístico,
+# escreve também a semilargura do seu intervalo de confiança
+# criterio: critério que parou a execução, ou None se ela parou pelo critério próprio do algoritmo (convergência)
+# decisao: dicionário com os valores das variáveis do primeiro estágio
+def escreveIncumbente(arquivo, parada, criterio, iteracao, resolucoes, decisao):
+    with open(arquivo, 'w') as f:
+        json.dump({"motivo": descreveCriterio(criterio) if criterio else "convergência",
+            "orcamento": criterio is not None and criterio["tipo"] in ORCAMENTOS, "LB": parada["melhorLB"],
+            "UB": parada["melhorUB"], "iteracoes": iteracao, "resolucoes": resolucoes,
+            "tempo": time.time() - parada["inicio"], "decisao": decisao,
+            **({"UB_estatistico": True, "semilargura": parada["semilargura"]} if parada["semilargura"] is not None else {})},
+            f, indent=1, ensure_ascii=False)
+
+# Converte a regra de parada da linha de comando ("gap=0.01,lb=3,tempo=60,resolucoes=5000,iteracoes=100") em critérios.
+# lb=k é a estabilização do LB em k iterações com a tolerância dada
+def leCriterios(texto, tolerancia=1e-5):
+    criterios = []
+    for item in texto.split(","):
+        tipo, valor = item.split("=")
+        tipo = tipo.strip()
+        if tipo == "gap":
+            criterios.append(criterioGap(float(valor)))
+        elif tipo == "lb":
+            criterios.append(criterioLB(int(valor), tolerancia))
+        elif tipo == "tempo":
+            criterios.append(criterioTempo(float(valor)))
+        elif tipo == "resolucoes":
+            criterios.append(criterioResolucoes(int(valor)))
+        elif tipo == "iteracoes":
+            criterios.append(criterioIteracoes(int(valor)))
+        else:
+            raise ValueError(f"critério de parada desconhecido: {tipo}")
+    return criterios
@@ -4,9 +4,28 @@
 # * todas as cargas em A podem ser canceladas ou adiadas com um estágio de antecedência. Se adiadas, chegam em um estágio.
 
 from pyomo.environ import *
-import sys
+import time, json, argparse
 
-def pde(file, K, pred):
+SOLVER = "cplex"        # como nos demais scripts; aceita solução inicial e limite de soluções
+
+# Opção de cada solver que para a resolução na primeira solução inteira encontrada, para medir o tempo até o primeiro
+# incumbente (None: o solver não tem essa opção)
+LIMITE_SOLUCOES = {"cplex": "mip_limits_solutions", "gurobi": "SolutionLimit", "highs": "mip_max_improving_sols",
+    "glpk": None}
+
+# Lê uma solução inicial escrita pelo sddp.py: uma política (--politica, com a decisão de cada nó da árvore) ou só a
+# decisão do primeiro estágio (--incumbente). Retorna (decisão do primeiro estágio, decisões dos nós ou None)
+def leInicio(arquivo):
+    with open(arquivo) as f:
+        dados = json.load(f)
+    return dados["decisao"], dados.get("nos")
+
+# Resolve o problema e imprime o resultado
+# inicio: arquivo da solução inicial (ver leInicio). As frações do SDDP são arredondadas para binário
+# fixa: se True, fixa as variáveis do primeiro estágio nos valores da solução inicial
+# compara: se True, resolve também sem a solução inicial e compara os tempos até o primeiro incumbente e até o ótimo
+# solver: nome do solver (ver LIMITE_SOLUCOES)
+def pde(file, K, pred, inicio=None, fixa=False, compara=False, solver=SOLVER):
     # Estágio de cada cenário
     stages = [1]
     for k in range(1, K):
@@ -92,10 +111,62 @@ def pde(file, K, pred):
     model.cancelamentoAdiamento = Constraint(model.A2, rule=cancelamentoAdiamento)
 
     # Resolve o modelo e imprime o resultado
-    opt = SolverFactory("glpk")
+    opt = SolverFactory(solver)
     instance = model.create_instance(file)
     instance.pprint()
-    opt.solve(instance)
+    if inicio is None:
+        opt.solve(instance)
+    else:
+        decisao, nos = leInicio(inicio)
+        warmstart = opt.warm_start_capable()
+        if not warmstart:
+            if not fixa:
+                raise ValueError(f"o solver {solver} não aceita solução inicial (use --fixa ou outro solver)")
+            print(f"O solver {solver} não aceita solução inicial: só a fixação do primeiro estágio é aplicada")
+
+        # Limpa os valores das variáveis e, se comInicio == True, carrega a solução inicial. Em nós sem decisão (política
+        # só do primeiro estágio), as variáveis ficam sem valor e o solver completa a solução
+        def preparaInicio(comInicio):
+            for var in instance.component_data_objects(Var):
+                var.unfix()
+                var.set_value(None, skip_validation=True)
+            if not comInicio:
+                return
+            for c in instance.A2:
+                instance.x[c].set_value(round(decisao["x"][str(c)]))
+                instance.z[c].set_value(min(round(decisao["z2"][str(c)]), value(instance.x[c])))
+                if fixa:
+                    instance.x[c].fix()
+                    instance.z[c].fix()
+            for s in instance.S:
+                no = {"v": decisao["v"]} if s == 0 else (nos or {}).get(str(s))
+                if no is None:
+                    continue
+                for c in instance.P:
+                    instance.v[c, s].set_value(round(no["v"].get(str(c), 0)))
+                    if fixa and s == 0:
+                        instance.v[c, s].fix()
+
+        # Resolve com as opções dadas e retorna o tempo de resolução. Cada resolução usa um solver novo, para que as
+        # opções e a solução de uma não passem para a seguinte
+        def resolve(opcoes, comInicio):
+            preparaInicio(comInicio)
+            opt = SolverFactory(solver)
+            tempo = time.time()
+            if comInicio and warmstart:
+                opt.solve(instance, options=opcoes, warmstart=True)
+            else:
+                opt.solve(instance, options=opcoes)
+            return time.time() - tempo
+
+        # Tempo até o primeiro incumbente (se o solver permitir) e até o ótimo, com e sem a solução inicial
+        limite = LIMITE_SOLUCOES.get(solver)
+        for comInicio in ([False, True] if compara else [True]):
+            primeiro = resolve({limite: 1}, comInicio) if limite else None
+            otimo = resolve({}, comInicio)
+            print(f"{'Com' if comInicio else 'Sem'} solução inicial{' (primeiro estágio fixo)' if comInicio and fixa else ''}: "
+                f"primeiro incumbente = {'-' if primeiro is None else f'{primeiro:.3f}s'}, ótimo = {otimo:.3f}s, "
+                f"z* = {value(instance.OBJ)}")
     instance.display()
 
     print(f"\n\n***SOLUÇÃO ÓTIMA ENCONTRADA***\n\nz* = {value(instance.OBJ)}")
@@ -110,11 +181,25 @@ def pde(file, K, pred):
         if stages[s] == 1:
             print(f"z = {[value(instance.z[c]) for c in instance.A2]}")
 
+# Modo de execução:
+# python pde-mip.py <arquivo> <K> <pred...> [--inicio arquivo] [--fixa] [--compara] [--solver nome]
+# arquivo: nome do arquivo de entrada
+# K: número de cenários; pred: predecessor de cada cenário (-1 para a raiz)
+# --inicio: solução inicial escrita pelo sddp.py (--politica ou --incumbente)
+# --fixa: fixa o primeiro estágio na solução inicial
+# --compara: mede também o tempo sem a solução inicial
 if __name__ == "__main__":
-    K = int(sys.argv[2])
-    pred = []
-    for k in range(K):
-        pred.append(int(sys.argv[k + 3]))
-    print(K)
-    print(pred)
-    pde(sys.argv[1], K, pred)
+    parser = argparse.ArgumentParser(description="PDE binário do Lot Sizing Estocástico")
+    parser.add_argument("arquivo", help="nome do arquivo de entrada")
+    parser.add_argument("K", type=int, help="número de cenários")
+    parser.add_argument("pred", type=int, nargs='+', help="predecessor de cada cenário")
+    parser.add_argument("--inicio", metavar="ARQUIVO", help="solução inicial do sddp.py (--politica ou --incumbente)")
+    parser.add_argument("--fixa", action="store_true", help="fixa o primeiro estágio na solução inicial")
+    parser.add_argument("--compara", action="store_true", help="mede também o tempo sem a solução inicial")
+    parser.add_argument("--solver", default=SOLVER, help="solver MIP")
+    args = parser.parse_args()
+    if args.inicio and not args.fixa and not SolverFactory(args.solver).warm_start_capable():
+        parser.error(f"o solver {args.solver} não aceita solução inicial: use --fixa ou outro solver")
+    print(args.K)
+    print(args.pred)
+    pde(args.arquivo, args.K, args.pred, args.inicio, args.fixa, args.compara, args.solver)
@@ -3,6 +3,7 @@
 from pyomo.environ import *
 import sys
 
+# Resolve o problema e retorna o valor ótimo
 def pde(file, K, pred):
     # Estágio de cada cenário
     stages = [1]
@@ -72,6 +73,7 @@ def pde(file, K, pred):
         print(f"\nCenário {s}:\ns = {value(instance.s[s])}")
         print(f"u = {value(instance.u[s])}")
         print(f"v = {[value(instance.v[c, s]) for c in instance.P]}")
+    return value(instance.OBJ)
 
 if __name__ == "__main__":
     K = int(sys.argv[2])
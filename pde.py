@@ -8,6 +8,7 @@ import sys, time, os
 
 TIME_LIMIT = 3600                               # limite de tempo em segundos
 
+# Resolve o problema e retorna um dicionário com o valor ótimo e os tempos de execução
 def pde(file, H, g):
     K = int((g**H - 1) / (g - 1))               # número de cenários
     pred = [-1]                                 # predecessor de cada cenário
@@ -101,7 +102,7 @@ def pde(file, H, g):
     build_time = time.time()
     if build_time - start_time > TIME_LIMIT:
         print("Time limit alcançado antes de começar a resolver!")
-        return
+        return None
     #instance.pprint()
     print("Resolvendo...")
     opt.options['timelimit'] = TIME_LIMIT
@@ -119,6 +120,8 @@ def pde(file, H, g):
     f.write(f"x = {[value(instance.x[c]) for c in instance.A2]}\n")
     f.write(f"z = {[value(instance.z[c]) for c in instance.A2]}\n")
     f.close()
+    return {"z": value(instance.OBJ), "tempo": solution_time - start_time, "construcao": build_time - start_time,
+        "solucao": solution_time - build_time}
 
 # Modo de execução:
 # python pde.py <arquivo> <H> <g>
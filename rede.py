@@ -0,0 +1,70 @@
+# Protocolo entre o coordenador e os trabalhadores do SDDP distribuído (sddp.py), sobre TCP. Cada mensagem é um cabeçalho
+# (tipo, tamanho do conteúdo) seguido do conteúdo binário. Cortes e pontos de teste vão como vetores float64 little-endian
+# em sequência, sem serialização genérica (pickle ou JSON), de forma que o custo de codificação é o de copiar os arrays.
+#
+# Mensagens:
+# INICIO (trabalhador -> coordenador): número de colunas dos cortes de cada estágio, para conferir a instância
+# TAREFA (coordenador -> trabalhador): estágio t, identificador, cortes do estágio t+1 que o trabalhador ainda não tem
+#   (linhas [e, E]) e o ponto de teste do estágio t
+# CORTE (trabalhador -> coordenador): identificador da tarefa, tempo de resolução e o corte agregado [e, E] do estágio t
+# FIM (coordenador -> trabalhador): encerra o trabalhador
+
+import struct
+import numpy as np
+
+INICIO, TAREFA, CORTE, FIM = range(4)       # tipos de mensagem
+CABECALHO = struct.Struct("!BI")            # tipo, tamanho do conteúdo em bytes
+CABECALHO_TAREFA = struct.Struct("!III")    # estágio, identificador, número de cortes
+CABECALHO_CORTE = struct.Struct("!Id")      # identificador, tempo de resolução (s)
+REAL = np.dtype("<f8")
+INTEIRO = np.dtype("<u4")
+
+# Envia uma mensagem e retorna o número de bytes enviados
+def envia(sock, tipo, conteudo=b""):
+    mensagem = CABECALHO.pack(tipo, len(conteudo)) + conteudo
+    sock.sendall(mensagem)
+    return len(mensagem)
+
+# Recebe exatamente n bytes
+def recebeBytes(sock, n):
+    dados = bytearray(n)
+    visao = memoryview(dados)
+    lidos = 0
+    while lidos < n:
+        k = sock.recv_into(visao[lidos:])
+        if k == 0:
+            raise ConnectionError("conexão encerrada no meio de uma mensagem")
+        lidos += k
+    return bytes(dados)
+
+# Recebe uma mensagem e retorna (tipo, conteúdo)
+def recebe(sock):
+    tipo, tamanho = CABECALHO.unpack(recebeBytes(sock, CABECALHO.size))
+    return tipo, recebeBytes(sock, tamanho)
+
+def codificaInicio(dimensoes):
+    return np.asarray(dimensoes, dtype=INTEIRO).tobytes()
+
+def decodificaInicio(conteudo):
+    return np.frombuffer(conteudo, dtype=INTEIRO).tolist()
+
+# cortes: array (n, 1 + colunas do estágio t+1) com as linhas [e, E]; ponto: solução do estágio t
+def codificaTarefa(t, identificador, cortes, ponto):
+    return CABECALHO_TAREFA.pack(t, identificador, len(cortes)) + np.ascontiguousarray(cortes, dtype=REAL).tobytes() +\
+        np.ascontiguousarray(ponto, dtype=REAL).tobytes()
+
+# dimensoes: número de colunas dos cortes de cada estágio. Retorna (t, identificador, cortes, ponto)
+def decodificaTarefa(conteudo, dimensoes):
+    t, identificador, n = CABECALHO_TAREFA.unpack_from(conteudo)
+    colunas = 1 + dimensoes[t+1]
+    valores = np.frombuffer(conteudo, dtype=REAL, offset=CABECALHO_TAREFA.size)
+    return t, identificador, valores[:n*colunas].reshape(n, colunas), valores[n*colunas:]
+
+def codificaCorte(identificador, tempo, e, E):
+    return CABECALHO_CORTE.pack(identificador, tempo) + np.concatenate([[e], E]).astype(REAL).tobytes()
+
+# Retorna (identificador, tempo, e, E)
+def decodificaCorte(conteudo):
+    identificador, tempo = CABECALHO_CORTE.unpack_from(conteudo)
+    valores = np.frombuffer(conteudo, dtype=REAL, offset=CABECALHO_CORTE.size)
+    return identificador, tempo, float(valores[0]), valores[1:]
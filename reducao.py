@@ -0,0 +1,152 @@
+# Redução da árvore de cenários de uma instância antes de resolvê-la. Como os cenários de cada estágio são independentes
+# dos anteriores, a árvore g-ária é reduzida estágio a estágio: a distribuição da demanda de cada estágio (g cenários com
+# demandas d e probabilidades p) é aproximada por k dos seus cenários, escolhidos por seleção forward rápida (Heitsch e
+# Römisch), e a probabilidade de cada cenário removido vai para o cenário mantido mais próximo. A instância reduzida
+# continua sendo uma árvore completa, agora k-ária, e é escrita nos formatos do SDD(i)P e do PDE. O erro da redução em
+# cada estágio é a distância de Kantorovich entre as distribuições original e reduzida da demanda.
+
+import os, re, time, argparse
+import numpy as np
+from gera import escreveInstancia
+
+# Retorna os valores de um bloco de texto de um arquivo .dat: sets como listas de inteiros, params indexados como
+# dicionários e params escalares como números
+def leBloco(texto, dados):
+    for comando in texto.split(';'):
+        tokens = comando.split()
+        if len(tokens) < 3 or tokens[2] != ":=":
+            continue
+        tipo, nome, valores = tokens[0], tokens[1], tokens[3:]
+        if tipo == "set":
+            dados[nome] = [int(v) for v in valores]
+        elif len(valores) == 1:
+            dados[nome] = float(valores[0])
+        else:
+            dados[nome] = {int(i): float(v) for i, v in zip(valores[::2], valores[1::2])}
+    return dados
+
+# Lê uma instância no formato do SDDP. Retorna um dicionário com os dados globais e, em "estagios", os dados de cada
+# estágio (namespace)
+def leInstancia(arquivo):
+    with open(arquivo) as f:
+        texto = f.read()
+    if "set P1" in texto:
+        raise ValueError("a redução só trata o formato do SDDP (sem os tipos de carga do SDDiP)")
+    inicio = texto.index("namespace")
+    inst = leBloco(texto[:inicio], {})
+    inst["estagios"] = [leBloco(bloco, {}) for bloco in re.findall(r"namespace t\d+\s*\{(.*?)\}", texto[inicio:], re.S)]
+    return inst
+
+# Seleção forward rápida de k dos cenários de demandas d e probabilidades p: a cada passo, adiciona o cenário que mais
+# reduz a distância de Kantorovich entre a distribuição original e a dos selecionados. Retorna os índices selecionados (em
+# ordem crescente), suas probabilidades com as dos cenários removidos redistribuídas e a distância final
+def selecaoForward(d, p, k):
+    distancia = np.abs(d[:, None] - d[None, :])
+    minimo = np.full(len(d), np.inf)            # distância de cada cenário ao mais próximo dos selecionados
+    selecionados = []
+    for i in range(k):
+        candidatos = [j for j in range(len(d)) if j not in selecionados]
+        custos = [np.dot(p, np.minimum(minimo, distancia[:, j])) for j in candidatos]
+        j = candidatos[int(np.argmin(custos))]
+        selecionados.append(j)
+        minimo = np.minimum(minimo, distancia[:, j])
+    selecionados.sort()
+    destino = np.argmin(distancia[:, selecionados], axis=1)     # cenário mantido que recebe cada cenário
+    return selecionados, np.bincount(destino, weights=p, minlength=k), float(np.dot(p, minimo))
+
+# Reduz cada estágio da instância a k cenários e retorna (d, p, erros): arrays (H, k) com as demandas e probabilidades
+# reduzidas e a distância de Kantorovich de cada estágio
+def reduzEstagios(inst, k):
+    estagios = inst["estagios"]
+    H = len(estagios)
+    d, p, erros = np.zeros((H, k)), np.zeros((H, k)), [0.0]
+    d[0, 0], p[0, 0] = estagios[0]["d"][1], 1
+    for t in range(1, H):
+        dt = np.array([estagios[t]["d"][s] for s in estagios[t]["S"]])
+        pt = np.array([estagios[t]["p"][s] for s in estagios[t]["S"]])
+        selecionados, p[t], erro = selecaoForward(dt, pt, k)
+        d[t] = dt[selecionados]
+        erros.append(erro)
+    return d, p, erros
+
+# Retorna o erro relativo de cada estágio: a distância de Kantorovich dividida pela demanda esperada do estágio
+def errosRelativos(inst, erros):
+    return [erros[t] / max(sum(e["p"][s] * e["d"][s] for s in e["S"]), 1e-10) for t, e in enumerate(inst["estagios"])]
+
+# Reduz a instância arquivo (formato do SDDP) e escreve os arquivos reduzidos, com sufixo -r<k>, nos formatos do SDDP e
+# do PDE. Se k não for dado, usa o menor k cujo erro relativo em todos os estágios é no máximo tolerancia. k é pelo menos
+# 2, pois o PDE assume uma árvore com grau maior que 1. Retorna um dicionário com k, os erros por estágio (absolutos e
+# relativos) e os arquivos escritos
+def reduz(arquivo, k=None, tolerancia=None, diretorio=None):
+    inst = leInstancia(arquivo)
+    estagios = inst["estagios"]
+    H, g = len(estagios), len(estagios[1]["S"])
+    if k is None:
+        for k in range(2, g + 1):
+            d, p, erros = reduzEstagios(inst, k)
+            if max(errosRelativos(inst, erros)) <= tolerancia:
+                break
+    else:
+        d, p, erros = reduzEstagios(inst, max(2, min(k, g)))
+    k = len(d[0])
+
+    A1, A2, P = estagios[0]["AAnt"], estagios[0]["A"], estagios[0]["P"]
+    C = inst["C"]
+    diretorio = os.path.dirname(arquivo) if diretorio is None else diretorio
+    nome = os.path.basename(arquivo)[:-4]
+    arqSddp = os.path.join(diretorio, f"{nome}-r{k}.dat")
+    arqPde = os.path.join(diretorio, f"pde-{nome[5:]}-r{k}.dat" if nome.startswith("sddp-") else f"{nome}-r{k}-pde.dat")
+    escreveInstancia(arqSddp, arqPde, H, k, len(A1) + len(A2), len(P), A1, A2, *[[inst[param][c] for c in C]
+        for param in ["q", "ca", "cc", "cp"]], d, p, inst["sMin"], inst["sMax"], estagios[0]["s0"], estagios[0]["h"])
+    return {"H": H, "g": g, "k": k, "erros": erros, "relativos": errosRelativos(inst, erros), "sddp": arqSddp,
+        "pde": arqPde}
+
+# Resolve a instância original e a reduzida com o algoritmo dado ("pde": equivalente determinístico; "sddp": SDDP sem
+# amostragem) e retorna os valores ótimos e os tempos de cada uma
+def comparaTempos(algoritmo, original, reduzida, H, g, k):
+    valores, tempos = [], []
+    for arquivo, grau in [(original, g), (reduzida, k)]:
+        inicio = time.time()
+        if algoritmo == "pde":
+            from pde import pde
+            valores.append(pde(arquivo, H, grau)["z"])
+        else:
+            from sddp import sddp
+            valores.append(sddp(arquivo, H, 0)["LB"])
+        tempos.append(time.time() - inicio)
+    return valores, tempos
+
+# Modo de execução:
+# python reducao.py <arquivo> (<k> | --tolerancia e) [--diretorio dir] [--compara pde|sddp]
+# arquivo: instância no formato do SDDP (o arquivo do PDE correspondente é pde-... no mesmo diretório)
+# k: número de cenários por estágio da instância reduzida
+# --tolerancia: escolhe o menor k com erro relativo (distância de Kantorovich / demanda esperada) até e em cada estágio
+# --compara: resolve a instância original e a reduzida e mostra os valores ótimos e o ganho de tempo
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Redução da árvore de cenários por seleção forward rápida")
+    parser.add_argument("arquivo", help="instância no formato do SDDP")
+    parser.add_argument("k", type=int, nargs='?', help="número de cenários por estágio da instância reduzida")
+    parser.add_argument("--tolerancia", type=float, help="erro relativo máximo de cada estágio (escolhe o menor k)")
+    parser.add_argument("--diretorio", help="diretório dos arquivos reduzidos (padrão: o da instância)")
+    parser.add_argument("--compara", choices=["pde", "sddp"], help="resolve as duas instâncias e compara os tempos")
+    args = parser.parse_args()
+    if (args.k is None) == (args.tolerancia is None):
+        parser.error("informe k ou --tolerancia")
+
+    res = reduz(args.arquivo, args.k, args.tolerancia, args.diretorio)
+    print(f"Cenários por estágio: {res['g']} -> {res['k']} ({res['g']**(res['H'] - 1)} -> {res['k']**(res['H'] - 1)} caminhos)")
+    for t in range(1, res["H"]):
+        print(f"Estágio {t}: distância de Kantorovich = {res['erros'][t]:.4f} ({res['relativos'][t]*100:.2f}%)")
+    print(f"Soma das distâncias: {sum(res['erros']):.4f}\nArquivos: {res['sddp']}, {res['pde']}")
+    if args.compara:
+        original = args.arquivo
+        if args.compara == "pde":
+            diretorio, nome = os.path.split(args.arquivo)
+            original = os.path.join(diretorio, "pde-" + nome[5:])
+            reduzida = res["pde"]
+        else:
+            reduzida = res["sddp"]
+        valores, tempos = comparaTempos(args.compara, original, reduzida, res["H"], res["g"], res["k"])
+        print(f"\nz* original = {valores[0]} ({tempos[0]:.2f}s)\nz* reduzido = {valores[1]} ({tempos[1]:.2f}s)")
+        print(f"Diferença: {valores[1] - valores[0]} ({(valores[1] - valores[0])*100 / valores[0]:.2f}%)")
+        print(f"Ganho de tempo: {tempos[0] / max(tempos[1], 1e-9):.2f}x")
@@ -1,221 +1,472 @@
 # Implementa o algoritmo SDDiP para um problema de Lot Sizing
-# Versão com conjuntos P1 e P2 (e variáveis v1 e v2) e cortes L-shaped inteiros e de Benders fortalecidos (errados)
+# Versão com conjuntos P1 e P2 (e variáveis v1 e v2) e cortes de Benders, L-shaped inteiros, de Benders fortalecidos e
+# Lagrangeanos
 
 from pyomo.environ import *
 from pyomo.opt import TerminationCondition
-import sys
-from random import random
+import sys, os, time, math, json, argparse, logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from random import random, seed
+from amostragem import criaControle, atualizaControle, formataControle
+from parada import criaParada, verificaParada, registraLimites, descreveCriterio, escreveIncumbente, leCriterios,\
+    criterioIteracoes, criterioTempo, criterioLB
+from cortes import criaPool, adicionaCorte, insereCortes, termos, coeficientes
 
 EPSILON = 1e-5          # tolerância para os testes de otimalidade
+INTEIRO = 1e-6          # tolerância de integralidade das soluções das relaxações lineares
 ZALPHA2 = 2.326         # valor de z alpha/2 para 98% de confiança
 L = 0                   # limite inferior para a função recurso
 C = 1000                # penalidade das variáveis artificiais phi
+SOLVER = "glpk"         # solver dos subproblemas
+RAIO = 10               # raio da caixa dos multiplicadores Lagrangeanos, relativo a 1 + maior inclinação de Benders do cenário
+NIVEL = 0.3             # fração do gap do método de nível que define o nível de cada iteração
+JANELA_ADAPTATIVO = 3   # iterações de estabilização do LB para parar com o controle adaptativo de M
 
-def sddip(file, H, M):
-    # Retorna o modelo para o estágio t
-    # Se LR == True, retorna a relaxação linear do modelo
-    # Se LRz == True, retorna a relaxação linear do modelo com restrições z == v
-    # Se LagrSub == True, retorna o subproblema que define a relaxação Lagrangeana do problema com restrições z == v dualizadas
-    def criaModelo(t, LR=False, LRz=False, LagrSub=False):
-        model = AbstractModel(f"estagio{t}")
-
-        # Conjuntos
-        model.P1 = Set()                                # cargas que levam um estágio para chegar
-        model.P2 = Set()                                # cargas que levam dois estágios para chegar
-        model.P = Set(initialize=model.P1 | model.P2)
-        model.S = Set()                                 # cenários deste estágio
-
-        # Parâmetros
-        model.p = Param(model.S)                    # probabilidade de cada cenário deste estágio
-        model.d = Param(model.S)                    # demanda de cada cenário deste estágio
-        model.f = Param(model.P)                    # custo unitário de cada carga
-        model.q = Param(model.P)                    # volume de cada carga
-        model.a = Param()                           # volume adquirido anteriormente que chega neste estágio
-        model.h = Param()                           # custo unitário de estoque
-        model.sMin = Param()                        # estoque mínimo
-        model.sMax = Param()                        # estoque máximo
-
-        # Variáveis
-        model.s = Var(domain=NonNegativeReals)      # estoque ao final deste estágio
+# Cronogramas padrão dos parâmetros dos MIPs do passo forward. Cada etapa é (início, gap relativo do MIP, limite de tempo
+# (s), limite de nós), com None para sem limite. No cronograma por gap vale a primeira etapa cujo início é menor ou igual
+# ao gap relativo atual entre LB e UB; no cronograma por iteração, a última etapa cujo início é menor ou igual à iteração
+CRONOGRAMA_GAP = [(0.5, 0.05, 10, 1000), (0.05, 0.01, 30, 10000), (0, 0, None, None)]
+CRONOGRAMA_ITERACAO = [(1, 0.05, 10, 1000), (5, 0.01, 30, 10000), (10, 0, None, None)]
+
+# Nomes das opções de gap relativo, limite de tempo e limite de nós dos MIPs em cada solver (None: opção não suportada)
+OPCOES_MIP = {"glpk": ("mipgap", "tmlim", None), "cplex": ("mipgap", "timelimit", "mip_limits_nodes"),
+    "gurobi": ("MIPGap", "TimeLimit", "NodeLimit")}
+
+log = logging.getLogger("sddip")
+
+# Estado de cada processo que resolve duais Lagrangeanos: modelos dos subproblemas, pools de cortes locais e solver
+trabalhador = {}
+
+# Retorna o modelo para o estágio t de uma instância com H estágios lida de file
+# Se LR == True, retorna a relaxação linear do modelo
+# Se LagrSub == True, retorna o subproblema que define a relaxação Lagrangeana do problema, com cópias z do estado do estágio
+# anterior e restrições z == (sAnt, v1Ant, v2Ant) dualizadas
+def criaModelo(file, H, t, LR=False, LagrSub=False, resolucao=None, bitsAnt=None):
+    model = AbstractModel(f"estagio{t}")
+
+    # Conjuntos
+    model.P1 = Set()                                # cargas que levam um estágio para chegar
+    model.P2 = Set()                                # cargas que levam dois estágios para chegar
+    model.P = Set(initialize=model.P1 | model.P2)
+    model.S = Set()                                 # cenários deste estágio
+
+    # Parâmetros
+    model.p = Param(model.S)                    # probabilidade de cada cenário deste estágio
+    model.d = Param(model.S)                    # demanda de cada cenário deste estágio
+    model.f = Param(model.P)                    # custo unitário de cada carga
+    model.q = Param(model.P)                    # volume de cada carga
+    model.a = Param()                           # volume adquirido anteriormente que chega neste estágio
+    model.h = Param()                           # custo unitário de estoque
+    model.sMin = Param()                        # estoque mínimo
+    model.sMax = Param()                        # estoque máximo
+
+    # Variáveis
+    model.s = Var(domain=NonNegativeReals)      # estoque ao final deste estágio
+    if t > 0:
+        model.u = Var(domain=NonNegativeReals)  # volume adquirido que chega neste estágio
+        # Variáveis artificiais para garantir recurso completo
+        model.phi1 = Var(domain=NonNegativeReals)
+        model.phi2 = Var(domain=NonNegativeReals)
+    if t < H - 1:       # até o penúltimo estágio
         if t > 0:
-            model.u = Var(domain=NonNegativeReals)  # volume adquirido que chega neste estágio
-            # Variáveis artificiais para garantir recurso completo
-            model.phi1 = Var(domain=NonNegativeReals)
-            model.phi2 = Var(domain=NonNegativeReals)
-        if t < H - 1:       # até o penúltimo estágio
-            if t > 0:
-                if LR or LRz:
-                    model.v1 = Var(model.P, domain=NonNegativeReals)
-                else:
-                    model.v1 = Var(model.P, domain=Binary)      # se a carga c foi adquirida e chega no próximo estágio
+            if LR:
+                model.v1 = Var(model.P, domain=NonNegativeReals)
             else:
-                if LR or LRz:
-                    model.v1 = Var(model.P1, domain=NonNegativeReals)
-                else:
-                    model.v1 = Var(model.P1, domain=Binary)     # se a carga c foi adquirida e chega no próximo estágio
-            if t < H - 2:   # até o antepenúltimo estágio
-                if LR or LRz:
-                    model.v2 = Var(model.P2, domain=NonNegativeReals)
-                else:
-                    model.v2 = Var(model.P2, domain=Binary)     # se a carga c foi adquirida e chega daqui a dois estágios
-            model.theta = Var(bounds=(L, None))
-        if (t > 0) and (LRz or LagrSub):
-            if t > 1:
-                model.zv1 = Var(model.P, domain=NonNegativeReals, bounds=(0, 1))
+                model.v1 = Var(model.P, domain=Binary)      # se a carga c foi adquirida e chega no próximo estágio
+        else:
+            if LR:
+                model.v1 = Var(model.P1, domain=NonNegativeReals)
             else:
-                model.zv1 = Var(model.P1, domain=NonNegativeReals, bounds=(0, 1))
-            if t < H - 1:
-                model.zv2 = Var(model.P2, domain=NonNegativeReals, bounds=(0, 1))
+                model.v1 = Var(model.P1, domain=Binary)     # se a carga c foi adquirida e chega no próximo estágio
+        if t < H - 2:   # até o antepenúltimo estágio
+            if LR:
+                model.v2 = Var(model.P2, domain=NonNegativeReals)
+            else:
+                model.v2 = Var(model.P2, domain=Binary)     # se a carga c foi adquirida e chega daqui a dois estágios
+        model.theta = Var(bounds=(L, None))
+    if resolucao and (t < H - 1):
+        # Expansão binária do estoque: s = resolucao * soma de 2^k bs[k]
+        model.K = Set(initialize=lambda model: range(bitsEstoque(model.sMax, resolucao)))
+        if LR:
+            model.bs = Var(model.K, domain=NonNegativeReals)
+        else:
+            model.bs = Var(model.K, domain=Binary)
+    if (t > 0) and LagrSub:
+        # Cópias do estado do estágio anterior (os limites de zs são os do estoque do estágio anterior)
+        model.zs = Var(domain=NonNegativeReals)
+        if bitsAnt:         # cópias dos bits do estoque do estágio anterior
+            model.Kant = RangeSet(0, bitsAnt - 1)
+            model.zbs = Var(model.Kant, domain=Binary)
+        if t > 1:
+            model.zv1 = Var(model.P, domain=Binary)
+        else:
+            model.zv1 = Var(model.P1, domain=Binary)
+        if t < H - 1:
+            model.zv2 = Var(model.P2, domain=Binary)
 
-        # Expressões (termos que variam a cada iteração)
-        if t > 0:
-            model.sAnt = Expression()               # estoque do estágio anterior
+    # Expressões (termos que variam a cada iteração)
+    if t > 0:
+        model.sAnt = Expression()               # estoque do estágio anterior
+        if t > 1:
+            model.v1Ant = Expression(model.P)   # valores de v1 do estágio anterior
+        else:       # segundo estágio
+            model.v1Ant = Expression(model.P1)
+        if t < H - 1:
+            model.v2Ant = Expression(model.P2)  # valores de v2 do estágio anterior
+        model.dk = Expression()                 # demanda do cenário considerado
+        if LagrSub:
+            # pi: vetor argumento da função Lagrangeana
+            if bitsAnt:
+                model.pibs = Expression(model.Kant)
+            else:
+                model.pis = Expression()
             if t > 1:
-                model.v1Ant = Expression(model.P)   # valores de v1 do estágio anterior
-            else:       # segundo estágio
-                model.v1Ant = Expression(model.P1)
+                model.piv1 = Expression(model.P)
+            else:
+                model.piv1 = Expression(model.P1)
             if t < H - 1:
-                model.v2Ant = Expression(model.P2)  # valores de v2 do estágio anterior
-            model.dk = Expression()                 # demanda do cenário considerado
-            if LagrSub:
-                # pi: vetor argumento da função Lagrangeana
-                if t > 1:
-                    model.piv1 = Expression(model.P)
-                else:
-                    model.piv1 = Expression(model.P1)
-                if t < H - 1:
-                    model.piv2 = Expression(model.P2)
+                model.piv2 = Expression(model.P2)
 
-        # Função objetivo
-        if LagrSub:
-            if t == 0:              # primeiro estágio
-                def objetivo(model):
-                    return sum(model.f[c]*model.q[c]*model.v1[c] for c in model.P1) +\
-                        sum(model.f[c]*model.q[c]*model.v2[c] for c in model.P2) + model.h*model.s + model.theta
-            elif t == 1:            # segundo estágio
-                if H == 3:          # t também é o penúltimo
-                    def objetivo(model):
-                        return sum(model.f[c]*model.q[c]*model.v1[c] for c in model.P1) + model.h*model.s +\
-                            C*model.phi1 + C*model.phi2 + model.theta -\
-                            sum(model.piv1[c]*model.zv1[c] for c in model.P1) - sum(model.piv2[c]*model.zv2[c] for c in model.P2)
-                else:
-                    def objetivo(model):
-                        return sum(model.f[c]*model.q[c]*model.v1[c] for c in model.P1) +\
-                            sum(model.f[c]*model.q[c]*model.v2[c] for c in model.P2) + model.h*model.s +\
-                            C*model.phi1 + C*model.phi2 + model.theta -\
-                            sum(model.piv1[c]*model.zv1[c] for c in model.P1) - sum(model.piv2[c]*model.zv2[c] for c in model.P2)
-            elif t < H - 2:         # caso geral
-                def objetivo(model):
-                    return sum(model.f[c]*model.q[c]*model.v1[c] for c in model.P1) +\
-                        sum(model.f[c]*model.q[c]*model.v2[c] for c in model.P2) + model.h*model.s +\
-                        C*model.phi1 + C*model.phi2 + model.theta - sum(model.piv1[c]*model.zv1[c] for c in model.P) -\
-                        sum(model.piv2[c]*model.zv2[c] for c in model.P2)
-            elif t == H - 2:        # penúltimo estágio
-                def objetivo(model):
-                    return sum(model.f[c]*model.q[c]*model.v1[c] for c in model.P1) + model.h*model.s +\
-                        C*model.phi1 + C*model.phi2 + model.theta - sum(model.piv1[c]*model.zv1[c] for c in model.P) -\
-                        sum(model.piv2[c]*model.zv2[c] for c in model.P2)
-            else:                   # último estágio
-                def objetivo(model):
-                    return model.h*model.s + C*model.phi1 + C*model.phi2 - sum(model.piv1[c]*model.zv1[c] for c in model.P)
-        else:
-            if t == 0:              # primeiro estágio
-                def objetivo(model):
-                    return sum(model.f[c]*model.q[c]*model.v1[c] for c in model.P1) +\
-                        sum(model.f[c]*model.q[c]*model.v2[c] for c in model.P2) + model.h*model.s + model.theta
-            elif t < H - 2:         # caso geral
-                def objetivo(model):
-                    return sum(model.f[c]*model.q[c]*model.v1[c] for c in model.P1) +\
-                        sum(model.f[c]*model.q[c]*model.v2[c] for c in model.P2) + model.h*model.s +\
-                        C*model.phi1 + C*model.phi2 + model.theta
-            elif t == H - 2:        # penúltimo estágio
-                def objetivo(model):
-                    return sum(model.f[c]*model.q[c]*model.v1[c] for c in model.P1) + model.h*model.s +\
-                        C*model.phi1 + C*model.phi2 + model.theta
-            else:                   # último estágio
-                def objetivo(model):
-                    return model.h*model.s + C*model.phi1 + C*model.phi2
-        model.OBJ = Objective(rule=objetivo)
-
-        # Restrições
-        if t > 0:               # caso geral
-            def balanco(model):
-                return model.a + model.sAnt + model.u + model.phi1 == model.dk + model.s + model.phi2
-        else:                   # primeiro estágio
-            def balanco(model):
-                return model.a == model.d[model.S.at(1)] + model.s
-        model.balanco = Constraint(rule=balanco)
-        
-        model.limiteSMin = Constraint(expr=model.s >= model.sMin)
-        model.limiteSMax = Constraint(expr=model.s <= model.sMax)
+    # Função objetivo
+    if t == 0:              # primeiro estágio
+        def objetivo(model):
+            return sum(model.f[c]*model.q[c]*model.v1[c] for c in model.P1) +\
+                sum(model.f[c]*model.q[c]*model.v2[c] for c in model.P2) + model.h*model.s + model.theta
+    elif t < H - 2:         # caso geral
+        def objetivo(model):
+            return sum(model.f[c]*model.q[c]*model.v1[c] for c in model.P1) +\
+                sum(model.f[c]*model.q[c]*model.v2[c] for c in model.P2) + model.h*model.s +\
+                C*model.phi1 + C*model.phi2 + model.theta
+    elif t == H - 2:        # penúltimo estágio
+        def objetivo(model):
+            return sum(model.f[c]*model.q[c]*model.v1[c] for c in model.P1) + model.h*model.s +\
+                C*model.phi1 + C*model.phi2 + model.theta
+    else:                   # último estágio
+        def objetivo(model):
+            return model.h*model.s + C*model.phi1 + C*model.phi2
+    if LagrSub:             # dualiza as restrições de cópia z == x do estado do estágio anterior
+        objetivoOriginal = objetivo
+        def objetivo(model):
+            if bitsAnt:
+                termoEstoque = sum(model.pibs[k]*model.zbs[k] for k in model.Kant)
+            else:
+                termoEstoque = model.pis*model.zs
+            return objetivoOriginal(model) - termoEstoque - sum(model.piv1[c]*model.zv1[c] for c in model.zv1) -\
+                sum(model.piv2[c]*model.zv2[c] for c in (model.P2 if t < H - 1 else []))
+    model.OBJ = Objective(rule=objetivo)
 
-        if t > 0:
-            if t > 1:
-                if LRz or LagrSub:
-                    def chegada(model):
-                        return model.u == sum(model.q[c]*model.zv1[c] for c in model.P)
-                else:
-                    def chegada(model):
-                        return model.u == sum(model.q[c]*model.v1Ant[c] for c in model.P)
-            else:               # segundo estágio
-                if LRz or LagrSub:
-                    def chegada(model):
-                        return model.u == sum(model.q[c]*model.zv1[c] for c in model.P1)
-                else:
-                    def chegada(model):
-                        return model.u == sum(model.q[c]*model.v1Ant[c] for c in model.P1)
-            model.chegada = Constraint(rule=chegada)
+    # Restrições
+    if t > 0 and LagrSub:
+        def balanco(model):
+            return model.a + model.zs + model.u + model.phi1 == model.dk + model.s + model.phi2
+    elif t > 0:             # caso geral
+        def balanco(model):
+            return model.a + model.sAnt + model.u + model.phi1 == model.dk + model.s + model.phi2
+    else:                   # primeiro estágio
+        def balanco(model):
+            return model.a == model.d[model.S.at(1)] + model.s
+    model.balanco = Constraint(rule=balanco)
+    
+    model.limiteSMin = Constraint(expr=model.s >= model.sMin)
+    model.limiteSMax = Constraint(expr=model.s <= model.sMax)
 
-            if t < H - 1:
-                if LRz or LagrSub:
-                    def carga2Estagios(model, c):
-                        return model.v1[c] == model.zv2[c]
-                else:
-                    def carga2Estagios(model, c):
-                        return model.v1[c] == model.v2Ant[c]
-                model.carga2Estagios = Constraint(model.P2, rule=carga2Estagios)
-            
-            if (LRz or LagrSub) and (t > 0):
-                def restricaoZv1(model, c):
-                    return model.zv1[c] == model.v1Ant[c]
-                if t > 1:
-                    model.restricaoZv1 = Constraint(model.P, rule=restricaoZv1)
-                else:
-                    model.restricaoZv1 = Constraint(model.P1, rule=restricaoZv1)
-                if t < H - 1:
-                    def restricaoZv2(model, c):
-                        return model.zv2[c] == model.v2Ant[c]
-                    model.restricaoZv2 = Constraint(model.P2, rule=restricaoZv2)
-        
-        if (LR or LRz) and (t < H - 1):         # até o penúltimo estágio
-            def limiteV1(model, c):
-                return model.v1[c] <= 1
-            if t > 0:
-                model.limiteV1 = Constraint(model.P, rule=limiteV1)
+    if resolucao and (t < H - 1):
+        def expansao(model):
+            return model.s == resolucao*sum(2**k*model.bs[k] for k in model.K)
+        model.expansao = Constraint(rule=expansao)
+        if LR:
+            def limiteBs(model, k):
+                return model.bs[k] <= 1
+            model.limiteBs = Constraint(model.K, rule=limiteBs)
+    if (t > 0) and LagrSub and bitsAnt:
+        def copiaEstoque(model):
+            return model.zs == resolucao*sum(2**k*model.zbs[k] for k in model.Kant)
+        model.copiaEstoque = Constraint(rule=copiaEstoque)
+
+    if t > 0:
+        if t > 1:
+            if LagrSub:
+                def chegada(model):
+                    return model.u == sum(model.q[c]*model.zv1[c] for c in model.P)
             else:
-                model.limiteV1 = Constraint(model.P1, rule=limiteV1)
-            if t < H - 2:                       # até o antepenúltimo estágio
-                def limiteV2(model, c):
-                    return model.v2[c] <= 1
-                model.limiteV2 = Constraint(model.P2, rule=limiteV2)
+                def chegada(model):
+                    return model.u == sum(model.q[c]*model.v1Ant[c] for c in model.P)
+        else:               # segundo estágio
+            if LagrSub:
+                def chegada(model):
+                    return model.u == sum(model.q[c]*model.zv1[c] for c in model.P1)
+            else:
+                def chegada(model):
+                    return model.u == sum(model.q[c]*model.v1Ant[c] for c in model.P1)
+        model.chegada = Constraint(rule=chegada)
 
         if t < H - 1:
-            model.cortesOtimalidade = ConstraintList()      # lista de cortes de otimalidade adicionados ao longo do algoritmo
-        if (t == H - 1) or (t > 0 and (LR or LRz)):
-            model.dual = Suffix(direction=Suffix.IMPORT)
+            if LagrSub:
+                def carga2Estagios(model, c):
+                    return model.v1[c] == model.zv2[c]
+            else:
+                def carga2Estagios(model, c):
+                    return model.v1[c] == model.v2Ant[c]
+            model.carga2Estagios = Constraint(model.P2, rule=carga2Estagios)
+    
+    if LR and (t < H - 1):         # até o penúltimo estágio
+        def limiteV1(model, c):
+            return model.v1[c] <= 1
+        if t > 0:
+            model.limiteV1 = Constraint(model.P, rule=limiteV1)
+        else:
+            model.limiteV1 = Constraint(model.P1, rule=limiteV1)
+        if t < H - 2:                       # até o antepenúltimo estágio
+            def limiteV2(model, c):
+                return model.v2[c] <= 1
+            model.limiteV2 = Constraint(model.P2, rule=limiteV2)
+
+    if t < H - 1:
+        model.cortesOtimalidade = ConstraintList()      # lista de cortes de otimalidade adicionados ao longo do algoritmo
+    if not LagrSub and ((t == H - 1) or (t > 0 and LR)):
+        model.dual = Suffix(direction=Suffix.IMPORT)
 
-        return model.create_instance(file, namespace=f"t{t}")
+    return model.create_instance(file, namespace=f"t{t}")
+
+# Variáveis de estado de um modelo do estágio t na ordem das colunas dos cortes: s (ou seus bits, com a expansão binária
+# do estoque), v1 e v2
+def variaveisCorte(model, t, H):
+    variaveis = [model.bs[k] for k in model.K] if hasattr(model, "bs") else [model.s]
+    variaveis += [model.v1[c] for c in (model.P if t > 0 else model.P1)]
+    if t < H - 2:
+        variaveis += [model.v2[c] for c in model.P2]
+    return variaveis
+
+# Retorna o número de bits da expansão binária de um estoque de até sMax com a resolução dada
+def bitsEstoque(sMax, resolucao):
+    return max(1, math.ceil(math.log2(value(sMax) / resolucao + 1)))
+
+# Retorna os bits (do menos significativo ao mais) do estoque s na expansão binária com K bits e a resolução dada
+def bitsValor(s, resolucao, K):
+    n = int(round(s / resolucao))
+    return [(n >> k) & 1 for k in range(K)]
+
+# Retorna a codificação compacta (bytes) de um estado binário, usada como chave de cache e para eliminar estados repetidos
+def codificaEstado(x):
+    return np.packbits(np.rint(x).astype(np.uint8)).tobytes()
+
+# Retorna as opções do solver para os MIPs de uma etapa do cronograma
+def opcoesMIP(etapa):
+    opcoes = {}
+    for nome, valor in zip(OPCOES_MIP.get(SOLVER, (None, None, None)), etapa[1:]):
+        if nome is not None and valor is not None:
+            opcoes[nome] = int(math.ceil(valor)) if nome == "tmlim" else valor     # o glpk só aceita segundos inteiros
+    return opcoes
+
+# Retorna um limite inferior válido para o valor ótimo de um MIP com solução de valor valor, resolvido com gap relativo
+# gap: o limite dual informado pelo solver ou, se o solver só informar o valor da solução (como o glpk), esse valor
+# descontado do gap. Se o solver parou por limite de tempo ou de nós sem informar o limite dual, retorna -inf
+def limiteDual(results, valor, gap):
+    limite = results.problem.lower_bound
+    limite = float(limite) if limite is not None else valor
+    if -math.inf < limite < valor - EPSILON:       # limite dual de fato informado pelo solver (ex.: cplex, gurobi)
+        return limite
+    if results.solver.termination_condition == TerminationCondition.optimal:
+        return valor - gap*abs(valor)           # o solver só repete o valor da solução (ex.: glpk)
+    return -math.inf
+
+# Estima o tempo economizado no passo forward pelas iterações com MIPs inexatos, comparando o tempo de cada uma com o de
+# suas resoluções ao tempo médio por resolução das iterações exatas. Retorna None se não houve iterações dos dois tipos
+def economiaForward(forward):
+    exatas = [f for f in forward if f["etapa"] is None]
+    inexatas = [f for f in forward if f["etapa"] is not None]
+    if not exatas or not inexatas:
+        return None
+    tempoResolucao = sum(f["tempo"] for f in exatas) / sum(f["resolucoes"] for f in exatas)
+    return sum(f["resolucoes"]*tempoResolucao - f["tempo"] for f in inexatas)
+
+# Inicializa um processo que resolve duais Lagrangeanos da instância file com H estágios
+# resolucao, bits: resolução e número de bits da expansão binária do estoque de cada estágio (None: estoque contínuo)
+def iniciaTrabalhador(file, H, resolucao=None, bits=None):
+    trabalhador["H"] = H
+    trabalhador["resolucao"] = resolucao
+    trabalhador["opt"] = SolverFactory(SOLVER)
+    trabalhador["modelos"] = [None] + [criaModelo(file, H, t, LagrSub=True, resolucao=resolucao,
+        bitsAnt=bits[t-1] if bits else None) for t in range(1, H)]
+    trabalhador["pools"] = [None] + [criaPool(len(variaveisCorte(trabalhador["modelos"][t], t, H))) for t in range(1, H - 1)]
+
+# Prepara o subproblema Lagrangeano do cenário s do estágio t da tarefa: atualiza seus cortes com os do pool do estágio e
+# os limites da cópia do estoque. A tarefa só leva os cortes do estágio a partir da linha inicio, que todos os trabalhadores
+# já têm (ver cortesNovos em sddip). Retorna o modelo, as cópias z e os multiplicadores pi, na ordem das colunas do estado
+def preparaSubproblema(tarefa):
+    H, t = trabalhador["H"], tarefa["t"]
+    model = trabalhador["modelos"][t]
+    if t < H - 1:
+        pool = trabalhador["pools"][t]
+        inicio, E, e = tarefa["cortes"]
+        if pool["n"] < inicio:
+            raise RuntimeError(f"trabalhador sem os cortes {pool['n']} a {inicio - 1} do estágio {t}")
+        for i in range(pool["n"] - inicio, len(e)):
+            adicionaCorte(pool, E[i], e[i])
+        insereCortes(pool, [(model.cortesOtimalidade, model.theta, variaveisCorte(model, t, H))])
+    model.dk.set_value(model.d[tarefa["s"]])
+    model.zs.setlb(tarefa["limites"][0])
+    model.zs.setub(tarefa["limites"][1])
+    if hasattr(model, "zbs"):
+        z, pi = [model.zbs[k] for k in model.Kant], [model.pibs[k] for k in model.Kant]
+    else:
+        z, pi = [model.zs], [model.pis]
+    z += [model.zv1[c] for c in model.zv1] + ([model.zv2[c] for c in model.P2] if t < H - 1 else [])
+    pi += [model.piv1[c] for c in model.piv1] + ([model.piv2[c] for c in model.P2] if t < H - 1 else [])
+    return model, z, pi
+
+# Resolve o MIP do cenário s do estágio t da tarefa com o estado binário do estágio anterior fixo em v (as últimas cópias
+# do estado) e o estoque anterior, se contínuo, livre entre seus limites. Retorna o valor, limite inferior do MIP para
+# qualquer estoque anterior (ou, com a expansão binária do estoque, o valor exato no estado v), e o trabalhador (pid)
+def resolveMinimoEstoque(tarefa):
+    model, z, pi = preparaSubproblema(tarefa)
+    for expr in pi:
+        expr.set_value(0)
+    fixas = z[len(z) - len(tarefa["v"]):]
+    for copia, valor in zip(fixas, tarefa["v"]):
+        copia.fix(int(valor))
+    trabalhador["opt"].solve(model)
+    for copia in fixas:
+        copia.unfix()
+    return {"valor": value(model.OBJ), "trabalhador": os.getpid()}
+
+# Resolve o dual Lagrangeano do cenário s do estágio t da tarefa, com as cópias z do estado x do estágio anterior dualizadas,
+# pelo método de nível, partindo dos multiplicadores pi da tarefa e até atingir seus limites de iterações ou de tempo.
+# Retorna os melhores multiplicadores pi, o valor L(pi) do subproblema (corte theta >= L(pi) + pi·x), o par (L, pi) dos
+# multiplicadores iniciais (corte de Benders fortalecido), as estatísticas e o trabalhador (pid)
+def resolveLagrangeano(tarefa):
+    inicio = time.time()
+    opt, x = trabalhador["opt"], tarefa["x"]
+    model, z, pi = preparaSubproblema(tarefa)
+
+    # Avalia a função Lagrangeana nos multiplicadores p: retorna L(p), L(p) + p·x e o supergradiente x - z(p)
+    def avalia(p):
+        for expr, valor in zip(pi, p):
+            expr.set_value(float(valor))
+        opt.solve(model)
+        Lp = value(model.OBJ)
+        return Lp, Lp + np.dot(p, x), x - np.array([value(v) for v in z])
+
+    # Problema mestre do método de nível: planos cortantes da função Lagrangeana, numa caixa em torno do ponto inicial. Sem a
+    # expansão binária do estoque, a caixa tem um só raio, dado pela maior inclinação de Benders. Com a expansão, o
+    # multiplicador do bit k parte de beta*r*2^k (beta: dual do balanço do cenário, que vale para o estoque agregado) e sua
+    # caixa tem raio proporcional a r*2^k, assim como a distância ao centro na projeção: um raio único, dado pelo bit mais
+    # significativo, deixaria os bits menores livres para inclinações muito maiores que as do estoque, e os cortes
+    # resultantes seriam exatos no ponto de teste mas fracos no resto do domínio
+    p = np.array(tarefa["pi"], dtype=float)
+    escala = np.ones(len(p))
+    if hasattr(model, "zbs"):
+        bits = len(model.Kant)
+        escala[:bits] = [trabalhador["resolucao"] * 2**k for k in model.Kant]
+        beta = np.dot(p[:bits], escala[:bits]) / np.dot(escala[:bits], escala[:bits])
+        p[:bits] = beta * escala[:bits]
+        raio = RAIO * escala * (1 + abs(beta))
+        if bits < len(p):
+            raio[bits:] = RAIO * (1 + np.abs(p[bits:]).max())
+    else:
+        raio = np.full(len(p), RAIO * (1 + np.abs(p).max()))
+    mestre = ConcreteModel()
+    mestre.I = RangeSet(0, len(p) - 1)
+    mestre.p = Var(mestre.I, bounds=lambda mestre, i: (p[i] - raio[i], p[i] + raio[i]))
+    mestre.eta = Var()
+    mestre.r = Var(domain=NonNegativeReals)
+    mestre.centro = Param(mestre.I, mutable=True, initialize=0)
+    mestre.planos = ConstraintList()
+    mestre.acimaCentro = Constraint(mestre.I,
+        rule=lambda mestre, i: mestre.p[i] - mestre.centro[i] <= float(escala[i])*mestre.r)
+    mestre.abaixoCentro = Constraint(mestre.I,
+        rule=lambda mestre, i: mestre.centro[i] - mestre.p[i] <= float(escala[i])*mestre.r)
+    mestre.maximo = Objective(expr=mestre.eta, sense=maximize)
+    mestre.projecao = Objective(expr=mestre.r)
+
+    melhor = None
+    gap = float("inf")
+    iteracoes = 0
+    while True:
+        Lp, valor, g = avalia(p)
+        iteracoes += 1
+        if melhor is None:
+            inicial = (Lp, p)       # corte de Benders fortalecido
+        if melhor is None or valor > melhor[1]:
+            melhor = (Lp, valor, p)
+        if iteracoes >= tarefa["iteracoes"] or time.time() - inicio >= tarefa["tempo"]:
+            break
+        mestre.planos.add(mestre.eta <= valor + sum(g[i]*(mestre.p[i] - p[i]) for i in mestre.I))
+
+        # Limite superior do dual: máximo do modelo de planos cortantes
+        mestre.eta.setlb(None)
+        mestre.maximo.activate()
+        mestre.projecao.deactivate()
+        opt.solve(mestre)
+        gap = value(mestre.eta) - melhor[1]
+        if gap <= tarefa["tolerancia"] * max(1, abs(melhor[1])):
+            break
+
+        # Próximo ponto: projeção (norma do máximo) dos melhores multiplicadores no conjunto de nível
+        for i in mestre.I:
+            mestre.centro[i] = melhor[2][i]
+        mestre.eta.setlb(value(mestre.eta) - NIVEL*gap)
+        mestre.maximo.deactivate()
+        mestre.projecao.activate()
+        opt.solve(mestre)
+        p = np.array([value(mestre.p[i]) for i in mestre.I])
+    return {"L": melhor[0], "pi": melhor[2], "inicial": inicial, "iteracoes": iteracoes, "gap": gap,
+        "tempo": time.time() - inicio,
+        "trabalhador": os.getpid()}
+
+# Retorna a decisão atual do primeiro estágio (estoque e frações das cargas de cada tipo)
+def decisaoPrimeiroEstagio(model):
+    return {"s": value(model.s), "v1": {c: value(model.v1[c]) for c in model.P1},
+        "v2": {c: value(model.v2[c]) for c in model.P2}}
+
+# Executa o SDDiP e retorna um dicionário com os limites, o tempo e as estatísticas da execução
+# semente: semente do gerador de números aleatórios usado na amostragem
+# tipoCorte: "benders", "lshaped" (Benders e L-shaped inteiro), "fortalecido" (Benders fortalecido) ou "lagrangeano"
+# processos: número de processos que resolvem os duais Lagrangeanos (1: no próprio processo)
+# iteracoesCorte, tempoCorte: limites de iterações e de tempo (s) do método de nível para cada corte Lagrangeano
+# parada: critério de parada: "lb" (estabilização do LB), "gap" (LB == UB) ou "ambos" (o primeiro dos dois)
+# limiteIteracoes, limiteTempo: limites de iterações e de tempo (s) da execução (None: sem limite)
+# criterios: critérios de parada adicionais (ver parada.py), verificados a cada iteração junto com os anteriores. O LB só
+#   conta para a estabilização quando os MIPs foram resolvidos sem gap
+# incumbente: arquivo (JSON) em que são escritos o motivo da parada, os melhores limites e a decisão do primeiro estágio
+# cronograma: (tipo, etapas) com os parâmetros dos MIPs do passo forward por "gap" ou por "iteracao" (ver CRONOGRAMA_GAP);
+#   None resolve todos os MIPs sem gap
+# relaxacaoPrimeiro: se True, no passo forward resolve a relaxação linear de cada estágio antes do MIP e a aceita se for
+#   inteira
+# resolucao: se informada, o estoque é expandido em bits (s = resolucao * soma de 2^k bs[k]) e o estado fica todo binário,
+#   o que torna exatos os cortes Lagrangeanos e L-shaped inteiros. O estoque passa a ser múltiplo de resolucao
+# adaptativo: parâmetros do controle adaptativo de M (ver criaControle: minimo, maximo e orcamento de resoluções), ou None
+#   para M fixo. Com o controle, uma nova amostra de M caminhos é gerada a cada iteração (M é o tamanho da primeira) e o
+#   UB passa a ser o estatístico; o M e a semilargura do intervalo de confiança de cada iteração vão para o log. A
+#   estabilização do LB de parada exige então JANELA_ADAPTATIVO iterações
+# reaproveitaCache: se True, os valores do cache dos cortes L-shaped inteiros calculados com menos cortes no estágio
+#   seguinte são reaproveitados, pois continuam limites inferiores válidos, e só recalculados na iteração seguinte a uma
+#   estabilização do LB com valores reaproveitados; se False, são sempre recalculados (corte mais justo)
+def sddip(file, H, M, semente=None, tipoCorte="benders", processos=1, iteracoesCorte=20, tempoCorte=10, parada="ambos",
+        limiteIteracoes=None, limiteTempo=None, cronograma=None, relaxacaoPrimeiro=False, resolucao=None, adaptativo=None,
+        criterios=None, incumbente=None, reaproveitaCache=False):
+    inicio = time.time()
+    regraParada = criaParada((criterios or []) + ([criterioIteracoes(limiteIteracoes)] if limiteIteracoes is not None else [])
+        + ([criterioTempo(limiteTempo)] if limiteTempo is not None else []), estatistico=bool(adaptativo))
+    seed(semente)
 
     # Cria os modelos
-    opt = SolverFactory("glpk")
-    models = [criaModelo(t) for t in range(H)]
-    modelsLR = [criaModelo(t, LR=True) for t in range(H - 1)]
-    #modelsLRz = [criaModelo(t, LRz=True) for t in range(H)]
-    #modelsLagr = [criaModelo(t, LagrSub=True) for t in range(H)]
+    opt = SolverFactory(SOLVER)
+    models = [criaModelo(file, H, t, resolucao=resolucao) for t in range(H)]
+    modelsLR = [criaModelo(file, H, t, LR=True, resolucao=resolucao) for t in range(H - 1)]
+    bits = [len(models[t].K) for t in range(H - 1)] if resolucao else None
+    executor = None
+    if tipoCorte != "benders":
+        if processos > 1:
+            executor = ProcessPoolExecutor(processos, initializer=iniciaTrabalhador, initargs=(file, H, resolucao, bits))
+        else:
+            iniciaTrabalhador(file, H, resolucao, bits)
+    construcao = time.time() - inicio       # tempo de construção dos modelos
 
     # Retorna uma lista de M cenários amostrados aleatoriamente
-    def geraAmostra():
-        if M < 30:      # menos de 30 cenários: retorna todos os cenários possíveis (sem amostragem)
+    def geraAmostra(M):
+        if M < 30 and controle is None:     # menos de 30 cenários: retorna todos os cenários possíveis (sem amostragem)
             def geraPerm(t):
                 if t == 0:
                     return [[s for s in models[0].S]]
@@ -231,18 +482,18 @@ def sddip(file, H, M):
             amostra = []
             m = 0
             while m < M:
-                print("Começando novo a")
+                log.debug("Começando nova amostra")
                 a = []
                 for t in range(H):
                     r = random()
                     p = 0
-                    print(f"Sorteou {r}")
+                    log.debug("Sorteou %s", r)
                     for s in models[t].S:
                         p += models[t].p[s]
                         if p >= r:
                             a.append(s)
                             break
-                    print(f"a = {a}")
+                    log.debug("a = %s", a)
                     
                 # Verifica se essa amostra já não foi gerada (para não repetir)
                 existe = False
@@ -253,48 +504,77 @@ def sddip(file, H, M):
                             existe = False
                             break
                     if existe:
-                        print("Já existe...")
+                        log.debug("Já existe...")
                         break
                 if not existe:
                     amostra.append(a)
                     m += 1
-                    print(f"Adicionou. amostra = {amostra}")
+                    log.debug("Adicionou. amostra = %s", amostra)
             return amostra
 
-    amostra = geraAmostra()     # para amostragem por iteração, passar isso para dentro do loop
+    # Controle adaptativo de M, limitado ao número de caminhos da árvore de cenários (a amostra não repete caminhos)
+    controle = None
+    if adaptativo:
+        caminhos = math.prod(len(models[t].S) for t in range(H))
+        controle = criaControle(M, adaptativo.get("minimo", 1), min(adaptativo.get("maximo", math.inf), caminhos),
+            adaptativo.get("orcamento"))
+        M = controle["M"]
+
+    amostra = geraAmostra(M)    # com o controle adaptativo, uma nova amostra é gerada a cada iteração
     M = len(amostra)
     
-    # Soluções atuais de cada cenário amostrado
-    sAtual = [[-1 for t in range(H)] for m in range(M)]
-    v1Atual = [[{} for t in range(H)] for m in range(M)]
-    v2Atual = [[{} for t in range(H)] for m in range(M)]
+    # Retorna as soluções atuais (s, v1, v2) e as soluções duais do último estágio de M amostras
+    def criaSolucoes(M):
+        return ([[-1 for t in range(H)] for m in range(M)], [[{} for t in range(H)] for m in range(M)],
+            [[{} for t in range(H)] for m in range(M)], [{} for m in range(M)])
+    sAtual, v1Atual, v2Atual, piAtual = criaSolucoes(M)
+
+    # Cortes gerados ao longo do algoritmo, para cada subproblema. Um mesmo pool alimenta o MIP e a relaxação linear.
+    pools = [criaPool(len(variaveisCorte(models[t], t, H))) if t < H - 1 else criaPool(0) for t in range(H)]
+    destinos = [[(model.cortesOtimalidade, model.theta, variaveisCorte(model, t, H)) for model in [models[t], modelsLR[t]]]
+        if t < H - 1 else [] for t in range(H)]
+    resolucoes = 0          # número de subproblemas resolvidos
+    iteracoesLagrangeano = 0    # número de iterações do método de nível (subproblemas Lagrangeanos resolvidos)
+    tempoLagrangeano = 0        # tempo gasto gerando cortes Lagrangeanos
 
-    # Soluções duais atuais do último estágio de cada amostra
-    piAtual = [{} for m in range(M)]
+    # Número de cortes do pool de cada estágio que cada trabalhador (pid) já recebeu
+    sincronizados = [{} for t in range(H)]
 
-    # Termos independentes dos cortes gerados ao longo do algoritmo, para cada subproblema
-    eLists = [[] for t in range(H)]
+    # Retorna os cortes do pool do estágio t levados pelas tarefas de um despacho: (inicio, E, e) com as linhas a partir da
+    # primeira que algum trabalhador ainda não tem (todas, enquanto algum trabalhador ainda não respondeu), em vez do
+    # pool inteiro em cada tarefa
+    def cortesNovos(t):
+        vistos = sincronizados[t]
+        inicio = min(vistos.values()) if len(vistos) >= (processos if executor else 1) else 0
+        return (inicio, coeficientes(pools[t])[inicio:].copy(), termos(pools[t])[inicio:].copy())
+
+    # Valores dos MIPs dos cenários filhos já resolvidos para os cortes L-shaped inteiros, por (estágio, estado binário
+    # empacotado, cenário), com o tamanho do pool de cortes do estágio filho quando foram calculados
+    cacheMIP = {}
+    acertosCache = acertosAntigos = falhasCache = 0     # acertos com os cortes atuais e com menos cortes do estágio t+1
+
+    # MIPs do passo forward resolvidos e evitados por relaxações lineares com solução inteira
+    mipsForward = mipsEvitados = 0
+    estadosRepetidos = 0    # amostras sem cortes próprios por repetirem o estado binário de outra no passo backward
+    warmstart = relaxacaoPrimeiro and opt.warm_start_capable()
     
     # Resolve o problema para o cenário s do estágio t, usando a solução atual do estágio t-1 da amostra m.
     # Se s == None, é considerado o cenário do estágio t de m
     # Se LR == True, resolve a relaxação linear do problema
-    # Se LRz == True, resolve a relaxação linear do problema com restrições z == v
-    # Se LagrSub == True, resolve o subproblema que define a relaxação Lagrangeana do problema com restrições z == v dualizadas.
-    #   Neste caso, a função também recebe valor pi = (piv1, piv2), argumento da função Lagrangeana
-    def resolveCenario(t, m, s=None, LR=False, LRz=False, LagrSub=False, pi=None):
+    # opcoes: opções do solver para esta resolução
+    # inicial: se True, passa ao solver os valores atuais das variáveis como solução inicial
+    def resolveCenario(t, m, s=None, LR=False, opcoes=None, inicial=False):
+        nonlocal resolucoes
+        resolucoes += 1
         if s == None:
             s = amostra[m][t]
         
-        #if LRz:
-        #    model = modelsLRz[t]
-        #elif LagrSub:
-        #    model = modelsLagr[t]
         if LR and t < H - 1:
             model = modelsLR[t]
         else:
             model = models[t]
 
-        print(f"\nResolvendo problema ({t}, {s})")
+        log.debug("Resolvendo problema (%d, %s)", t, s)
         if t > 0:
             # Atualiza as expressões dos estágios anteriores
             model.sAnt.set_value(sAtual[m][t-1])
@@ -308,24 +588,9 @@ def sddip(file, H, M):
                 for c in model.P2:
                     model.v2Ant[c].set_value(v2Atual[m][t-1][c])
             model.dk.set_value(model.d[s])
-            if LagrSub:
-                if t > 1:
-                    for c in model.P:
-                        model.piv1[c].set_value(pi[0][c])
-                else:
-                    for c in model.P1:
-                        model.piv1[c].set_value(pi[0][c])
-                if t < H - 1:
-                    for c in model.P2:
-                        model.piv2[c].set_value(pi[1][c])
-        #if t == 1:
-        #    model.pprint()
-        #    input("Uai")
-        return opt.solve(model)
-        #if t == 1:
-        #    model.display()
-        #    input("Uai")
-        #return res
+        if inicial and warmstart:
+            return opt.solve(model, options=opcoes or {}, warmstart=True)
+        return opt.solve(model, options=opcoes or {})
     
     # Verifica se existe algum item na amostra anterior a m que é coincide com o item m até o estágio t
     # Se sim, retorna seu índice.
@@ -365,13 +630,13 @@ def sddip(file, H, M):
             model = modelsLR[t]
         else:
             model = models[t]
-        duais = {"cortesOtimalidade": [], "carga2Estagios": {}, "limiteV1": {}, "limiteV2": {}}
+        duais = {"cortesOtimalidade": [], "carga2Estagios": {}, "limiteV1": {}, "limiteV2": {}, "limiteBs": {}}
         for c in model.component_objects(Constraint, active=True):
             name = c.getname()
             if name == "cortesOtimalidade":
                 for index in c:
                     duais[name].append(model.dual[c[index]])
-            elif name in ["carga2Estagios", "limiteV1", "limiteV2"]:
+            elif name in ["carga2Estagios", "limiteV1", "limiteV2", "limiteBs"]:
                 for index in c:
                     duais[name][index] = model.dual[c[index]]
             else:
@@ -379,18 +644,11 @@ def sddip(file, H, M):
                     duais[name] = model.dual[c[index]]
         return duais
     
-    '''# Retorna o vetor dual do problema Lagrangeano associado às restrições z == s e z == v do estágio t
-    def obtemDuaisLRz(t):
-        duais = [{}, {}]         # (piv1, piv2)
-        for c in modelsLRz[t].component_objects(Constraint, active=True):
-            if c.getname() == "restricaoZv1":
-                for index in c:
-                    duais[0][index] = modelsLRz[t].dual[c[index]]
-            elif c.getname() == "restricaoZv2":
-                for index in c:
-                    duais[1][index] = modelsLRz[t].dual[c[index]]
-        return duais'''
-    
+    # Retorna o estado atual da amostra m no estágio t, na ordem das colunas dos cortes
+    def estado(m, t):
+        s = bitsValor(sAtual[m][t], resolucao, bits[t]) if resolucao else [sAtual[m][t]]
+        return np.array(s + list(v1Atual[m][t].values()) + list(v2Atual[m][t].values()), dtype=float)
+
     # Copia a solução do estágio t da amostra m1 para o correspondente da amostra m2
     def copiaSolucao(t, m1, m2):
         sAtual[m2][t] = sAtual[m1][t]
@@ -399,283 +657,286 @@ def sddip(file, H, M):
             if t < H - 2:   # até o antepenúltimo estágio
                 v2Atual[m2][t] = {c: v2Atual[m1][t][c] for c in v2Atual[m1][t]}
 
+    # Registra no log (nível DEBUG) a solução atual do estágio t
     def imprimeSolucao(t):
-        print(f"Solução do estágio {t}: z* = {value(models[t].OBJ)}, s = {value(models[t].s)}", end="")
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+        texto = f"Solução do estágio {t}: z* = {value(models[t].OBJ)}, s = {value(models[t].s)}"
         if t > 0:
-            print(f", u = {value(models[t].u)}, phi1 = {value(models[t].phi1)}, phi2 = {value(models[t].phi2)}", end="")
+            texto += f", u = {value(models[t].u)}, phi1 = {value(models[t].phi1)}, phi2 = {value(models[t].phi2)}"
         if t < H - 1:       # até o penúltimo estágio
-            print(f", theta = {value(models[t].theta)}")
+            texto += f", theta = {value(models[t].theta)}"
             if t > 0:
-                print(f"v1 = {[value(models[t].v1[c]) for c in models[t].P]}")
+                texto += f"\nv1 = {[value(models[t].v1[c]) for c in models[t].P]}"
             else:
-                print(f"v1 = {[value(models[t].v1[c]) for c in models[t].P1]}")
+                texto += f"\nv1 = {[value(models[t].v1[c]) for c in models[t].P1]}"
             if t < H - 2:   # até o antepenúltimo estágio
-                print(f"v2 = {[value(models[t].v2[c]) for c in models[t].P2]}")
-        else:
-            print()
+                texto += f"\nv2 = {[value(models[t].v2[c]) for c in models[t].P2]}"
+        log.debug(texto)
     
+    # Retorna o corte de Benders (e, E) do cenário s do estágio t+1, considerando a solução atual da amostra m para o estágio t.
+    # E tem os coeficientes das variáveis de estado do estágio t, na ordem das colunas do pool
+    def corteCenario(m, t, s):
+        if t == H - 2 and s == amostra[m][t+1]:     # este cenário já foi resolvido na fase forward
+            duais = piAtual[m]
+        else:
+            resolveCenario(t + 1, m, s, LR=True)
+            duais = obtemDuais(t + 1)
+        log.debug("duais = %s", duais)
+
+        sigma_e = np.dot(duais["cortesOtimalidade"], termos(pools[t+1])[:len(duais["cortesOtimalidade"])])
+        e = duais["balanco"]*(models[t+1].d[s] - models[t+1].a) + duais["limiteSMin"]*models[t+1].sMin +\
+            duais["limiteSMax"]*models[t+1].sMax + sum(duais["limiteV1"][d] for d in duais["limiteV1"]) +\
+            sum(duais["limiteV2"][d] for d in duais["limiteV2"]) + sum(duais["limiteBs"].values()) + sigma_e
+        if resolucao:       # s = resolucao * soma de 2^k bs[k]
+            E = [duais["balanco"]*resolucao*2**k for k in models[t].K]
+        else:
+            E = [duais["balanco"]]
+        E += [-models[t+1].q[c] * duais["chegada"] for c in (models[t].P if t > 0 else models[t].P1)]
+        if t < H - 2:
+            E += [-duais["carga2Estagios"][c] for c in models[t].P2]
+        return e, np.array(E)
+
     # Adiciona um corte de otimalidade de Benders agregado ao problema do estágio t, considerando a solução atual da amostra m
     # para este estágio
     def adicionaCorteBenders(m, t):
-        print(f"\nAdiciona corte de Benders para o estágio {t}, amostra {m} = {amostra[m]}")
+        log.debug("Adiciona corte de Benders para o estágio %d, amostra %d = %s", t, m, amostra[m])
         e = 0
-        Es = 0
-        if t > 0:
-            Ev1 = {c: 0 for c in models[t].P}
-        else:       # primeiro estágio
-            Ev1 = {c: 0 for c in models[t].P1}
-        if t < H - 2:
-            Ev2 = {c: 0 for c in models[t].P2}
+        E = np.zeros(pools[t]["E"].shape[1])
+        for s in models[t+1].S:
+            eS, ES = corteCenario(m, t, s)
+            e += models[t+1].p[s] * eS
+            E += models[t+1].p[s] * ES
+        adicionaCorte(pools[t], E, e)
+        log.debug("Corte de Benders para o estágio %d: theta >= %s - %s(s, v1, v2)", t, e, E)
+
+    # Adiciona ao pool do estágio t um corte Lagrangeano para cada amostra de ms, considerando sua solução atual para este
+    # estágio. Os duais Lagrangeanos de todos os cenários filhos são resolvidos de uma vez no pool de processos, cada um
+    # partindo das inclinações do corte de Benders do cenário e limitado a iteracoesCorte iterações e tempoCorte segundos.
+    # Com mais de uma iteração, o corte de Benders fortalecido (primeira avaliação) também é adicionado: o corte
+    # Lagrangeano é o mais justo no ponto de teste, mas pode ser bem mais fraco longe dele
+    def adicionaCortesLagrangeanos(ms, t):
+        nonlocal resolucoes, iteracoesLagrangeano, tempoLagrangeano
+        log.debug("Adiciona cortes %s para o estágio %d, amostras %s", tipoCorte, t, ms)
+        inicioLagrangeano = time.time()
+        cortesFilhos = cortesNovos(t + 1)
+        tarefas = []
+        for m in ms:
+            x = estado(m, t)
             for s in models[t+1].S:
-                resolveCenario(t + 1, m, s, LR=True)
-                #modelsLR[t+1].pprint()
-                #modelsLR[t+1].display()
-                duais = obtemDuais(t + 1)
-                print(f"duais = {duais}")
-
-                sigma_e = 0
-                for i in range(len(duais["cortesOtimalidade"])):
-                    #print(f"sigma_e += {duais['cortesOtimalidade'][i]} * {eLists[t+1][i]} = {duais['cortesOtimalidade'][i] * eLists[t+1][i]}")
-                    sigma_e += duais["cortesOtimalidade"][i] * eLists[t+1][i]
-                #print(f"sigma_e = {sigma_e}")
-                e += models[t+1].p[s] * (duais["balanco"]*(models[t+1].d[s] - models[t+1].a) + duais["limiteSMin"]*models[t+1].sMin +
-                    duais["limiteSMax"]*models[t+1].sMax + sum(duais["limiteV1"][d] for d in duais["limiteV1"]) +
-                    sum(duais["limiteV2"][d] for d in duais["limiteV2"]) + sigma_e)
-                #print(f"e += {models[t+1].p[s]} * ({duais['balanco']}*({models[t+1].d[s]} - {models[t+1].a}) + {duais['limiteSMin']}*{models[t+1].sMin} + {duais['limiteSMax']}*{models[t+1].sMax} + {sum(duais["limiteV1"][d] for d in duais['limiteV1'])} + {sum(duais["limiteV2"][d] for d in duais['limiteV2'])} + {sigma_e}) = {models[t+1].p[s] * (duais['balanco']*(models[t+1].d[s] - models[t+1].a) + duais['limiteSMin']*models[t+1].sMin + duais['limiteSMax']*models[t+1].sMax + sum(duais["limiteV1"][d] for d in duais['limiteV1']) + sum(duais["limiteV2"][d] for d in duais['limiteV2']) + sigma_e)}")
-                Es += models[t+1].p[s] * duais["balanco"]
-                if t > 0:
-                    for c in models[t].P:
-                        Ev1[c] -= models[t+1].p[s] * models[t+1].q[c] * duais["chegada"]
-                else:
-                    for c in models[t].P1:
-                        Ev1[c] -= models[t+1].p[s] * models[t+1].q[c] * duais["chegada"]
-                for c in models[t].P2:
-                    #print(f"Ev2[{c}] -= {models[t+1].p[s]} * {duais['carga2Estagios'][c]} = {models[t+1].p[s] * duais['carga2Estagios'][c]}")
-                    Ev2[c] -= models[t+1].p[s] * duais["carga2Estagios"][c]
-                #print(f"Ev2 = {Ev2}")
-            if t > 0:
-                models[t].cortesOtimalidade.add(expr=Es*models[t].s + sum(Ev1[c]*models[t].v1[c] for c in models[t].P) +\
-                    sum(Ev2[c]*models[t].v2[c] for c in models[t].P2) + models[t].theta >= e)
-                modelsLR[t].cortesOtimalidade.add(expr=Es*modelsLR[t].s + sum(Ev1[c]*modelsLR[t].v1[c] for c in modelsLR[t].P) +\
-                    sum(Ev2[c]*modelsLR[t].v2[c] for c in modelsLR[t].P2) + modelsLR[t].theta >= e)
-                #modelsLRz[t].cortesOtimalidade.add(expr=Es*modelsLRz[t].s + sum(Ev1[c]*modelsLRz[t].v1[c] for c in modelsLRz[t].P) +\
-                #    sum(Ev2[c]*modelsLRz[t].v2[c] for c in modelsLRz[t].P2) + modelsLRz[t].theta >= e)
-                #modelsLagr[t].cortesOtimalidade.add(expr=Es*modelsLagr[t].s + sum(Ev1[c]*modelsLagr[t].v1[c] for c in modelsLagr[t].P) +\
-                #    sum(Ev2[c]*modelsLagr[t].v2[c] for c in modelsLagr[t].P2) + modelsLagr[t].theta >= e)
-            else:
-                models[t].cortesOtimalidade.add(expr=Es*models[t].s + sum(Ev1[c]*models[t].v1[c] for c in models[t].P1) +\
-                    sum(Ev2[c]*models[t].v2[c] for c in models[t].P2) + models[t].theta >= e)
-                modelsLR[t].cortesOtimalidade.add(expr=Es*modelsLR[t].s + sum(Ev1[c]*modelsLR[t].v1[c] for c in modelsLR[t].P1) +\
-                    sum(Ev2[c]*modelsLR[t].v2[c] for c in modelsLR[t].P2) + modelsLR[t].theta >= e)
-                #modelsLRz[t].cortesOtimalidade.add(expr=Es*modelsLRz[t].s + sum(Ev1[c]*modelsLRz[t].v1[c] for c in modelsLRz[t].P1) +\
-                #    sum(Ev2[c]*modelsLRz[t].v2[c] for c in modelsLRz[t].P2) + modelsLRz[t].theta >= e)
-                #modelsLagr[t].cortesOtimalidade.add(expr=Es*modelsLagr[t].s + sum(Ev1[c]*modelsLagr[t].v1[c] for c in modelsLagr[t].P1) +\
-                #    sum(Ev2[c]*modelsLagr[t].v2[c] for c in modelsLagr[t].P2) + modelsLagr[t].theta >= e)
-            print(f"Corte de Benders para o estágio {t}: theta >= {e} - {Es}s - (", end="")
-            for c in (models[t].P if t > 0 else models[t].P1):
-                print(f"{Ev1[c]}v1,{c} + ", end="")
-            print(") - (", end="")
-            for c in models[t].P2:
-                print(f"{Ev2[c]}v2,{c} + ", end="")
-            print(")")
-        else:
+                eS, ES = corteCenario(m, t, s)
+                tarefas.append({"t": t + 1, "s": s, "x": x, "pi": -ES, "limites": (value(models[t].sMin), value(models[t].sMax)),
+                    "cortes": cortesFilhos, "iteracoes": iteracoesCorte if tipoCorte == "lagrangeano" else 1,
+                    "tempo": tempoCorte, "tolerancia": EPSILON})
+        resultados = (executor.map if executor else map)(resolveLagrangeano, tarefas)
+        for m in ms:
+            e = e0 = 0
+            E = np.zeros(pools[t]["E"].shape[1])
+            E0 = np.zeros(pools[t]["E"].shape[1])
             for s in models[t+1].S:
-                if s == amostra[m][t+1]:     # este cenário já foi resolvido na fase forward
-                    duais = piAtual[m]
-                else:
-                    resolveCenario(t + 1, m, s, LR=True)
-                    #models[t+1].pprint()
-                    #models[t+1].display()
-                    duais = obtemDuais(t + 1)
-                print(f"duais = {duais}")
-                
-                e += models[t+1].p[s] * (duais["balanco"]*(models[t+1].d[s] - models[t+1].a) + duais["limiteSMin"]*models[t+1].sMin +
-                    duais["limiteSMax"]*models[t+1].sMax + sum(duais["limiteV1"][d] for d in duais["limiteV1"]))
-                Es += models[t+1].p[s] * duais["balanco"]
-                for c in models[t+1].P:
-                    Ev1[c] -= models[t+1].p[s] * models[t+1].q[c] * duais["chegada"]
-            models[t].cortesOtimalidade.add(expr=Es*models[t].s + sum(Ev1[c]*models[t].v1[c] for c in models[t].P) +
-                models[t].theta >= e)
-            modelsLR[t].cortesOtimalidade.add(expr=Es*modelsLR[t].s + sum(Ev1[c]*modelsLR[t].v1[c] for c in modelsLR[t].P) +
-                modelsLR[t].theta >= e)
-            #modelsLRz[t].cortesOtimalidade.add(expr=Es*modelsLRz[t].s + sum(Ev1[c]*modelsLRz[t].v1[c] for c in modelsLRz[t].P) +
-            #    modelsLRz[t].theta >= e)
-            #modelsLagr[t].cortesOtimalidade.add(expr=Es*modelsLagr[t].s + sum(Ev1[c]*modelsLagr[t].v1[c] for c in modelsLagr[t].P) +
-            #    modelsLagr[t].theta >= e)
-            print(f"Corte de Benders para o estágio {t}: theta >= {e} - {Es}s - (", end="")
-            for c in models[t].P:
-                print(f"{Ev1[c]}v1,{c} + ", end="")
-            print(")")
-        eLists[t].append(e)
-    
-    '''# Adiciona um corte de otimalidade L-shaped inteiro agregado ao problema do estágio t, considerando a solução atual da
-    # amostra m para este estágio
-    def adicionaCorteLShapedInteiro(m, t):
-        print(f"\nAdiciona corte L-shaped inteiro para o estágio {t}, amostra {m} = {amostra[m]}")
-        obj = 0
-        for s in models[t+1].S:
-            resolveCenario(t + 1, m, s)
-            #models[t+1].pprint()
-            #models[t+1].display()
-            obj += models[t+1].p[s]*value(models[t+1].OBJ)
-            print(f"obj = {obj}")
-        print(f"v1 = {v1Atual[m][t]}, v2 = {v2Atual[m][t]}")
-        if t > 0:
-            print(f"apendando no e: {(obj - L)*(sum(v1Atual[m][t][c] for c in models[t].P) + sum(v2Atual[m][t][c] for c in models[t].P2)) - obj}")
-            eLists[t].append((obj - L)*(sum(v1Atual[m][t][c] for c in models[t].P) + sum(v2Atual[m][t][c] for c in models[t].P2)) - obj)
-            models[t].cortesOtimalidade.add(expr=(obj - L)*
-                (sum((v1Atual[m][t][c] - 1)*models[t].v1[c] + (models[t].v1[c] - 1)*v1Atual[m][t][c] for c in models[t].P) +
-                 sum((v2Atual[m][t][c] - 1)*models[t].v2[c] + (models[t].v2[c] - 1)*v2Atual[m][t][c] for c in models[t].P2)) -
-                models[t].theta <= -obj)
-            modelsLR[t].cortesOtimalidade.add(expr=(obj - L)*
-                (sum((v1Atual[m][t][c] - 1)*modelsLR[t].v1[c] + (modelsLR[t].v1[c] - 1)*v1Atual[m][t][c] for c in modelsLR[t].P) +
-                 sum((v2Atual[m][t][c] - 1)*modelsLR[t].v2[c] + (modelsLR[t].v2[c] - 1)*v2Atual[m][t][c] for c in modelsLR[t].P2)) -
-                modelsLR[t].theta <= -obj)
-            #modelsLRz[t].cortesOtimalidade.add(expr=modelsLRz[t].theta >= (obj - L)*
-            #    (sum((v1Atual[m][t][c] - 1)*modelsLRz[t].v1[c] + (modelsLRz[t].v1[c] - 1)*v1Atual[m][t][c] for c in modelsLRz[t].P) +
-            #     sum((v2Atual[m][t][c] - 1)*modelsLRz[t].v2[c] + (modelsLRz[t].v2[c] - 1)*v2Atual[m][t][c] for c in modelsLRz[t].P2)) + obj)
-            #modelsLagr[t].cortesOtimalidade.add(expr=modelsLagr[t].theta >= (obj - L)*
-            #    (sum((v1Atual[m][t][c] - 1)*modelsLagr[t].v1[c] + (modelsLagr[t].v1[c] - 1)*v1Atual[m][t][c] for c in modelsLagr[t].P) +
-            #     sum((v2Atual[m][t][c] - 1)*modelsLagr[t].v2[c] + (modelsLagr[t].v2[c] - 1)*v2Atual[m][t][c] for c in modelsLagr[t].P2)) +
-            #    obj)
-        else:
-            print(f"apendando no e: {(obj - L)*(sum(v1Atual[m][t][c] for c in models[t].P1) + sum(v2Atual[m][t][c] for c in models[t].P2)) - obj}")
-            eLists[t].append((obj - L)*(sum(v1Atual[m][t][c] for c in models[t].P1) + sum(v2Atual[m][t][c] for c in models[t].P2)) - obj)
-            models[t].cortesOtimalidade.add(expr=(obj - L)*
-                (sum((v1Atual[m][t][c] - 1)*models[t].v1[c] + (models[t].v1[c] - 1)*v1Atual[m][t][c] for c in models[t].P1) +
-                 sum((v2Atual[m][t][c] - 1)*models[t].v2[c] + (models[t].v2[c] - 1)*v2Atual[m][t][c] for c in models[t].P2)) -
-                models[t].theta <= -obj)
-            modelsLR[t].cortesOtimalidade.add(expr=(obj - L)*
-                (sum((v1Atual[m][t][c] - 1)*modelsLR[t].v1[c] + (modelsLR[t].v1[c] - 1)*v1Atual[m][t][c] for c in modelsLR[t].P1) +
-                 sum((v2Atual[m][t][c] - 1)*modelsLR[t].v2[c] + (modelsLR[t].v2[c] - 1)*v2Atual[m][t][c] for c in modelsLR[t].P2)) -
-                modelsLR[t].theta <= -obj)
-            #modelsLRz[t].cortesOtimalidade.add(expr=modelsLRz[t].theta >= (obj - L)*
-            #    (sum((v1Atual[m][t][c] - 1)*modelsLRz[t].v1[c] + (modelsLRz[t].v1[c] - 1)*v1Atual[m][t][c] for c in modelsLRz[t].P1) +
-            #     sum((v2Atual[m][t][c] - 1)*modelsLRz[t].v2[c] + (modelsLRz[t].v2[c] - 1)*v2Atual[m][t][c] for c in modelsLRz[t].P2)) + obj)
-            #modelsLagr[t].cortesOtimalidade.add(expr=modelsLagr[t].theta >= (obj - L)*
-            #    (sum((v1Atual[m][t][c] - 1)*modelsLagr[t].v1[c] + (modelsLagr[t].v1[c] - 1)*v1Atual[m][t][c] for c in modelsLagr[t].P1) +
-            #     sum((v2Atual[m][t][c] - 1)*modelsLagr[t].v2[c] + (modelsLagr[t].v2[c] - 1)*v2Atual[m][t][c] for c in modelsLagr[t].P2)) +
-            #    obj)
-        print(f"Corte L-Shaped inteiro para o estágio {t}: theta >= ({obj} - {L})*((", end="")
-        for c in models[t].P if t > 0 else models[t].P1:
-            print(f"({v1Atual[m][t][c]} - 1)*v1,{c} + (v1,{c} - 1)*{v1Atual[m][t][c]} + ", end="")
-        print(") + (", end="")
-        for c in models[t].P2:
-            print(f"({v2Atual[m][t][c]} - 1)*v2,{c} + (v2,{c} - 1)*{v2Atual[m][t][c]} + ", end="")
-        print(f")) + {obj}")'''
-
-    '''# Adiciona um corte de otimalidade de Benders fortalecido agregado ao problema do estágio t, considerando a solução atual da
-    # amostra m para este estágio
-    def adicionaCorteBendersFortalecido(m, t):
-        print(f"\nAdiciona corte de Benders fortalecido para o estágio {t}, amostra {m} = {amostra[m]}")
-        if t > 0:
-            piv1 = {c: 0 for c in models[t].P}
-        else:
-            piv1 = {c: 0 for c in models[t].P1}
-        if t < H - 2:
-            piv2 = {c: 0 for c in models[t].P2}
-        lagr = 0
-        for s in models[t+1].S:
-            # Resolve a RL com a restrição z == v
-            resolveCenario(t + 1, m, s, LRz=True)
-            piv1Atual, piv2Atual = obtemDuaisLRz(t + 1)
-            print(f"piv1 = {piv1Atual}")
-            if t > 0:
-                for c in models[t].P:
-                    piv1[c] += models[t+1].p[s]*piv1Atual[c]
-            else:
-                for c in models[t].P1:
-                    piv1[c] += models[t+1].p[s]*piv1Atual[c]
-            if t < H - 2:
-                print(f"piv2 = {piv2Atual}")
-                for c in models[t].P2:
-                    piv2[c] += models[t+1].p[s]*piv2Atual[c]
-            
-            # Resolve o subproblema Lagrangeano usando o pi obtido
-            resolveCenario(t + 1, m, s, LagrSub=True, pi=(piv1Atual, piv2Atual))
-            #models[t+1].display()
-            print(f"lagr += {value(modelsLagr[t+1].OBJ)}")
-            lagr += models[t+1].p[s]*value(modelsLagr[t+1].OBJ)
-        if t < H - 2:
-            print(f"lagr = {lagr}, piv1 = {piv1}, piv2 = {piv2}")
-        else:
-            print(f"lagr = {lagr}, piv1 = {piv1}")
-        if t > 0:
-            if t < H - 2:
-                models[t].cortesOtimalidade.add(expr=models[t].theta >= lagr +
-                    sum(piv1[c]*models[t].v1[c] for c in models[t].P) + sum(piv2[c]*models[t].v2[c] for c in models[t].P2))
-                modelsLR[t].cortesOtimalidade.add(expr=modelsLR[t].theta >= lagr +
-                    sum(piv1[c]*modelsLR[t].v1[c] for c in modelsLR[t].P) + sum(piv2[c]*modelsLR[t].v2[c] for c in modelsLR[t].P2))
-                modelsLRz[t].cortesOtimalidade.add(expr=modelsLRz[t].theta >= lagr +
-                    sum(piv1[c]*modelsLRz[t].v1[c] for c in modelsLRz[t].P) + sum(piv2[c]*modelsLRz[t].v2[c] for c in modelsLRz[t].P2))
-                modelsLagr[t].cortesOtimalidade.add(expr=modelsLagr[t].theta >= lagr +
-                    sum(piv1[c]*modelsLagr[t].v1[c] for c in modelsLagr[t].P) + sum(piv2[c]*modelsLagr[t].v2[c] for c in modelsLagr[t].P2))
+                resultado = next(resultados)
+                sincronizados[t+1][resultado["trabalhador"]] = pools[t+1]["n"]
+                e += models[t+1].p[s] * resultado["L"]
+                E -= models[t+1].p[s] * resultado["pi"]
+                e0 += models[t+1].p[s] * resultado["inicial"][0]
+                E0 -= models[t+1].p[s] * resultado["inicial"][1]
+                resolucoes += resultado["iteracoes"]
+                iteracoesLagrangeano += resultado["iteracoes"]
+            adicionaCorte(pools[t], E, e)
+            if not (np.allclose(E, E0) and np.isclose(e, e0)):
+                adicionaCorte(pools[t], E0, e0)
+            log.debug("Corte %s para o estágio %d, amostra %d: theta >= %s - %s(s, v1, v2)", tipoCorte, t, m, e, E)
+        tempoLagrangeano += time.time() - inicioLagrangeano
+
+    # Adiciona ao pool do estágio t um corte de otimalidade L-shaped inteiro agregado para cada amostra de ms, considerando
+    # seu estado binário v = (v1, v2) atual para este estágio. Se o estoque é contínuo, o valor de cada cenário filho é o
+    # mínimo do seu MIP sobre o estoque anterior, o que torna o corte válido para qualquer estoque; com a expansão binária,
+    # os bits do estoque fazem parte de v. Os valores ficam no cache e os que faltam são calculados no pool de processos.
+    # Um valor calculado com menos cortes no estágio t+1 continua um limite inferior válido e só é recalculado quando o
+    # reforço é pedido (reforcaAtual). Retorna as amostras cujo corte não veio do cache, as únicas que precisam também do
+    # corte de Benders
+    def adicionaCortesLShapedInteiros(ms, t):
+        nonlocal resolucoes, acertosCache, acertosAntigos, falhasCache
+        log.debug("Adiciona cortes L-shaped inteiros para o estágio %d, amostras %s", t, ms)
+        cortesFilhos = cortesNovos(t + 1)
+        estados = {}            # estado binário empacotado -> v, para as amostras com estado ainda sem valores no cache
+        novas = []
+        for m in ms:
+            v = np.rint(estado(m, t) if resolucao else estado(m, t)[1:]).astype(np.uint8)
+            codigo = codificaEstado(v)
+            valores = [cacheMIP.get((t, codigo, s)) for s in models[t+1].S]
+            if all(valor is not None and valor[0] == pools[t+1]["n"] for valor in valores):
+                acertosCache += len(valores)    # estado já visitado com os mesmos cortes: o corte já está no pool
+            elif all(valor is not None for valor in valores) and not reforcaAtual:
+                acertosAntigos += len(valores)  # estado já visitado com menos cortes: o corte no pool continua válido
             else:
-                models[t].cortesOtimalidade.add(expr=models[t].theta >= lagr +
-                    sum(piv1[c]*models[t].v1[c] for c in models[t].P))
-                modelsLR[t].cortesOtimalidade.add(expr=modelsLR[t].theta >= lagr +
-                    sum(piv1[c]*modelsLR[t].v1[c] for c in modelsLR[t].P))
-                modelsLRz[t].cortesOtimalidade.add(expr=modelsLRz[t].theta >= lagr +
-                    sum(piv1[c]*modelsLRz[t].v1[c] for c in modelsLRz[t].P))
-                modelsLagr[t].cortesOtimalidade.add(expr=modelsLagr[t].theta >= lagr +
-                    sum(piv1[c]*modelsLagr[t].v1[c] for c in modelsLagr[t].P))
+                estados[codigo] = v
+                novas.append(m)
+        tarefas = [{"t": t + 1, "s": s, "v": v, "limites": (value(models[t].sMin), value(models[t].sMax)), "cortes": cortesFilhos}
+            for v in estados.values() for s in models[t+1].S]
+        valores = (executor.map if executor else map)(resolveMinimoEstoque, tarefas)
+        falhasCache += len(tarefas)
+        resolucoes += len(tarefas)
+        for codigo, v in estados.items():
+            obj = 0
+            for s in models[t+1].S:
+                resultado = next(valores)
+                sincronizados[t+1][resultado["trabalhador"]] = pools[t+1]["n"]
+                cacheMIP[(t, codigo, s)] = (pools[t+1]["n"], resultado["valor"])
+                obj += models[t+1].p[s] * cacheMIP[(t, codigo, s)][1]
+            E = (obj - L)*(1 - 2.0*v)
+            adicionaCorte(pools[t], E if resolucao else np.concatenate([[0], E]), obj - (obj - L)*v.sum())
+            log.debug("Corte L-shaped inteiro para o estágio %d: theta >= %s - %s*(distância de v a %s)", t, obj, obj - L, v)
+        return novas
+
+    # Adiciona ao pool do estágio t os cortes do tipo escolhido para as amostras de ms e os insere nos modelos do estágio
+    def adicionaCortes(ms, t):
+        nonlocal estadosRepetidos
+        if resolucao:       # estado todo binário: amostras com o mesmo estado gerariam os mesmos cortes
+            unicos = {}
+            for m in ms:
+                unicos.setdefault(codificaEstado(estado(m, t)), m)
+            estadosRepetidos += len(ms) - len(unicos)
+            ms = list(unicos.values())
+        if tipoCorte == "benders":
+            for m in ms:
+                adicionaCorteBenders(m, t)
+        elif tipoCorte == "lshaped":
+            for m in adicionaCortesLShapedInteiros(ms, t):
+                adicionaCorteBenders(m, t)
         else:
-            models[t].cortesOtimalidade.add(expr=models[t].theta >= lagr +
-                sum(piv1[c]*models[t].v1[c] for c in models[t].P1) + sum(piv2[c]*models[t].v2[c] for c in models[t].P2))
-            modelsLR[t].cortesOtimalidade.add(expr=modelsLR[t].theta >= lagr +
-                sum(piv1[c]*modelsLR[t].v1[c] for c in modelsLR[t].P1) + sum(piv2[c]*modelsLR[t].v2[c] for c in modelsLR[t].P2))
-            modelsLRz[t].cortesOtimalidade.add(expr=modelsLRz[t].theta >= lagr +
-                sum(piv1[c]*modelsLRz[t].v1[c] for c in modelsLRz[t].P1) + sum(piv2[c]*modelsLRz[t].v2[c] for c in modelsLRz[t].P2))
-            modelsLagr[t].cortesOtimalidade.add(expr=modelsLagr[t].theta >= lagr +
-                sum(piv1[c]*modelsLagr[t].v1[c] for c in modelsLagr[t].P1) + sum(piv2[c]*modelsLagr[t].v2[c] for c in modelsLagr[t].P2))
-        print(f"Corte de Benders fortalecido para o estágio {t}: theta >= {lagr} + (", end="")
-        for c in models[t].P if t > 0 else models[t].P1:
-            print(f"{piv1[c]}v1,{c} + ", end="")
-        print(") + (", end="")
-        if t < H - 2:
-            for c in models[t].P2:
-                print(f"{piv2[c]}v2,{c} + ", end="")
-        print(")")'''
+            adicionaCortesLagrangeanos(ms, t)
+        insereCortes(pools[t], destinos[t])
     
+    # Retorna a etapa do cronograma dos MIPs do passo forward para a iteração iter, com limites LB e UB (None: MIPs exatos)
+    def etapaCronograma(iter, LB, UB):
+        if cronograma is None or forcaExato:
+            return None
+        tipo, etapas = cronograma
+        if tipo == "gap":
+            gap = (UB - LB) / max(abs(LB), EPSILON)
+            etapa = next((etapa for etapa in etapas if etapa[0] <= gap), etapas[-1])
+        else:
+            etapa = ([etapa for etapa in etapas if etapa[0] <= iter] or etapas[:1])[-1]
+        return None if tuple(etapa[1:]) == (0, None, None) else etapa
+
+    # Verifica se a solução da relaxação linear do estágio t é inteira em v1 e v2, a menos de INTEIRO
+    def relaxacaoInteira(t):
+        model = modelsLR[t]
+        for var in [model.v1] + ([model.v2] if t < H - 2 else []) + ([model.bs] if resolucao else []):
+            for c in var:
+                if abs(value(var[c]) - round(value(var[c]))) > INTEIRO:
+                    return False
+        return True
+
+    # Copia a solução da relaxação linear do estágio t para o MIP, arredondando as variáveis binárias
+    def copiaRelaxacao(t):
+        for var in modelsLR[t].component_objects(Var):
+            destino = models[t].component(var.local_name)
+            for index in var:
+                valor = var[index].value
+                destino[index].set_value(round(valor) if destino[index].is_binary() and valor is not None else valor)
+
+    # Resolve o cenário s do estágio t da amostra m no passo forward e retorna (resultados, gap relativo da solução).
+    # Se relaxacaoPrimeiro == True, resolve antes a relaxação linear e a aceita se for inteira; senão, resolve o MIP a partir
+    # da solução arredondada. O MIP é resolvido com os parâmetros da etapa do cronograma e, se o solver parar sem solução
+    # viável, de novo sem limites
+    def resolveForward(t, m, s=None):
+        nonlocal mipsForward, mipsEvitados
+        inicial = False
+        if relaxacaoPrimeiro and t < H - 1:
+            results = resolveCenario(t, m, s, LR=True)
+            if results.solver.termination_condition == TerminationCondition.optimal:
+                copiaRelaxacao(t)
+                if relaxacaoInteira(t):
+                    mipsEvitados += 1
+                    return results, 0
+                inicial = True
+        mipsForward += 1
+        if etapa is None:
+            return resolveCenario(t, m, s, inicial=inicial), 0
+        results = resolveCenario(t, m, s, opcoes=opcoesMIP(etapa), inicial=inicial)
+        if results.solver.termination_condition != TerminationCondition.optimal and\
+                not (results.problem.upper_bound is not None and float(results.problem.upper_bound) < math.inf):
+            return resolveCenario(t, m, s), 0
+        return results, etapa[1]
+
+    # Critério de parada do algoritmo. A estabilização do LB só é considerada quando os MIPs foram resolvidos sem gap e o
+    # último passo backward não reaproveitou valores antigos do cache dos cortes L-shaped inteiros. Com o
+    # controle adaptativo, as amostras pequenas do início podem não melhorar o LB em uma iteração sem que ele tenha
+    # estabilizado, e por isso a estabilização é verificada pela regra de parada, em uma janela de iterações
+    estabilizacao = controle is None
+    if controle and parada != "gap":
+        regraParada["criterios"].append(criterioLB(JANELA_ADAPTATIVO, EPSILON))
+    if parada == "lb":
+        def criterioParada():       # estabilização do lower bound
+            return estabilizacao and etapa is None and not usouAntigos and LB - LBant < EPSILON
+    elif parada == "gap":
+        def criterioParada():       # gap entre os limites
+            return UB - LB < EPSILON
+    else:
+        def criterioParada():       # o primeiro dos dois
+            return (estabilizacao and etapa is None and not usouAntigos and LB - LBant < EPSILON) or (UB - LB < EPSILON)
+
     LB = LBant = -1e9
     UB = 1e9
+    semilargura = None          # semilargura do intervalo de confiança do UB estatístico (controle adaptativo)
     iter = 0
+    motivo = "ótimo"
+    criterio = None             # critério de parada de parada.py que parou a execução
+    forcaExato = False          # se o LB estabilizou com MIPs inexatos, a próxima iteração os resolve sem gap
+    usouAntigos = False         # se o último passo backward reaproveitou valores do cache calculados com menos cortes
+    reforcaAtual = not reaproveitaCache     # se o LB estabilizou com valores reaproveitados, a próxima iteração os recalcula
+    forward = []                # tempo e parâmetros dos MIPs do passo forward de cada iteração
     while True:
-        # Atualiza lower bound
+        # Atualiza lower bound, com o limite dual do MIP do primeiro estágio
         LBant = LB
-        resolveCenario(0, 0, 0)
-        #models[0].display()
-        LB = value(models[0].OBJ)
-        if (LB - LBant < EPSILON) or (UB - LB < EPSILON):  # critério para B ou B+I
-        #if UB - LB < EPSILON:               # critério para I
+        etapa = etapaCronograma(iter + 1, LB, UB)
+        inicioForward = time.time()
+        resolucoesForward = resolucoes
+        results, gap = resolveForward(0, 0, 0)
+        LB = max(LBant, limiteDual(results, value(models[0].OBJ), gap))
+        if criterioParada():
             break                           # ótimo encontrado
+        forcaExato = etapa is not None and LB - LBant < EPSILON
+        reforcaAtual = not reaproveitaCache or (usouAntigos and LB - LBant < EPSILON)
+        criterio = verificaParada(regraParada, iter, LB, UB, resolucoes, etapa is None and not usouAntigos, semilargura)
+        if criterio:
+            motivo = descreveCriterio(criterio)
+            break
 
         iter += 1
-        input(f"\n*** ITERAÇÃO {iter} - LB = {LB}, UB = {UB}, LBant = {LBant}***")
+        log.debug("*** ITERAÇÃO %d - LB = %s, UB = %s, LBant = %s ***", iter, LB, UB, LBant)
 
-        # Amostragem - descomentar para gerar uma amostra por iteração
-        #amostra = geraAmostra()
+        # Amostragem por iteração com o controle adaptativo
+        if controle:
+            amostra = geraAmostra(controle["M"])
+            if len(amostra) != M:
+                M = len(amostra)
+                sAtual, v1Atual, v2Atual, piAtual = criaSolucoes(M)
+        resolucoesIteracao = resolucoes
 
-        print("\n* PASSO FORWARD *\n")
+        log.debug("* PASSO FORWARD *")
         armazenaSolucao(0, 0)
         media = 0
         somaprob = 0
         obj = [0 for m in range(M)]
         prob = [1 for m in range(M)]
         for m in range(M):
-            print(f"\nAmostra {m} - {amostra[m]}")
+            log.debug("Amostra %d - %s", m, amostra[m])
             if m > 0:
                 copiaSolucao(0, 0, m)
             obj[m] = value(models[0].OBJ) - value(models[0].theta)
             for t in range(1, H):
                 m1 = cenarioRepetido(m, t)
                 if m1 == -1:        # cenário inédito
-                    results = resolveCenario(t, m)
-                    #models[t].display()
+                    results = resolveForward(t, m)[0]
                     if results.solver.termination_condition == TerminationCondition.infeasible:
                         # Este trecho não será alcançado pois o problema é sempre viável
-                        print("Problema inviável!!!")
-                        return
+                        log.warning("Problema inviável!!!")
+                        if executor:
+                            executor.shutdown()
+                        return None
                     armazenaSolucao(t, m)
                 else:               # cenário repetido
                     copiaSolucao(t, m1, m)
@@ -686,55 +947,122 @@ def sddip(file, H, M):
             media += prob[m] * obj[m]
             somaprob += prob[m]
         
+        forward.append({"iteracao": iter, "tempo": time.time() - inicioForward, "resolucoes": resolucoes - resolucoesForward,
+            "etapa": etapa})
+        log.debug("Passo forward: %.2fs, etapa %s", forward[-1]["tempo"], etapa)
+
         # Atualiza upper bound
         media /= somaprob
-        if media < UB:
+        if controle:
+            semilargura = ZALPHA2 * (sum(prob[m] * (obj[m] - media)**2 for m in range(M)) / (M * somaprob))**0.5
+            UB = media + semilargura
+        elif media < UB:
             UB = media
-        # Descomentar este trecho para usar upper bound estatístico
-        #somavar = 0
-        #for m in range(M):
-        #    somavar += prob[m] * (obj[m] - media)**2
-        #UB = media + ZALPHA2 * (somavar / (M * somaprob))**0.5
-        input(f"\nLB = {LB}, UB = {UB}")
-        #if (LB - LBant < EPSILON) or (UB - LB < EPSILON):  # critério para B ou B+I
-        if UB - LB < EPSILON:               # critério para I
+        log.info("Iteração %d: LB = %.6f, UB = %.6f, gap = %.4f%%, tempo = %.2fs", iter, LB, UB,
+            (UB - LB)*100 / max(abs(LB), EPSILON), time.time() - inicio)
+        if UB - LB < EPSILON:
             break                           # ótimo encontrado
 
-        print("\n* PASSO BACKWARD *")
-        # Último estágio
-        for m in range(M):
-            if cenarioRepetido(m, H - 2) == -1:
-                adicionaCorteBenders(m, H - 2)
-                #adicionaCorteBendersFortalecido(m, H - 2)
-
-        # Demais estágios
-        for t in range(H - 3, 0, -1):
-            for m in range(M):
-                if cenarioRepetido(m, t) == -1:
-                    adicionaCorteBenders(m, t)
-                    #adicionaCorteLShapedInteiro(m, t)
-                    #adicionaCorteBendersFortalecido(m, t)
-                    
-        # Primeiro estágio
-        adicionaCorteBenders(0, 0)
-        #adicionaCorteLShapedInteiro(0, 0)
-        #adicionaCorteBendersFortalecido(0, 0)
+        log.debug("* PASSO BACKWARD *")
+        antigos = acertosAntigos
+        for t in range(H - 2, 0, -1):
+            adicionaCortes([m for m in range(M) if cenarioRepetido(m, t) == -1], t)
+        adicionaCortes([0], 0)         # primeiro estágio
+        usouAntigos = acertosAntigos > antigos
+
+        if controle:
+            proximo = atualizaControle(controle, iter, LB, media, semilargura, resolucoes, resolucoes - resolucoesIteracao)
+            log.info("Amostragem: %s", formataControle(controle["historico"][-1]))
+            if proximo == 0:
+                motivo = "orçamento de resoluções"
+                break
     
-    input(f"\n\n***SOLUÇÃO ÓTIMA ENCONTRADA***\n\nz* = {UB}")
-    print(f"Estágio 0:\ns = {value(models[0].s)}\nv1 = {[value(models[0].v1[c]) for c in models[0].P1]}")
-    print(f"v2 = {[value(models[0].v2[c]) for c in models[0].P2]}\ntheta = {value(models[0].theta)}")
-    for m in range(M):
-        print(f"\nAmostra {m}: {amostra[m]}")
-        for t in range(1, H):
-            resolveCenario(t, m)
-            imprimeSolucao(t)
-    print(f"\nIterações: {iter}")
-    print(f"gap = {UB} - {LB} = {UB - LB} ({(UB - LB)*100 / LB})%")
+    log.info("Parada: %s\nz* = %s", motivo, UB)
+    decisao = decisaoPrimeiroEstagio(models[0])
+    if incumbente:
+        registraLimites(regraParada, LB, UB, semilargura)
+        escreveIncumbente(incumbente, regraParada, criterio, iter, resolucoes, decisao)
+    log.info("Estágio 0:\ns = %s\nv1 = %s\nv2 = %s\ntheta = %s", value(models[0].s),
+        [value(models[0].v1[c]) for c in models[0].P1], [value(models[0].v2[c]) for c in models[0].P2], value(models[0].theta))
+    if log.isEnabledFor(logging.DEBUG):
+        for m in range(M):
+            log.debug("Amostra %d: %s", m, amostra[m])
+            for t in range(1, H):
+                resolveCenario(t, m)
+                imprimeSolucao(t)
+    log.info("Iterações: %d", iter)
+    economia = economiaForward(forward)
+    if cronograma is not None:
+        log.info("Passo forward: %.2fs por iteração, economia estimada com o cronograma dos MIPs: %s",
+            sum(f["tempo"] for f in forward) / max(len(forward), 1), "-" if economia is None else f"{economia:.2f}s")
+    if relaxacaoPrimeiro:
+        log.info("MIPs do passo forward: %d resolvidos, %d evitados por relaxações inteiras", mipsForward, mipsEvitados)
+    if resolucao:
+        log.info("Estados binários repetidos no passo backward: %d", estadosRepetidos)
+    if tipoCorte == "lshaped":
+        log.info("Cache dos MIPs: %d acertos (%d com os cortes atuais, %d com menos cortes), %d falhas",
+            acertosCache + acertosAntigos, acertosCache, acertosAntigos, falhasCache)
+    log.info("gap = %s - %s = %s (%s%%)", UB, LB, UB - LB, (UB - LB)*100 / LB)
+    if executor:
+        executor.shutdown()
+    return {"LB": LB, "UB": UB, "iteracoes": iter, "tempo": time.time() - inicio - construcao, "construcao": construcao,
+        "resolucoes": resolucoes, "cortes": sum(pool["n"] for pool in pools), "iteracoes_lagrangeano": iteracoesLagrangeano,
+        "tempo_lagrangeano": tempoLagrangeano, "cache_acertos": acertosCache, "cache_antigos": acertosAntigos,
+        "cache_falhas": falhasCache, "parada": motivo,
+        "forward": forward, "economia_forward": economia, "mips_forward": mipsForward, "mips_evitados": mipsEvitados,
+        "estados_repetidos": estadosRepetidos,
+        "amostragem": controle["historico"] if controle else [], "decisao": decisao}
 
 # Modo de execução:
-# python sddip.py <arquivo> <H> <M>
-# arquivo: nome do arquivo de entrada
-# H: número de estágios na instância
-# M: número de amostras a serem realizadas por iteração
+# python sddip-v2.py <arquivo> <H> <M> [--semente n] [--parada lb|gap|ambos] [--limite-iteracoes n] [--limite-tempo s]
+#   [--log debug|info|warning] [--corte benders|lshaped|fortalecido|lagrangeano] [--processos n] [--iteracoes-corte n]
+#   [--tempo-corte s] [--cronograma-mip gap|iteracao] [--etapas-mip json] [--relaxacao-primeiro]
+#   [--resolucao-estoque r] [--adaptativo [minimo maximo]] [--orcamento n] [--regra-parada regra] [--incumbente arquivo]
+#   [--reaproveita-cache]
 if __name__ == "__main__":
-    sddip(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
+    parser = argparse.ArgumentParser(description="SDDiP para o Lot Sizing Estocástico")
+    parser.add_argument("arquivo", help="nome do arquivo de entrada")
+    parser.add_argument("H", type=int, help="número de estágios na instância")
+    parser.add_argument("M", type=int, help="número de amostras a serem realizadas por iteração")
+    parser.add_argument("--semente", type=int, help="semente da amostragem")
+    parser.add_argument("--parada", default="ambos", choices=["lb", "gap", "ambos"],
+        help="critério de parada: estabilização do LB, gap entre LB e UB ou o primeiro dos dois")
+    parser.add_argument("--limite-iteracoes", type=int, help="número máximo de iterações")
+    parser.add_argument("--limite-tempo", type=float, help="tempo máximo de execução (s)")
+    parser.add_argument("--log", default="info", choices=["debug", "info", "warning"],
+        help="nível do log (info: resumo de cada iteração; debug: subproblemas, duais e cortes)")
+    parser.add_argument("--corte", default="benders", choices=["benders", "lshaped", "fortalecido", "lagrangeano"], help="tipo de corte")
+    parser.add_argument("--processos", type=int, default=1, help="processos que resolvem os duais Lagrangeanos")
+    parser.add_argument("--iteracoes-corte", type=int, default=20, help="limite de iterações de cada corte Lagrangeano")
+    parser.add_argument("--tempo-corte", type=float, default=10, help="limite de tempo (s) de cada corte Lagrangeano")
+    parser.add_argument("--cronograma-mip", choices=["gap", "iteracao"],
+        help="cronograma dos parâmetros dos MIPs do passo forward (padrão: MIPs sem gap)")
+    parser.add_argument("--etapas-mip", type=json.loads,
+        help="etapas do cronograma em JSON, [[início, gap, tempo, nós], ...] (padrão: CRONOGRAMA_GAP ou CRONOGRAMA_ITERACAO)")
+    parser.add_argument("--relaxacao-primeiro", action="store_true",
+        help="resolve a relaxação linear antes de cada MIP do passo forward e a aceita se for inteira")
+    parser.add_argument("--resolucao-estoque", type=float,
+        help="resolução da expansão binária do estoque (padrão: estoque contínuo)")
+    parser.add_argument("--adaptativo", type=int, nargs='*', metavar="LIMITE",
+        help="amostra M caminhos por iteração, ajustando M pela largura do intervalo de confiança do UB entre os limites "
+        "mínimo e máximo (M: tamanho da primeira amostra)")
+    parser.add_argument("--orcamento", type=int, help="limite de resoluções do controle adaptativo de M")
+    parser.add_argument("--regra-parada", type=lambda texto: leCriterios(texto, EPSILON), metavar="REGRA",
+        help="critérios de parada adicionais: gap=tolerância relativa, lb=janela, tempo=s, resolucoes=n, iteracoes=n")
+    parser.add_argument("--incumbente", metavar="ARQUIVO",
+        help="escreve os melhores limites e a decisão do primeiro estágio ao parar (JSON)")
+    parser.add_argument("--reaproveita-cache", action="store_true",
+        help="reaproveita os valores do cache dos cortes L-shaped inteiros obtidos com menos cortes no estágio seguinte")
+    args = parser.parse_args()
+    adaptativo = None
+    if args.adaptativo is not None:
+        adaptativo = dict(zip(["minimo", "maximo"], args.adaptativo), orcamento=args.orcamento)
+    cronograma = None
+    if args.cronograma_mip:
+        padrao = CRONOGRAMA_GAP if args.cronograma_mip == "gap" else CRONOGRAMA_ITERACAO
+        cronograma = (args.cronograma_mip, [tuple(etapa) for etapa in args.etapas_mip or padrao])
+    logging.basicConfig(stream=sys.stdout, format="%(message)s")
+    log.setLevel(args.log.upper())
+    sddip(args.arquivo, args.H, args.M, args.semente, args.corte, args.processos, args.iteracoes_corte, args.tempo_corte,
+        args.parada, args.limite_iteracoes, args.limite_tempo, cronograma, args.relaxacao_primeiro,
+        args.resolucao_estoque, adaptativo, args.regra_parada, args.incumbente, args.reaproveita_cache)
@@ -5,150 +5,492 @@
 
 from pyomo.environ import *
 from pyomo.opt import TerminationCondition
-import sys, time, os
-from random import random
+import sys, time, os, math, json, argparse, queue, socket, selectors, multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from random import random, seed
+from memoria import iniciaMemoria, finalizaMemoria, medeMemoria, formataMemoria
+from cortes import criaPool, adicionaCorte, corteExiste, insereCortes, termos, coeficientes, salvaPools, carregaPools
+from amostragem import criaControle, atualizaControle, formataControle
+from parada import criaParada, verificaParada, registraLimites, descreveCriterio, escreveIncumbente, leCriterios, ORCAMENTOS
+from rede import INICIO, TAREFA, CORTE, FIM, envia, recebe, codificaInicio, decodificaInicio, codificaTarefa,\
+    decodificaTarefa, codificaCorte, decodificaCorte
 
 EPSILON = 1e-5          # tolerância para os testes de otimalidade
 ZALPHA2 = 2.326         # valor de z alpha/2 para 98% de confiança
 L = 0                   # limite inferior para a função recurso
 Q = 1e6                 # penalidade das variáveis artificiais phi
+VIOLACAO = 1e-7         # violação mínima de um corte no ponto de teste para que seja adicionado (bem abaixo de EPSILON,
+                        # para não impedir o critério de parada exato)
 
-def sddp(file, H, M):
-    # Retorna o modelo para o estágio t
-    def criaModelo(t):
-        model = AbstractModel(f"estagio{t}")
-
-        # Conjuntos
-        model.P = Set()                             # cargas disponíveis para aquisição neste estágio
-        model.A = Set()                             # cargas já adquiridas anteriormente que podem ser canceladas ou adiadas neste estágio
-        model.PAnt = Set()                          # conjunto P do estágio anterior
-        model.AAnt = Set()                          # conjunto A do estágio anterior
-        model.A2Ant = Set()                         # conjunto A de dois estágios atrás
-        model.C = Set()                             # conjunto de todas as cargas
-        model.S = Set()                             # cenários deste estágio
-
-        # Parâmetros
-        model.p = Param(model.S)                    # probabilidade de cada cenário deste estágio
-        model.d = Param(model.S)                    # demanda de cada cenário deste estágio
-        model.ca = Param(model.C)                   # custo unitário de aquisição de cada carga
-        model.cc = Param(model.C)                   # custo unitário de cancelamento de cada carga
-        model.cp = Param(model.C)                   # custo unitário de adiamento1 de cada carga
-        model.q = Param(model.C)                    # volume de cada carga
-        model.h = Param()                           # custo unitário de estoque
-        model.sMin = Param()                        # estoque mínimo
-        model.sMax = Param()                        # estoque máximo
-        model.s0 = Param()                          # estoque inicial antes do primeiro estágio
-
-        # Variáveis
-        model.s = Var(domain=NonNegativeReals)              # estoque ao final deste estágio
-        if t > 0:
-            model.u = Var(domain=NonNegativeReals)          # volume adquirido que chega neste estágio
-            model.w = Var(domain=NonNegativeReals)          # volume cancelado que chegaria neste estágio
-            if t > 1:
-                model.y = Var(domain=NonNegativeReals)      # volume adiado para este estágio
-            # Variáveis artificiais para garantir recurso completo
-            model.phi1 = Var(domain=NonNegativeReals)
-            model.phi2 = Var(domain=NonNegativeReals)
-        if t < H - 1:           # até o penúltimo estágio
-            model.v = Var(model.P, domain=NonNegativeReals)         # fração da carga c adquirida para chegar em t+1
-            model.x = Var(model.A, domain=NonNegativeReals)         # fração da carga c que chegaria em t+1 e é cancelada
-            if t < H - 2:
-                model.z2 = Var(model.A, domain=NonNegativeReals)    # fração da carga c que chegaria em t+1 e é adiada
-            if t > 0:
-                model.z1 = Var(model.AAnt, domain=NonNegativeReals) # fração da carga c que chegaria em t e foi adiada para t+1
-            model.theta = Var(bounds=(L, None))
+# Parâmetros padrão da região de confiança do primeiro estágio: raio inicial (norma do máximo sobre v, x e z2), fatores de
+# aumento após um passo sério e de redução após um passo nulo, e raio mínimo
+JANELA = 2              # máximo de tarefas enviadas e ainda sem resposta por trabalhador remoto no passo backward
+REGIAO = {"raio": 0.5, "aumento": 2, "reducao": 0.5, "minimo": 0.05}
 
-        # Expressões (termos que variam a cada iteração)
-        if t > 0:
-            model.sAnt = Expression()                       # estoque do estágio anterior
-            model.vAnt = Expression(model.PAnt)             # valores de v do estágio anterior
-            model.xAnt = Expression(model.AAnt)             # valores de x do estágio anterior
-            if t < H - 1:
-                model.z2Ant = Expression(model.AAnt)        # valores de z2 do estágio anterior
-            if t > 1:
-                model.z1Ant = Expression(model.A2Ant)       # valores de z1 do estágio anterior
-            model.dk = Expression()                         # demanda do cenário considerado
-
-        # Função objetivo
-        if t == 0:              # primeiro estágio
-            def objetivo(model):
-                return sum(model.ca[c]*model.q[c]*model.v[c] for c in model.P) +\
-                    sum(model.cc[c]*model.q[c]*model.x[c] for c in model.A) +\
-                    sum((model.cp[c] - model.cc[c])*model.q[c]*model.z2[c] for c in model.A) +\
-                    model.h*model.s + model.theta
-        elif t < H - 2:         # caso geral
-            def objetivo(model):
-                return sum(model.ca[c]*model.q[c]*model.v[c] for c in model.P) +\
-                    sum(model.cc[c]*model.q[c]*model.x[c] for c in model.A) +\
-                    sum((model.cp[c] - model.cc[c])*model.q[c]*model.z2[c] for c in model.A) +\
-                    model.h*model.s + Q*model.phi1 + Q*model.phi2 + model.theta
-        elif t == H - 2:        # penúltimo estágio
-            def objetivo(model):
-                return sum(model.ca[c]*model.q[c]*model.v[c] for c in model.P) +\
-                    sum(model.cc[c]*model.q[c]*model.x[c] for c in model.A) +\
-                    model.h*model.s + Q*model.phi1 + Q*model.phi2 + model.theta
-        else:                   # último estágio
-            def objetivo(model):
-                return model.h*model.s + Q*model.phi1 + Q*model.phi2
-        model.OBJ = Objective(rule=objetivo)
-
-        # Restrições
-        if t > 1:               # caso geral
-            def balanco(model):
-                return sum(model.q[c] for c in model.AAnt) + model.sAnt + model.u + model.y + model.phi1 ==\
-                    model.dk + model.w + model.s + model.phi2
-        elif t == 1:            # segundo estágio
-            def balanco(model):
-                return sum(model.q[c] for c in model.AAnt) + model.sAnt + model.u + model.phi1 ==\
-                    model.dk + model.w + model.s + model.phi2
-        else:                   # primeiro estágio
-            def balanco(model):
-                return sum(model.q[c] for c in model.AAnt) + model.s0 == model.d[model.S.at(1)] + model.s
-        model.balanco = Constraint(rule=balanco)
-        model.limiteSMin = Constraint(expr=model.s >= model.sMin)
-        model.limiteSMax = Constraint(expr=model.s <= model.sMax)
-        if t > 0:
-            def aquisicao(model):
-                return model.u == sum(model.q[c]*model.vAnt[c] for c in model.PAnt)
-            model.aquisicao = Constraint(rule=aquisicao)
-            def cancelamento(model):
-                return model.w == sum(model.q[c]*model.xAnt[c] for c in model.AAnt)
-            model.cancelamento = Constraint(rule=cancelamento)
-            if t > 1:
-                def adiamento1(model):
-                    return model.y == sum(model.q[c]*model.z1Ant[c] for c in model.A2Ant)
-                model.adiamento1 = Constraint(rule=adiamento1)
-            if t < H - 1:
-                def adiamento2(model, c):
-                    return model.z1[c] == model.z2Ant[c]
-                model.adiamento2 = Constraint(model.AAnt, rule=adiamento2)
+# Retorna uma lista de M cenários amostrados aleatoriamente, sem repetição
+# cenarios[t]: lista de pares (s, p) com cada cenário s do estágio t e sua probabilidade p
+def geraAmostra(M, cenarios):
+    amostra = []
+    m = 0
+    while m < M:
+        a = []
+        for t in range(len(cenarios)):
+            r = random()
+            p = 0
+            for s, ps in cenarios[t]:
+                p += ps
+                if p >= r:
+                    a.append(s)
+                    break
+
+        # Verifica se essa amostra já não foi gerada (para não repetir)
+        existe = False
+        for a1 in amostra:
+            existe = True
+            for t in range(len(cenarios)):
+                if a1[t] != a[t]:
+                    existe = False
+                    break
+            if existe:
+                break
+        if not existe:
+            amostra.append(a)
+            m += 1
+    return amostra
+
+# Verifica se existe algum item na amostra anterior a m que é coincide com o item m até o estágio t
+# Se sim, retorna seu índice.
+def cenarioRepetido(amostra, m, t, H):
+    if t == H - 1:      # no último estágio nunca repete
+        return -1
+    for m1 in range(m):
+        existe = True
+        for t1 in range(t + 1):
+            if amostra[m1][t1] != amostra[m][t1]:
+                existe = False
+                break
+        if existe:
+            return m1
+    return -1
+
+# Retorna a solução dual do modelo de um estágio
+def obtemDuais(model):
+    duais = {"adiamento2": {}, "cancelamentoAdiamento": {}, "limiteV": {}, "limiteX": {}, "limiteZ2": {}, "cortesOtimalidade": []}
+    for c in model.component_objects(Constraint, active=True):
+        name = c.getname()
+        if name in ["adiamento2", "cancelamentoAdiamento", "limiteV", "limiteX", "limiteZ2"]:
+            for index in c:
+                duais[name][index] = model.dual[c[index]]
+        elif name == "cortesOtimalidade":
+            for index in c:
+                duais[name].append(model.dual[c[index]])
+        else:
+            for index in c:
+                duais[name] = model.dual[c[index]]
+    return duais
+
+# Retorna os buffers das soluções atuais de M amostras: arrays sAtual (M, H), vAtual (M, H-1, nP), xAtual e z1Atual
+# (M, H-1, nA), z2Atual (M, H-2, nA) e origem (M, H). origem[m, t] é a amostra cuja linha guarda a solução do estágio t da
+# amostra m, de forma que amostras com o mesmo prefixo compartilham a solução sem copiá-la.
+def criaBuffers(M, H, nP, nA):
+    return (np.zeros((M, H)), np.zeros((M, H - 1, nP)), np.zeros((M, H - 1, nA)), np.zeros((M, H - 1, nA)),
+        np.zeros((M, max(H - 2, 0), nA)), np.tile(np.arange(M)[:, None], (1, H)))
+
+# Copia a solução do estágio t da amostra m1 para o correspondente da amostra m2 (apenas aponta para a mesma linha)
+def copiaSolucao(origem, t, m1, m2):
+    origem[m2, t] = origem[m1, t]
+
+# Acumula no corte [e, Es, Ev, Ex, Ez2, Ez1] a contribuição de um cenário do estágio seguinte. Parâmetros:
+# ps: probabilidade do cenário; duais: solução dual do cenário; dk: demanda do cenário
+# a: volume pré-adquirido que chega no estágio seguinte; sMin, sMax: limites do estoque; q: volume de cada carga
+# eList: termos independentes dos cortes do estágio seguinte
+def acumulaCorte(corte, ps, duais, dk, a, sMin, sMax, q, eList):
+    sigma_e = np.dot(duais["cortesOtimalidade"], eList[:len(duais["cortesOtimalidade"])])
+    corte[0] += ps * (duais["balanco"]*(dk - a) + duais["limiteSMin"]*sMin +
+        duais["limiteSMax"]*sMax + sum(duais["limiteV"][d] for d in duais["limiteV"]) +
+        sum(duais["limiteX"][d] for d in duais["limiteX"]) + sum(duais["limiteZ2"][d] for d in duais["limiteZ2"]) + sigma_e)
+    corte[1] += ps * duais["balanco"]
+    Ev, Ex, Ez2, Ez1 = corte[2:]
+    for c in Ev:
+        Ev[c] -= ps * q[c] * duais["aquisicao"]
+    for c in Ex:
+        Ex[c] -= ps * q[c] * duais["cancelamento"]
+    for c in Ez2:
+        Ez2[c] -= ps * duais["adiamento2"][c]
+    for c in Ez1:
+        Ez1[c] -= ps * q[c] * duais["adiamento1"]
+
+# Retorna o modelo do estágio t da instância file com H estágios
+def criaModelo(file, H, t):
+    model = AbstractModel(f"estagio{t}")
+
+    # Conjuntos
+    model.P = Set()                             # cargas disponíveis para aquisição neste estágio
+    model.A = Set()                             # cargas já adquiridas anteriormente que podem ser canceladas ou adiadas neste estágio
+    model.PAnt = Set()                          # conjunto P do estágio anterior
+    model.AAnt = Set()                          # conjunto A do estágio anterior
+    model.A2Ant = Set()                         # conjunto A de dois estágios atrás
+    model.C = Set()                             # conjunto de todas as cargas
+    model.S = Set()                             # cenários deste estágio
+
+    # Parâmetros
+    model.p = Param(model.S)                    # probabilidade de cada cenário deste estágio
+    model.d = Param(model.S)                    # demanda de cada cenário deste estágio
+    model.ca = Param(model.C)                   # custo unitário de aquisição de cada carga
+    model.cc = Param(model.C)                   # custo unitário de cancelamento de cada carga
+    model.cp = Param(model.C)                   # custo unitário de adiamento1 de cada carga
+    model.q = Param(model.C)                    # volume de cada carga
+    model.h = Param()                           # custo unitário de estoque
+    model.sMin = Param()                        # estoque mínimo
+    model.sMax = Param()                        # estoque máximo
+    model.s0 = Param()                          # estoque inicial antes do primeiro estágio
+
+    # Variáveis
+    model.s = Var(domain=NonNegativeReals)              # estoque ao final deste estágio
+    if t > 0:
+        model.u = Var(domain=NonNegativeReals)          # volume adquirido que chega neste estágio
+        model.w = Var(domain=NonNegativeReals)          # volume cancelado que chegaria neste estágio
+        if t > 1:
+            model.y = Var(domain=NonNegativeReals)      # volume adiado para este estágio
+        # Variáveis artificiais para garantir recurso completo
+        model.phi1 = Var(domain=NonNegativeReals)
+        model.phi2 = Var(domain=NonNegativeReals)
+    if t < H - 1:           # até o penúltimo estágio
+        model.v = Var(model.P, domain=NonNegativeReals)         # fração da carga c adquirida para chegar em t+1
+        model.x = Var(model.A, domain=NonNegativeReals)         # fração da carga c que chegaria em t+1 e é cancelada
         if t < H - 2:
-            def cancelamentoAdiamento(model, c):
-                return model.z2[c] <= model.x[c]
-            model.cancelamentoAdiamento = Constraint(model.A, rule=cancelamentoAdiamento)
+            model.z2 = Var(model.A, domain=NonNegativeReals)    # fração da carga c que chegaria em t+1 e é adiada
+        if t > 0:
+            model.z1 = Var(model.AAnt, domain=NonNegativeReals) # fração da carga c que chegaria em t e foi adiada para t+1
+        model.theta = Var(bounds=(L, None))
+
+    # Expressões (termos que variam a cada iteração)
+    if t > 0:
+        model.sAnt = Expression()                       # estoque do estágio anterior
+        model.vAnt = Expression(model.PAnt)             # valores de v do estágio anterior
+        model.xAnt = Expression(model.AAnt)             # valores de x do estágio anterior
         if t < H - 1:
-            def limiteV(model, c):
-                return model.v[c] <= 1
-            model.limiteV = Constraint(model.P, rule=limiteV)
-            def limiteX(model, c):
-                return model.x[c] <= 1
-            model.limiteX = Constraint(model.A, rule=limiteX)
-            if t < H - 2:
-                def limiteZ2(model, c):
-                    return model.z2[c] <= 1
-                model.limiteZ2 = Constraint(model.A, rule=limiteZ2)
+            model.z2Ant = Expression(model.AAnt)        # valores de z2 do estágio anterior
+        if t > 1:
+            model.z1Ant = Expression(model.A2Ant)       # valores de z1 do estágio anterior
+        model.dk = Expression()                         # demanda do cenário considerado
 
+    # Função objetivo
+    if t == 0:              # primeiro estágio
+        def objetivo(model):
+            return sum(model.ca[c]*model.q[c]*model.v[c] for c in model.P) +\
+                sum(model.cc[c]*model.q[c]*model.x[c] for c in model.A) +\
+                sum((model.cp[c] - model.cc[c])*model.q[c]*model.z2[c] for c in model.A) +\
+                model.h*model.s + model.theta
+    elif t < H - 2:         # caso geral
+        def objetivo(model):
+            return sum(model.ca[c]*model.q[c]*model.v[c] for c in model.P) +\
+                sum(model.cc[c]*model.q[c]*model.x[c] for c in model.A) +\
+                sum((model.cp[c] - model.cc[c])*model.q[c]*model.z2[c] for c in model.A) +\
+                model.h*model.s + Q*model.phi1 + Q*model.phi2 + model.theta
+    elif t == H - 2:        # penúltimo estágio
+        def objetivo(model):
+            return sum(model.ca[c]*model.q[c]*model.v[c] for c in model.P) +\
+                sum(model.cc[c]*model.q[c]*model.x[c] for c in model.A) +\
+                model.h*model.s + Q*model.phi1 + Q*model.phi2 + model.theta
+    else:                   # último estágio
+        def objetivo(model):
+            return model.h*model.s + Q*model.phi1 + Q*model.phi2
+    model.OBJ = Objective(rule=objetivo)
+
+    # Restrições
+    if t > 1:               # caso geral
+        def balanco(model):
+            return sum(model.q[c] for c in model.AAnt) + model.sAnt + model.u + model.y + model.phi1 ==\
+                model.dk + model.w + model.s + model.phi2
+    elif t == 1:            # segundo estágio
+        def balanco(model):
+            return sum(model.q[c] for c in model.AAnt) + model.sAnt + model.u + model.phi1 ==\
+                model.dk + model.w + model.s + model.phi2
+    else:                   # primeiro estágio
+        def balanco(model):
+            return sum(model.q[c] for c in model.AAnt) + model.s0 == model.d[model.S.at(1)] + model.s
+    model.balanco = Constraint(rule=balanco)
+    model.limiteSMin = Constraint(expr=model.s >= model.sMin)
+    model.limiteSMax = Constraint(expr=model.s <= model.sMax)
+    if t > 0:
+        def aquisicao(model):
+            return model.u == sum(model.q[c]*model.vAnt[c] for c in model.PAnt)
+        model.aquisicao = Constraint(rule=aquisicao)
+        def cancelamento(model):
+            return model.w == sum(model.q[c]*model.xAnt[c] for c in model.AAnt)
+        model.cancelamento = Constraint(rule=cancelamento)
+        if t > 1:
+            def adiamento1(model):
+                return model.y == sum(model.q[c]*model.z1Ant[c] for c in model.A2Ant)
+            model.adiamento1 = Constraint(rule=adiamento1)
         if t < H - 1:
-            model.cortesOtimalidade = ConstraintList()      # lista de cortes de otimalidade adicionados ao longo do algoritmo
+            def adiamento2(model, c):
+                return model.z1[c] == model.z2Ant[c]
+            model.adiamento2 = Constraint(model.AAnt, rule=adiamento2)
+    if t < H - 2:
+        def cancelamentoAdiamento(model, c):
+            return model.z2[c] <= model.x[c]
+        model.cancelamentoAdiamento = Constraint(model.A, rule=cancelamentoAdiamento)
+    if t < H - 1:
+        def limiteV(model, c):
+            return model.v[c] <= 1
+        model.limiteV = Constraint(model.P, rule=limiteV)
+        def limiteX(model, c):
+            return model.x[c] <= 1
+        model.limiteX = Constraint(model.A, rule=limiteX)
+        if t < H - 2:
+            def limiteZ2(model, c):
+                return model.z2[c] <= 1
+            model.limiteZ2 = Constraint(model.A, rule=limiteZ2)
+
+    if t < H - 1:
+        model.cortesOtimalidade = ConstraintList()      # lista de cortes de otimalidade adicionados ao longo do algoritmo
+    if t > 0:
+        model.dual = Suffix(direction=Suffix.IMPORT)
+
+    return model.create_instance(file, namespace=f"t{t}")
+
+# Cria os modelos dos H estágios da instância file e as estruturas que ligam suas variáveis de estado aos buffers de solução.
+# Retorna um dicionário com os modelos, os volumes a, q, os cenários, as posições iP e iA das cargas nos buffers, as
+# variáveis de estado (estadoV, estadoX, estadoZ2, estadoZ1), as expressões que as recebem no estágio seguinte (ligaV,
+# ligaX, ligaZ1, ligaZ2) e as variáveis de estado na ordem das colunas dos cortes (variaveisCorte)
+def criaInstancia(file, H):
+    models = [criaModelo(file, H, t) for t in range(H)]
+    a = [sum(models[t].q[c] for c in models[t].AAnt) for t in range(H)]    # volume adquirido anteriormente que chega em cada estágio
+    q = {c: models[0].q[c] for c in models[0].C}                          # volume de cada carga
+    cenarios = [[(s, models[t].p[s]) for s in models[t].S] for t in range(H)] # cenários de cada estágio e suas probabilidades
+
+    # Posição de cada carga nos buffers de solução: iP para as cargas adquiríveis (v), iA para as pré-adquiridas (x, z1, z2)
+    iP = {c: i for i, c in enumerate(sorted(set().union(*(set(models[t].P) for t in range(H - 1)))))}
+    iA = {c: i for i, c in enumerate(sorted(set().union(*(set(models[t].A) | set(models[t].AAnt) for t in range(H)))))}
+
+    # Variáveis de estado de cada estágio e suas posições nos buffers, para armazenar a solução direto dos valores primais
+    def posicoes(var, conj, indice):
+        return ([var[c] for c in conj], np.array([indice[c] for c in conj], dtype=int))
+    estadoV = [posicoes(models[t].v, models[t].P, iP) if t < H - 1 else None for t in range(H)]
+    estadoX = [posicoes(models[t].x, models[t].A, iA) if t < H - 1 else None for t in range(H)]
+    estadoZ2 = [posicoes(models[t].z2, models[t].A, iA) if t < H - 2 else None for t in range(H)]
+    estadoZ1 = [posicoes(models[t].z1, models[t].AAnt, iA) if 0 < t < H - 1 else None for t in range(H)]
+
+    # Expressões de cada estágio que recebem a solução do estágio anterior, com as posições dos valores nos buffers
+    ligaV = [[(models[t].vAnt[c], iP[c]) for c in models[t].PAnt] if t > 0 else [] for t in range(H)]
+    ligaX = [[(models[t].xAnt[c], iA[c]) for c in models[t].AAnt] if t > 0 else [] for t in range(H)]
+    ligaZ1 = [[(models[t].z1Ant[c], iA[c]) for c in models[t].A2Ant] if t > 1 else [] for t in range(H)]
+    ligaZ2 = [[(models[t].z2Ant[c], iA[c]) for c in models[t].AAnt] if 0 < t < H - 1 else [] for t in range(H)]
+
+    # Variáveis de estado de cada estágio na ordem das colunas dos cortes: s, v, x, z2 e z1
+    variaveisCorte = [[] for t in range(H)]
+    for t in range(H - 1):
+        variaveisCorte[t] = [models[t].s] + [models[t].v[c] for c in models[t].P] + [models[t].x[c] for c in models[t].A]
+        if t < H - 2:
+            variaveisCorte[t] += [models[t].z2[c] for c in models[t].A]
         if t > 0:
-            model.dual = Suffix(direction=Suffix.IMPORT)
+            variaveisCorte[t] += [models[t].z1[c] for c in models[t].AAnt]
+    return {"models": models, "a": a, "q": q, "cenarios": cenarios, "iP": iP, "iA": iA, "estadoV": estadoV,
+        "estadoX": estadoX, "estadoZ2": estadoZ2, "estadoZ1": estadoZ1, "ligaV": ligaV, "ligaX": ligaX, "ligaZ1": ligaZ1,
+        "ligaZ2": ligaZ2, "variaveisCorte": variaveisCorte}
+
+# Atualiza as expressões do modelo do estágio t > 0 da instância com a solução do estágio t-1 da amostra m guardada nos
+# buffers (sAtual, vAtual, xAtual, z1Atual, z2Atual, origem) e com a demanda do cenário s
+def atualizaEstagio(inst, buffers, t, m, s):
+    sAtual, vAtual, xAtual, z1Atual, z2Atual, origem = buffers
+    model = inst["models"][t]
+    m0 = origem[m, t-1]
+    model.sAnt.set_value(float(sAtual[m0, t-1]))
+    for nome, atual in [("ligaV", vAtual), ("ligaX", xAtual), ("ligaZ1", z1Atual), ("ligaZ2", z2Atual)]:
+        liga = inst[nome]
+        if liga[t]:
+            valores = atual[m0, t-1].tolist()
+            for expr, i in liga[t]:
+                expr.set_value(valores[i])
+    model.dk.set_value(model.d[s])
+
+# Guarda nos buffers a solução atual do modelo do estágio t da instância como a solução da amostra m
+def armazenaEstagio(inst, buffers, m, t):
+    sAtual, vAtual, xAtual, z1Atual, z2Atual, origem = buffers
+    origem[m, t] = m
+    sAtual[m, t] = inst["models"][t].s.value
+    for nome, atual in [("estadoV", vAtual), ("estadoX", xAtual), ("estadoZ2", z2Atual), ("estadoZ1", z1Atual)]:
+        if inst[nome][t]:
+            variaveis, posicao = inst[nome][t]
+            atual[m, t, posicao] = [var.value for var in variaveis]
+
+# Retorna a solução do estágio t da amostra m guardada nos buffers, na ordem das colunas dos cortes: s, v, x, z2 e z1
+def pontoCorte(inst, buffers, m, t):
+    sAtual, vAtual, xAtual, z1Atual, z2Atual, origem = buffers
+    m0 = origem[m, t]
+    ponto = [np.array([sAtual[m0, t]])]
+    for nome, atual in [("estadoV", vAtual), ("estadoX", xAtual), ("estadoZ2", z2Atual), ("estadoZ1", z1Atual)]:
+        if inst[nome][t]:
+            ponto.append(atual[m0, t, inst[nome][t][1]])
+    return np.concatenate(ponto)
+
+# Guarda nos buffers, como a solução do estágio t da amostra m, o ponto dado na ordem das colunas dos cortes (inversa de
+# pontoCorte)
+def gravaPonto(inst, buffers, m, t, ponto):
+    sAtual, vAtual, xAtual, z1Atual, z2Atual, origem = buffers
+    origem[m, t] = m
+    sAtual[m, t] = ponto[0]
+    i = 1
+    for nome, atual in [("estadoV", vAtual), ("estadoX", xAtual), ("estadoZ2", z2Atual), ("estadoZ1", z1Atual)]:
+        if inst[nome][t]:
+            posicao = inst[nome][t][1]
+            atual[m, t, posicao] = ponto[i:i + len(posicao)]
+            i += len(posicao)
+
+# Retorna a violação do corte theta + E·x >= e no ponto (x, theta)
+def violacaoCorte(E, e, x, theta):
+    return e - np.dot(E, x) - theta
+
+# Retorna as constantes de Lipschitz (norma 1) do custo futuro esperado do estágio t em cada variável de estado, na ordem
+# das colunas dos cortes. Uma variação no estoque é absorvida pelas variáveis artificiais phi do estágio seguinte ao custo
+# Q por unidade, e uma variação na fração de uma carga c (v, x, z1 ou z2, que adia a chegada em um estágio) ao custo Q*q[c]
+def lipschitzEstado(model, t, H):
+    lip = [Q] + [Q*model.q[c] for c in model.P] + [Q*model.q[c] for c in model.A]
+    if t < H - 2:
+        lip += [Q*model.q[c] for c in model.A]
+    if t > 0:
+        lip += [Q*model.q[c] for c in model.AAnt]
+    return lip
+
+# (Re)constrói no modelo do estágio t a aproximação interna do custo futuro a partir dos pontos de estado visitados e dos
+# limites superiores do custo futuro esperado em cada um: theta >= soma lam_j*valores[j] + soma lip[i]*|estado[i] -
+# soma lam_j*pontos[j][i]|, com lam uma combinação convexa. Pela convexidade do custo futuro e pelas constantes de Lipschitz
+# lip (ver lipschitzEstado), é um limite superior do custo futuro em qualquer estado
+def aproximacaoInterna(model, variaveis, pontos, valores, lip):
+    if model.find_component("interna") is not None:
+        model.del_component("interna")
+    J, n = range(len(valores)), range(len(variaveis))
+    b = model.interna = Block()
+    b.lam = Var(J, domain=NonNegativeReals)
+    b.mais = Var(n, domain=NonNegativeReals)        # distância ao fecho convexo dos pontos, para cada variável de estado
+    b.menos = Var(n, domain=NonNegativeReals)
+    b.convexa = Constraint(expr=sum(b.lam[j] for j in J) == 1)
+    def estado(b, i):
+        return sum(float(pontos[j][i])*b.lam[j] for j in J) + b.mais[i] - b.menos[i] == variaveis[i]
+    b.estado = Constraint(n, rule=estado)
+    b.custo = Constraint(expr=model.theta >= sum(float(valores[j])*b.lam[j] for j in J) +
+        sum(lip[i]*(b.mais[i] + b.menos[i]) for i in n))
+
+# Retorna um corte vazio [e, Es, Ev, Ex, Ez2, Ez1] para o modelo do estágio t, a ser preenchido por acumulaCorte
+def corteVazio(model, t, H):
+    Ez2 = {c: 0 for c in model.A} if t < H - 2 else {}
+    Ez1 = {c: 0 for c in model.AAnt} if t > 0 else {}
+    return [0, 0, {c: 0 for c in model.P}, {c: 0 for c in model.A}, Ez2, Ez1]
 
-        return model.create_instance(file, namespace=f"t{t}")
+# Retorna o termo independente e e os coeficientes E, na ordem das colunas do pool, de um corte acumulado
+def vetorCorte(corte):
+    Ev, Ex, Ez2, Ez1 = corte[2:]
+    return corte[0], np.array([corte[1]] + list(Ev.values()) + list(Ex.values()) + list(Ez2.values()) + list(Ez1.values()))
+
+# Formata as estatísticas do passo backward distribuído de uma iteração como uma linha do relatório
+def formataRede(estatistica):
+    return (f"resolução = {estatistica['resolucao']:.3f}s, comunicação = {estatistica['comunicacao']:.3f}s, "
+        f"{estatistica['bytes'] / 2**10:.1f}KB")
+
+# Retorna a decisão atual do primeiro estágio (estoque e frações das cargas)
+def decisaoPrimeiroEstagio(model):
+    return {"s": value(model.s), "v": {c: value(model.v[c]) for c in model.P}, "x": {c: value(model.x[c]) for c in model.A},
+        "z2": {c: value(model.z2[c]) for c in model.A}}
+
+# Formata as estatísticas da revalidação dos cortes de uma execução anterior (ver revalidaCortes)
+def formataRevalidacao(estatistica):
+    return (f"{sum(estatistica['mantidos'])} de {sum(estatistica['antigos'])} cortes mantidos, "
+        f"{sum(estatistica['invalidos'])} inválidos, tempo = {estatistica['tempo']:.3f}s, "
+        f"resoluções = {estatistica['resolucoes']}")
+
+# Formata as estatísticas da aproximação interna de uma iteração como uma linha do relatório
+def formataInterna(estatistica):
+    return f"UB = {estatistica['UB']}, tempo = {estatistica['tempo']:.3f}s, resoluções = {estatistica['resolucoes']}"
+
+# Revalida na instância inst os cortes de uma execução anterior numa instância parecida (ex.: com custos ou demandas um pouco
+# diferentes), lidos por carregaPools, e os adiciona aos pools. Do penúltimo estágio ao primeiro, o corte de Benders de
+# cada ponto de teste guardado é recalculado com os cenários da nova instância e os cortes já revalidados do estágio
+# seguinte, e por isso é válido nela. O corte antigo é inválido se, no seu ponto de teste, passa acima do recalculado (ele
+# cortaria a nova função de custo futuro); cortes recalculados que não melhoram a aproximação já revalidada no próprio
+# ponto, ou repetidos, são descartados. Retorna o número de resoluções e, por estágio, os números de cortes antigos,
+# mantidos (recalculados) e inválidos
+def revalidaCortes(inst, opt, pools, destinos, anteriores, violacaoMinima=VIOLACAO):
+    models, H = inst["models"], len(inst["models"])
+    if len(anteriores) != H or any(anteriores[t][0].shape[1] != len(inst["variaveisCorte"][t]) for t in range(H)):
+        raise ValueError("cortes de uma instância com outra estrutura (horizonte ou variáveis de estado)")
+    buffers = criaBuffers(1, H, len(inst["iP"]), len(inst["iA"]))
+    resolucoes = 0
+    estatistica = {"antigos": [0] * (H - 1), "mantidos": [0] * (H - 1), "invalidos": [0] * (H - 1)}
+    for t in range(H - 2, -1, -1):
+        Eant, eant, X = anteriores[t]
+        estatistica["antigos"][t] = len(eant)
+        for k in range(len(eant)):
+            gravaPonto(inst, buffers, 0, t, X[k])
+            corte = corteVazio(models[t], t, H)
+            for s, ps in inst["cenarios"][t+1]:
+                atualizaEstagio(inst, buffers, t + 1, 0, s)
+                opt.solve(models[t+1])
+                acumulaCorte(corte, ps, obtemDuais(models[t+1]), models[t+1].d[s], inst["a"][t+1], models[t+1].sMin,
+                    models[t+1].sMax, inst["q"], termos(pools[t+1]))
+            resolucoes += len(inst["cenarios"][t+1])
+            e, E = vetorCorte(corte)
+            valor = e - E @ X[k]
+            if eant[k] - Eant[k] @ X[k] > valor + EPSILON:
+                estatistica["invalidos"][t] += 1
+            aproximacao = np.max(termos(pools[t]) - coeficientes(pools[t]) @ X[k]) if pools[t]["n"] else -math.inf
+            if (violacaoMinima is None or valor - aproximacao >= violacaoMinima) and\
+                    not corteExiste(pools[t], E, e, EPSILON):
+                adicionaCorte(pools[t], E, e, X[k])
+                estatistica["mantidos"][t] += 1
+        insereCortes(pools[t], destinos[t])
+    return resolucoes, estatistica
+
+# Executa o SDDP e retorna um dicionário com os limites, o tempo e as estatísticas da execução
+# semente: semente do gerador de números aleatórios usado na amostragem
+# memoria: se True, mede a memória a cada iteração (RSS, tracemalloc e tamanho do pool de cortes, dos buffers de solução e
+#   dos modelos Pyomo) e a escreve no relatório. O tracemalloc deixa a execução bem mais lenta.
+# conexoes: sockets conectados a trabalhadores remotos (ver conectaTrabalhadores), que geram os cortes do passo backward.
+#   O tempo de resolução e o de comunicação de cada iteração são escritos no relatório
+# regiao: parâmetros da região de confiança do primeiro estágio (ver REGIAO), ou None para não regularizar. O ponto de teste
+#   do primeiro estágio fica numa caixa em torno do incumbente, que passa a ser o ponto de teste quando, com os cortes do
+#   passo backward, o modelo do primeiro estágio vale menos nele que no incumbente (passo sério). O teste não depende das
+#   amostras, que mudam a cada iteração. O LB continua vindo do primeiro estágio sem a caixa
+# violacaoMinima: violação mínima (ver violacaoCorte) de um corte no ponto de teste que o gerou para que seja adicionado
+#   (None: adiciona todos os cortes que não são repetidos)
+# interna: se True, mantém no passo backward uma aproximação interna do custo futuro de cada estágio (combinações convexas
+#   dos estados visitados, ver aproximacaoInterna), que dá um limite superior determinístico. O algoritmo também para
+#   quando esse limite fica a EPSILON do LB. O limite, o tempo e as resoluções de cada iteração vão para o relatório
+# adaptativo: parâmetros do controle adaptativo de M (ver criaControle: minimo, maximo e orcamento de resoluções), ou None
+#   para M fixo. M é o tamanho da primeira amostra; o M e a semilargura do intervalo de confiança de cada iteração vão
+#   para o relatório, e o algoritmo para quando o orçamento acaba
+# criterios: critérios de parada adicionais (ver parada.py), verificados a cada iteração junto com o critério do algoritmo.
+#   O relógio do limite de tempo começa com a construção dos modelos. Se um orçamento (tempo, resoluções, iterações) para
+#   a execução, a avaliação exata da solução sobre a árvore inteira é omitida
+# incumbente: arquivo (JSON) em que são escritos o motivo da parada, os melhores limites e a decisão do primeiro estágio
+# politica: arquivo (JSON) em que é escrita a decisão de cada nó da árvore de cenários na avaliação exata final, com os nós
+#   numerados como no PDE (filhos de k: k*g + 1, ..., k*g + g), para servir de solução inicial do pde-mip.py
+# cortesIniciais: arquivo com os cortes de uma execução anterior numa instância parecida (ver salvaCortes), revalidados
+#   nesta instância antes da primeira iteração (ver revalidaCortes). O tempo e as resoluções da revalidação fazem parte
+#   do tempo e das resoluções da execução
+# salvaCortes: arquivo em que são salvos, ao final, os cortes e pontos de teste de todos os estágios (ver salvaPools)
+# relatorio: arquivo do relatório da execução (padrão: <arquivo>-M<M>.txt)
+def sddp(file, H, M, semente=None, memoria=False, conexoes=None, regiao=None, violacaoMinima=VIOLACAO, interna=False,
+        adaptativo=None, criterios=None, incumbente=None, politica=None, cortesIniciais=None, salvaCortes=None,
+        relatorio=None):
+    if adaptativo and M <= 0:
+        raise ValueError("o controle adaptativo exige M > 0 (com M = 0 todos os cenários são enumerados)")
+    inicio = time.time()
+    # Com amostragem o UB é estatístico (sem a aproximação interna, cujo UB é um limite válido)
+    parada = criaParada(criterios or [], estatistico=M > 0 and not interna)
+    seed(semente)
+    if memoria:
+        iniciaMemoria()
+    medidas = []            # medidas de memória de cada iteração
 
     # Cria os modelos
     opt = SolverFactory("cplex")
-    models = [criaModelo(t) for t in range(H)]
-    a = [sum(models[t].q[c] for c in models[t].AAnt) for t in range(H)]    # volume adquirido anteriormente que chega em cada estágio
+    inst = criaInstancia(file, H)
+    models, a, q, cenarios, iP, iA = inst["models"], inst["a"], inst["q"], inst["cenarios"], inst["iP"], inst["iA"]
+    variaveisCorte = inst["variaveisCorte"]
+    construcao = time.time() - inicio       # tempo de construção dos modelos
 
     # Retorna uma lista com todos os cenários possíveis (sem amostragem)
     def geraTodosCenarios():
@@ -163,144 +505,74 @@ def sddp(file, H, M):
             return res
         return geraPerm(H - 1)
     
-    # Retorna uma lista de M cenários amostrados aleatoriamente
-    def geraAmostra():
-        amostra = []
-        m = 0
-        while m < M:
-            a = []
-            for t in range(H):
-                r = random()
-                p = 0
-                for s in models[t].S:
-                    p += models[t].p[s]
-                    if p >= r:
-                        a.append(s)
-                        break
-                
-            # Verifica se essa amostra já não foi gerada (para não repetir)
-            existe = False
-            for a1 in amostra:
-                existe = True
-                for t in range(H):
-                    if a1[t] != a[t]:
-                        existe = False
-                        break
-                if existe:
-                    break
-            if not existe:
-                amostra.append(a)
-                m += 1
-        #input(f"Ta aí suas amostras juliette {amostra}")
-        return amostra
-
     amostragem = M > 0      # se pediu 0 amostras, gera todos os cenários possíveis
     if not amostragem:
         amostra = geraTodosCenarios()
         M = len(amostra)
+
+    # Controle adaptativo de M, limitado ao número de caminhos da árvore de cenários (a amostra não repete caminhos)
+    controle = None
+    if adaptativo:
+        caminhos = math.prod(len(cenarios[t]) for t in range(H))
+        controle = criaControle(M, adaptativo.get("minimo", 1), min(adaptativo.get("maximo", math.inf), caminhos),
+            adaptativo.get("orcamento"))
+        M = controle["M"]
+    orcamentoEsgotado = False
     
     # Soluções atuais de cada cenário amostrado
-    sAtual = [[-1]*H for m in range(M)]
-    vAtual = [[{} for t in range(H - 1)] for m in range(M)]
-    xAtual = [[{} for t in range(H - 1)] for m in range(M)]
-    z1Atual = [[{} for t in range(H - 1)] for m in range(M)]
-    z2Atual = [[{} for t in range(H - 2)] for m in range(M)]
+    sAtual, vAtual, xAtual, z1Atual, z2Atual, origem = criaBuffers(M, H, len(iP), len(iA))
 
     # Soluções duais atuais do último estágio de cada amostra
     piAtual = [{} for m in range(M)]
 
-    # Termos independentes dos cortes gerados ao longo do algoritmo, para cada subproblema
-    eLists = [[] for t in range(H)]
-    EsLists = [[] for t in range(H)]
-    EvLists = [[] for t in range(H)]
-    ExLists = [[] for t in range(H)]
-    Ez2Lists = [[] for t in range(H)]
-    Ez1Lists = [[] for t in range(H)]
+    # Valores atuais de theta de cada amostra em cada estágio (nas linhas dadas por origem, como os buffers)
+    thetaAtual = np.zeros((M, H))
+
+    # Cortes gerados ao longo do algoritmo, para cada subproblema, e os modelos onde são inseridos
+    pools = [criaPool(len(variaveisCorte[t])) for t in range(H)]
+    destinos = [[(models[t].cortesOtimalidade, models[t].theta, variaveisCorte[t])] if t < H - 1 else [] for t in range(H)]
     cortes_repetidos = 0
+    cortes_descartados = [0] * H    # cortes não violados no ponto de teste, por estágio
+    resolucoes = 0          # número de subproblemas resolvidos
+
+    # Aproximação interna: uma cópia dos modelos em que theta é limitado pela combinação convexa dos pontos de estado
+    # visitados de cada estágio, e os limites superiores do custo futuro esperado em cada ponto
+    if interna:
+        instInterna = criaInstancia(file, H)
+        for t in range(H - 1):
+            instInterna["models"][t].cortesOtimalidade.deactivate()
+        lip = [lipschitzEstado(models[t], t, H) if t < H - 1 else [] for t in range(H)]
+    pontosInternos = [[] for t in range(H)]
+    valoresInternos = [[] for t in range(H)]
+    UBinterno = math.inf
+    estatisticaInterna = []     # limite superior determinístico, tempo e resoluções da aproximação interna por iteração
     
     # Resolve o problema para o cenário s do estágio t, usando a solução atual do estágio t-1 da amostra m.
     # Se s == None, é considerado o cenário do estágio t de m
     def resolveCenario(t, m, s=None):
+        nonlocal resolucoes
+        resolucoes += 1
         if s == None:
             s = amostra[m][t]
 
         #print(f"\nResolvendo problema ({t}, {s})")
         if t > 0:
-            # Atualiza as expressões dos estágios anteriores
-            models[t].sAnt.set_value(sAtual[m][t-1])
-            for c in models[t].PAnt:
-                models[t].vAnt[c].set_value(vAtual[m][t-1][c])
-            for c in models[t].AAnt:
-                models[t].xAnt[c].set_value(xAtual[m][t-1][c])
-            if t > 1:
-                for c in models[t].A2Ant:
-                    models[t].z1Ant[c].set_value(z1Atual[m][t-1][c])
-            if t < H - 1:
-                for c in models[t].AAnt:
-                    models[t].z2Ant[c].set_value(z2Atual[m][t-1][c])
-            models[t].dk.set_value(models[t].d[s])
+            atualizaEstagio(inst, (sAtual, vAtual, xAtual, z1Atual, z2Atual, origem), t, m, s)
         #models[t].pprint()
         return opt.solve(models[t])
     
-    # Verifica se existe algum item na amostra anterior a m que é coincide com o item m até o estágio t
-    # Se sim, retorna seu índice.
-    def cenarioRepetido(m, t):
-        if t == H - 1:      # no último estágio nunca repete
-            return -1
-        for m1 in range(m):
-            existe = True
-            for t1 in range(t + 1):
-                if amostra[m1][t1] != amostra[m][t1]:
-                    existe = False
-                    break
-            if existe:
-                return m1
-        return -1
-
     # Armazena a solução do estágio t da amostra m
     def armazenaSolucao(m, t):
-        sAtual[m][t] = value(models[t].s)
+        armazenaEstagio(inst, (sAtual, vAtual, xAtual, z1Atual, z2Atual, origem), m, t)
         if t < H - 1:
-            vAtual[m][t] = {c: value(models[t].v[c]) for c in models[t].P}
-            xAtual[m][t] = {c: value(models[t].x[c]) for c in models[t].A}
-            if t < H - 2:
-                z2Atual[m][t] = {c: value(models[t].z2[c]) for c in models[t].A}
-            if t > 0:
-                z1Atual[m][t] = {c: value(models[t].z1[c]) for c in models[t].AAnt}
+            thetaAtual[m, t] = models[t].theta.value
         
         # Se último estágio, aproveita e coleta as duais
         if t == H - 1:
-            piAtual[m] = obtemDuais(t)
+            piAtual[m] = obtemDuais(models[t])
         
         #imprimeSolucao(t)
     
-    # Retorna a solução dual do estágio t
-    def obtemDuais(t):
-        duais = {"adiamento2": {}, "cancelamentoAdiamento": {}, "limiteV": {}, "limiteX": {}, "limiteZ2": {}, "cortesOtimalidade": []}
-        for c in models[t].component_objects(Constraint, active=True):
-            name = c.getname()
-            if name in ["adiamento2", "cancelamentoAdiamento", "limiteV", "limiteX", "limiteZ2"]:
-                for index in c:
-                    duais[name][index] = models[t].dual[c[index]]
-            elif name == "cortesOtimalidade":
-                for index in c:
-                    duais[name].append(models[t].dual[c[index]])
-            else:
-                for index in c:
-                    duais[name] = models[t].dual[c[index]]
-        return duais
-    
-    # Copia a solução do estágio t da amostra m1 para o correspondente da amostra m2
-    def copiaSolucao(t, m1, m2):
-        sAtual[m2][t] = sAtual[m1][t]
-        if t < H - 1:       # até o penúltimo estágio
-            vAtual[m2][t] = {c: vAtual[m1][t][c] for c in vAtual[m1][t]}
-            xAtual[m2][t] = {c: xAtual[m1][t][c] for c in xAtual[m1][t]}
-            if t < H - 2:
-                z2Atual[m2][t] = {c: z2Atual[m1][t][c] for c in z2Atual[m1][t]}
-            if t > 0:
-                z1Atual[m2][t] = {c: z1Atual[m1][t][c] for c in z1Atual[m1][t]}
-
     def imprimeSolucao(t):
         f.write(f"Solução do estágio {t}: z* = {value(models[t].OBJ)}, s = {value(models[t].s)}")
         if t > 0:
@@ -321,26 +593,25 @@ def sddp(file, H, M):
     
     # Resolve o problema para todos os cenários para obter uma solução viável
     def obtemSolucaoViavel():
-        nonlocal amostra, sAtual, vAtual, xAtual, z1Atual, z2Atual, piAtual
+        nonlocal amostra, sAtual, vAtual, xAtual, z1Atual, z2Atual, origem, piAtual, thetaAtual
         amostra = geraTodosCenarios()
         M = len(amostra)
-        sAtual = [[-1]*H for m in range(M)]
-        vAtual = [[{} for t in range(H - 1)] for m in range(M)]
-        xAtual = [[{} for t in range(H - 1)] for m in range(M)]
-        z1Atual = [[{} for t in range(H - 1)] for m in range(M)]
-        z2Atual = [[{} for t in range(H - 2)] for m in range(M)]
+        sAtual, vAtual, xAtual, z1Atual, z2Atual, origem = criaBuffers(M, H, len(iP), len(iA))
+        thetaAtual = np.zeros((M, H))
         piAtual = [{} for m in range(M)]
         UBexato = value(models[0].OBJ) - value(models[0].theta)
+        armazenaSolucao(0, 0)
+        nos = {0: decisaoNo(0)}
         for m in range(M):
-            sAtual[m][0] = value(models[0].s)
-            vAtual[m][0] = {c: value(models[0].v[c]) for c in models[0].P}
-            xAtual[m][0] = {c: value(models[0].x[c]) for c in models[0].A}
-            z2Atual[m][0] = {c: value(models[0].z2[c]) for c in models[0].A}
+            copiaSolucao(origem, 0, 0, m)
+            no = 0
             for t in range(1, H):
-                m1 = cenarioRepetido(m, t)
+                no = no * len(models[t].S) + models[t].S.ord(amostra[m][t])     # número do nó no PDE
+                m1 = cenarioRepetido(amostra, m, t, H)
                 if m1 == -1:        # cenário inédito
                     resolveCenario(t, m)
                     armazenaSolucao(m, t)
+                    nos[no] = decisaoNo(t)
                     p = 1
                     for t1 in range(1, t + 1):
                         p *= models[t1].p[amostra[m][t1]]
@@ -349,7 +620,7 @@ def sddp(file, H, M):
                     else:
                         UBexato += p * value(models[t].OBJ)
                 else:               # cenário repetido
-                    copiaSolucao(t, m1, m)
+                    copiaSolucao(origem, t, m1, m)
 
         print(f"\n\nz* exato = {UBexato}\ngap exato = {UBexato} - {LB} = {UBexato - LB} ({(UBexato - LB)*100 / LB})%")
         print(f"\nEstágio 0:\ns = {value(models[0].s)}\nv = {[value(models[0].v[c]) for c in models[0].P]}")
@@ -359,110 +630,198 @@ def sddp(file, H, M):
         f.write(f"\nEstágio 0:\ns = {value(models[0].s)}\nv = {[value(models[0].v[c]) for c in models[0].P]}\n")
         f.write(f"x = {[value(models[0].x[c]) for c in models[0].A]}\n")
         f.write(f"z2 = {[value(models[0].z2[c]) for c in models[0].A]}\ntheta = {value(models[0].theta)}\n")
-    
-    def equals(x, y):
-        return abs(x - y) < EPSILON
-    
-    # Verifica se já foi adicionado um corte ao problema do estágio t com os mesmos coeficientes dados
-    def corteExiste(t, Es, Ev, Ex, Ez2, Ez1, e):
-        for i in range(len(eLists[t]) - 1, -1, -1):
-            if equals(Es, EsLists[t][i]) and equals(e, eLists[t][i]):
-                for c in Ev:
-                    if not equals(Ev[c], EvLists[t][i][c]):
-                        break
-                else:
-                    for c in Ex:
-                        if not equals(Ex[c], ExLists[t][i][c]):
-                            break
-                    else:
-                        for c in Ez2:
-                            if not equals(Ez2[c], Ez2Lists[t][i][c]):
-                                break
-                        else:
-                            for c in Ez1:
-                                if not equals(Ez1[c], Ez1Lists[t][i][c]):
-                                    break
-                            else:
-                                return True
-        return False
+        if politica:
+            with open(politica, 'w') as arquivo:
+                json.dump({"H": H, "g": len(models[1].S), "UB": UBexato, "decisao": decisaoPrimeiroEstagio(models[0]),
+                    "nos": nos}, arquivo)
+        return UBexato
+
+    # Retorna a decisão atual do estágio t no formato da política (estoque e frações das cargas adquiridas)
+    def decisaoNo(t):
+        return {"s": value(models[t].s), "v": {c: value(models[t].v[c]) for c in models[t].P} if t < H - 1 else {}}
     
     # Adiciona um corte de otimalidade de Benders agregado ao problema do estágio t, considerando a solução atual da amostra m
     # para este estágio
     def adicionaCorteBenders(m, t):
-        e = 0
-        Es = 0
-        Ev = {c: 0 for c in models[t].P}
-        Ex = {c: 0 for c in models[t].A}
-        Ez2 = {}
-        Ez1 = {}
-        if t < H - 2:
-            Ez2 = {c: 0 for c in models[t].A}
-        if t > 0:
-            Ez1 = {c: 0 for c in models[t].AAnt}
+        corte = corteVazio(models[t], t, H)
+        Ev, Ex, Ez2, Ez1 = corte[2:]
         for s in models[t+1].S:
             if (t == H - 2) and (s == amostra[m][t+1]):         # este cenário já foi resolvido na fase forward
                 duais = piAtual[m]
             else:
                 resolveCenario(t + 1, m, s)
-                duais = obtemDuais(t + 1)
-
-            sigma_e = sum(duais["cortesOtimalidade"][i] * eLists[t+1][i] for i in range(len(duais["cortesOtimalidade"])))
-            e += models[t+1].p[s] * (duais["balanco"]*(models[t+1].d[s] - a[t+1]) + duais["limiteSMin"]*models[t+1].sMin +
-                duais["limiteSMax"]*models[t+1].sMax + sum(duais["limiteV"][d] for d in duais["limiteV"]) +
-                sum(duais["limiteX"][d] for d in duais["limiteX"]) + sum(duais["limiteZ2"][d] for d in duais["limiteZ2"]) + sigma_e)
-            Es += models[t+1].p[s] * duais["balanco"]
-            for c in Ev:
-                Ev[c] -= models[t+1].p[s] * models[t].q[c] * duais["aquisicao"]
-            for c in Ex:
-                Ex[c] -= models[t+1].p[s] * models[t].q[c] * duais["cancelamento"]
-            for c in Ez2:
-                Ez2[c] -= models[t+1].p[s] * duais["adiamento2"][c]
-            for c in Ez1:
-                Ez1[c] -= models[t+1].p[s] * models[t].q[c] * duais["adiamento1"]
-
-        if corteExiste(t, Es, Ev, Ex, Ez2, Ez1, e):
-            nonlocal cortes_repetidos
+                duais = obtemDuais(models[t+1])
+            acumulaCorte(corte, models[t+1].p[s], duais, models[t+1].d[s], a[t+1], models[t+1].sMin, models[t+1].sMax, q,
+                termos(pools[t+1]))
+        e, E = vetorCorte(corte)
+        registraCorte(t, m, E, e)
+        #print(f"Corte de Benders para o estágio {t}: theta >= {e} - {E[0]}s - (", end="")
+        #for c in Ev:
+        #    print(f"{Ev[c]}v{c} + ", end="")
+        #print(") - (", end="")
+        #for c in Ex:
+        #    print(f"{Ex[c]}x{c} + ", end="")
+        #print(") - (", end="")
+        #for c in Ez2:
+        #    print(f"{Ez2[c]}z2,{c} + ", end="")
+        #print(") - (", end="")
+        #for c in Ez1:
+        #    print(f"{Ez1[c]}z1,{c} + ", end="")
+        #print(")")
+    
+    # Adiciona ao pool do estágio t o corte theta + E·x >= e gerado no ponto de teste da amostra m, se ele for violado nesse
+    # ponto e ainda não existir. O corte é inserido no modelo ao final do estágio no passo backward
+    def registraCorte(t, m, E, e):
+        nonlocal cortes_repetidos
+        buffers = (sAtual, vAtual, xAtual, z1Atual, z2Atual, origem)
+        if violacaoMinima is not None and\
+                violacaoCorte(E, e, pontoCorte(inst, buffers, m, t), thetaAtual[origem[m, t], t]) < violacaoMinima:
+            cortes_descartados[t] += 1
+        elif corteExiste(pools[t], E, e, EPSILON):
             cortes_repetidos += 1
         else:
-            models[t].cortesOtimalidade.add(expr=Es*models[t].s +
-                sum(Ev[c]*models[t].v[c] for c in Ev) +
-                sum(Ex[c]*models[t].x[c] for c in Ex) +
-                sum(Ez2[c]*models[t].z2[c] for c in Ez2) +
-                sum(Ez1[c]*models[t].z1[c] for c in Ez1) + models[t].theta >= e)
-            #print(f"Corte de Benders para o estágio {t}: theta >= {e} - {Es}s - (", end="")
-            #for c in Ev:
-            #    print(f"{Ev[c]}v{c} + ", end="")
-            #print(") - (", end="")
-            #for c in Ex:
-            #    print(f"{Ex[c]}x{c} + ", end="")
-            #print(") - (", end="")
-            #for c in Ez2:
-            #    print(f"{Ez2[c]}z2,{c} + ", end="")
-            #print(") - (", end="")
-            #for c in Ez1:
-            #    print(f"{Ez1[c]}z1,{c} + ", end="")
-            #print(")")
-            eLists[t].append(e)
-            EsLists[t].append(Es)
-            EvLists[t].append(Ev)
-            ExLists[t].append(Ex)
-            Ez2Lists[t].append(Ez2)
-            Ez1Lists[t].append(Ez1)
-    
+            adicionaCorte(pools[t], E, e, pontoCorte(inst, buffers, m, t))
+
+    # Adiciona à aproximação interna do estágio t os pontos de teste das amostras de ms, com o limite superior do custo
+    # futuro esperado em cada um: a média, nos cenários do estágio t+1, do valor do modelo t+1 com a aproximação interna
+    # do próprio estágio t+1 (já atualizada neste passo backward). Retorna o número de resoluções
+    def atualizaInterna(ms, t):
+        buffers = (sAtual, vAtual, xAtual, z1Atual, z2Atual, origem)
+        modelo = instInterna["models"][t+1]
+        for m in ms:
+            valor = 0
+            for s in modelo.S:
+                atualizaEstagio(instInterna, buffers, t + 1, m, s)
+                opt.solve(modelo)
+                valor += modelo.p[s] * value(modelo.OBJ)
+            pontosInternos[t].append(pontoCorte(inst, buffers, m, t))
+            valoresInternos[t].append(valor)
+        aproximacaoInterna(instInterna["models"][t], instInterna["variaveisCorte"][t], pontosInternos[t],
+            valoresInternos[t], lip[t])
+        return len(ms) * len(modelo.S)
+
+    # Retorna o ponto de teste (solução do estágio t da amostra m) enviado aos trabalhadores remotos: s, v, x, z1 e z2
+    def pontoTeste(m, t):
+        m0 = origem[m, t]
+        z2 = z2Atual[m0, t] if t < H - 2 else np.zeros(len(iA))
+        return np.concatenate([[sAtual[m0, t]], vAtual[m0, t], xAtual[m0, t], z1Atual[m0, t], z2])
+
+    # Gera nos trabalhadores remotos os cortes de Benders do estágio t para as amostras de ms, divididas entre eles. Cada
+    # tarefa leva os cortes do estágio t+1 que o trabalhador ainda não tem e o ponto de teste da amostra. Acumula em
+    # estatisticaRede o tempo de resolução nos trabalhadores, a comunicação (tempo do estágio além do trabalhador mais
+    # ocupado) e os bytes trafegados
+    def cortesDistribuidos(ms, t):
+        nonlocal resolucoes
+        inicioEstagio = time.perf_counter()
+        lotes = [ms[w::len(conexoes)] for w in range(len(conexoes))]
+        ocupado = [0] * len(conexoes)
+        pendentes = [0] * len(conexoes)     # tarefas enviadas e ainda sem resposta
+
+        # Envia ao trabalhador w a próxima tarefa do seu lote
+        def enviaTarefa(w):
+            m = lotes[w].pop(0)
+            n = enviados[w][t+1]
+            novos = np.column_stack([termos(pools[t+1])[n:], coeficientes(pools[t+1])[n:]])
+            enviados[w][t+1] = pools[t+1]["n"]
+            estatisticaRede["bytes"] += envia(conexoes[w], TAREFA, codificaTarefa(t, m, novos, pontoTeste(m, t)))
+            pendentes[w] += 1
+
+        # No máximo JANELA tarefas sem resposta por trabalhador: enviar todas antes de ler as respostas trava quando os
+        # buffers do TCP dos dois lados enchem. Cada resposta lida libera o envio da próxima tarefa do mesmo trabalhador
+        seletor = selectors.DefaultSelector()
+        for w in range(len(conexoes)):
+            while lotes[w] and pendentes[w] < JANELA:
+                enviaTarefa(w)
+            if pendentes[w]:
+                seletor.register(conexoes[w], selectors.EVENT_READ, w)
+        while any(pendentes):
+            for chave, evento in seletor.select():
+                w = chave.data
+                tipo, conteudo = recebe(conexoes[w])
+                pendentes[w] -= 1
+                estatisticaRede["bytes"] += len(conteudo)
+                m, tempo, e, E = decodificaCorte(conteudo)
+                ocupado[w] += tempo
+                resolucoes += len(models[t+1].S)
+                registraCorte(t, m, E, e)
+                if lotes[w]:
+                    enviaTarefa(w)
+                elif not pendentes[w]:
+                    seletor.unregister(conexoes[w])
+        seletor.close()
+        estatisticaRede["resolucao"] += sum(ocupado)
+        estatisticaRede["comunicacao"] += time.perf_counter() - inicioEstagio - max(ocupado)
+
+    # Gera os cortes de Benders do estágio t para as amostras de ms, localmente ou nos trabalhadores remotos
+    def adicionaCortes(ms, t):
+        if conexoes:
+            cortesDistribuidos(ms, t)
+        else:
+            for m in ms:
+                adicionaCorteBenders(m, t)
+
+    # Trabalhadores remotos: confere a instância e guarda quantos cortes de cada estágio cada um já recebeu
+    if conexoes:
+        for sock in conexoes:
+            tipo, conteudo = recebe(sock)
+            if tipo != INICIO or decodificaInicio(conteudo) != [len(variaveisCorte[t]) for t in range(H)]:
+                raise ValueError("trabalhador remoto com instância diferente da do coordenador")
+        enviados = [[0] * H for sock in conexoes]
+    rede = []               # tempo de resolução e de comunicação do passo backward distribuído em cada iteração
+
+    # Variáveis de estado do primeiro estágio limitadas pela região de confiança
+    variaveisRegiao = [models[0].v[c] for c in models[0].P] + [models[0].x[c] for c in models[0].A] +\
+        [models[0].z2[c] for c in models[0].A]
+
+    # Limita as variáveis de estado do primeiro estágio à caixa de raio dado em torno de centro (None: remove a caixa)
+    def limitaRegiao(centro, raio=None):
+        for i, var in enumerate(variaveisRegiao):
+            var.setlb(None if centro is None else max(0, centro[i] - raio))
+            var.setub(None if centro is None else centro[i] + raio)
+
+    # Retorna o valor do modelo do primeiro estágio (custo imediato mais a aproximação atual do custo futuro) com as
+    # variáveis de estado fixas no ponto dado
+    def valorModelo(ponto):
+        nonlocal resolucoesRegiao
+        for var, valor in zip(variaveisRegiao, ponto):
+            var.fix(float(valor))
+        resolveCenario(0, 0, 0)
+        for var in variaveisRegiao:
+            var.unfix()
+        resolucoesRegiao += 1
+        return value(models[0].OBJ)
+
+    # Região de confiança: incumbente e raio atual
+    centro = None
+    raio = regiao["raio"] if regiao else None
+    irrestrito = True       # se o último ponto de teste do primeiro estágio foi obtido sem a caixa
+    passosSerios = resolucoesRegiao = 0
+
     LB = LBant = -1e9
     UB = 1e9
+    semilargura = None      # semilargura do intervalo de confiança do UB estatístico
 
-    # Critério de parada do algoritmo
+    # Critério de parada do algoritmo. Com a região de confiança, o LB só é considerado estável se o último passo backward
+    # partiu do ponto sem a caixa
     if amostragem:
         def criterioParada():       # critério estocástico
-            return LB - LBant < EPSILON
+            return LB - LBant < EPSILON and irrestrito or UBinterno - LB < EPSILON
     else:
         def criterioParada():       # critério exato
-            return UB - LB < EPSILON
+            return UB - LB < EPSILON or UBinterno - LB < EPSILON
 
     iter = 0
-    f = open(f"{os.path.basename(file)}-M{M}.txt", 'w')
+    criterio = None         # critério de parada adicional que parou a execução
+    f = open(relatorio or f"{os.path.basename(file)}-M{M}.txt", 'w')
     start = time.time()
+
+    # Partida a quente com os cortes revalidados de uma execução anterior
+    revalidacao = None
+    if cortesIniciais:
+        n, revalidacao = revalidaCortes(inst, opt, pools, destinos, carregaPools(cortesIniciais), violacaoMinima)
+        resolucoes += n
+        revalidacao.update(tempo=time.time() - start, resolucoes=n)
+        print(f"Revalidação dos cortes: {formataRevalidacao(revalidacao)}")
     while True:
         # Atualiza lower bound
         LBant = LB
@@ -472,14 +831,36 @@ def sddp(file, H, M):
             print("Problema inviável!!!")
             return
         LB = value(models[0].OBJ)
+        decisao = decisaoPrimeiroEstagio(models[0])
         if criterioParada():
             break                           # ótimo encontrado
+        criterio = verificaParada(parada, iter, LB, min(UB, UBinterno), resolucoes, irrestrito, semilargura)
+        if criterio:
+            break
+
+        # Ponto de teste do primeiro estágio na região de confiança, se o ponto sem a caixa estiver fora dela. Se o LB
+        # estabilizou com pontos da região, esta iteração usa o ponto sem a caixa
+        irrestritoAtual = True
+        if regiao and centro is not None and not (amostragem and LB - LBant < EPSILON):
+            ponto = np.array([var.value for var in variaveisRegiao])
+            if np.abs(ponto - centro).max() > raio + EPSILON:
+                limitaRegiao(centro, raio)
+                resolveCenario(0, 0, 0)
+                limitaRegiao(None)
+                resolucoesRegiao += 1
+                irrestritoAtual = False
 
         iter += 1
         print(f"LB = {LB}, UB = {UB}\n\n*** ITERAÇÃO {iter} ***")
 
+        if controle and controle["M"] != M:
+            M = controle["M"]
+            sAtual, vAtual, xAtual, z1Atual, z2Atual, origem = criaBuffers(M, H, len(iP), len(iA))
+            thetaAtual = np.zeros((M, H))
+            piAtual = [{} for m in range(M)]
         if amostragem:
-            amostra = geraAmostra()
+            amostra = geraAmostra(M, cenarios)
+        resolucoesIteracao = resolucoes
 
         print("\n* PASSO FORWARD *\n")
         armazenaSolucao(0, 0)
@@ -490,10 +871,10 @@ def sddp(file, H, M):
         for m in range(M):
             #print(f"\nAmostra {m} - {amostra[m]}")
             if m > 0:
-                copiaSolucao(0, 0, m)
+                copiaSolucao(origem, 0, 0, m)
             obj[m] = value(models[0].OBJ) - value(models[0].theta)
             for t in range(1, H):
-                m1 = cenarioRepetido(m, t)
+                m1 = cenarioRepetido(amostra, m, t, H)
                 if m1 == -1:        # cenário inédito
                     results = resolveCenario(t, m)
                     #models[t].display()
@@ -503,7 +884,7 @@ def sddp(file, H, M):
                         return
                     armazenaSolucao(m, t)
                 else:               # cenário repetido
-                    copiaSolucao(t, m1, m)
+                    copiaSolucao(origem, t, m1, m)
                 obj[m] += value(models[t].OBJ)
                 if t < H - 1:
                     obj[m] -= value(models[t].theta)
@@ -514,39 +895,594 @@ def sddp(file, H, M):
         # Atualiza upper bound
         media /= somaprob
         desvio = (sum(prob[m] * (obj[m] - media)**2 for m in range(M)) / (M * somaprob))**0.5 if amostragem else 0
+        semilargura = ZALPHA2 * desvio if amostragem else None
         UB = media + ZALPHA2 * desvio
         if criterioParada():
             break                                   # ótimo encontrado
 
+        candidato = np.array([var.value for var in variaveisRegiao]) if regiao else None
+
         print(f"LB = {LB}, UB = {UB}\n\n* PASSO BACKWARD *\n")
         # Demais estágios
-        for t in range(H - 2, 0, -1):
-            for m in range(M):
-                if cenarioRepetido(m, t) == -1:
-                    adicionaCorteBenders(m, t)
-        adicionaCorteBenders(0, 0)                  # primeiro estágio
+        estatisticaRede = {"iteracao": iter, "resolucao": 0, "comunicacao": 0, "bytes": 0}
+        estatistica = {"iteracao": iter, "tempo": 0, "resolucoes": 0}
+        for t in range(H - 2, -1, -1):
+            ms = [m for m in range(M) if cenarioRepetido(amostra, m, t, H) == -1] if t > 0 else [0]
+            adicionaCortes(ms, t)
+            insereCortes(pools[t], destinos[t])
+            if interna:
+                inicioInterna = time.perf_counter()
+                estatistica["resolucoes"] += atualizaInterna(ms, t)
+                estatistica["tempo"] += time.perf_counter() - inicioInterna
+        irrestrito = irrestritoAtual
+
+        # Atualiza a região de confiança: passo sério se, com os cortes novos, o modelo do primeiro estágio vale menos no
+        # ponto de teste que no incumbente; nulo caso contrário. As duas avaliações usam o mesmo modelo, sem ruído amostral
+        if regiao:
+            if centro is None or valorModelo(candidato) < valorModelo(centro) - EPSILON:
+                centro = candidato
+                raio = min(raio * regiao["aumento"], 1)
+                passosSerios += 1
+            else:
+                raio = max(raio * regiao["reducao"], regiao["minimo"])
+        if conexoes:
+            rede.append(estatisticaRede)
+            print(f"Rede: {formataRede(estatisticaRede)}")
+        if interna:
+            # Limite superior determinístico: primeiro estágio com a aproximação interna do custo futuro
+            inicioInterna = time.perf_counter()
+            opt.solve(instInterna["models"][0])
+            UBinterno = min(UBinterno, value(instInterna["models"][0].OBJ))
+            estatistica["tempo"] += time.perf_counter() - inicioInterna
+            estatistica["resolucoes"] += 1
+            estatistica["UB"] = UBinterno
+            estatisticaInterna.append(estatistica)
+            print(f"Aproximação interna: {formataInterna(estatistica)}")
 
-    f.write(f"***SOLUÇÃO ÓTIMA ENCONTRADA***\n\nTempo de execução: {time.time() - start}s\n")
+        if controle:
+            if atualizaControle(controle, iter, LB, media, ZALPHA2 * desvio, resolucoes, resolucoes - resolucoesIteracao) == 0:
+                orcamentoEsgotado = True
+            print(f"Amostragem: {formataControle(controle['historico'][-1])}")
+
+        if memoria:
+            medidas.append({"iteracao": iter, **medeMemoria({
+                "cortes": pools,
+                "buffers": (sAtual, vAtual, xAtual, z1Atual, z2Atual, origem, piAtual)})})
+            print(f"Memória: {formataMemoria(medidas[-1])}")
+        if orcamentoEsgotado:
+            break
+
+    titulo = "ORÇAMENTO DE RESOLUÇÕES ESGOTADO" if orcamentoEsgotado else "SOLUÇÃO ÓTIMA ENCONTRADA"
+    if criterio:
+        titulo = f"PARADA: {descreveCriterio(criterio).upper()}"
+    orcamento = orcamentoEsgotado or (criterio is not None and criterio["tipo"] in ORCAMENTOS)
+    f.write(f"***{titulo}***\n\nTempo de execução: {time.time() - start}s\n")
     f.write(f"z* estocástico = {UB}\ngap estocástico = {UB} - {LB} = {UB - LB} ({(UB - LB)*100 / LB})%\n")
-    f.write(f"Iterações: {iter}\nCortes gerados no estágio 0: {len(eLists[0])}\n")
-    f.write(f"Total de cortes: {sum(len(eList) for eList in eLists)}\nCortes repetidos (não adicionados): {cortes_repetidos}")
-    print(f"\n\n***SOLUÇÃO ÓTIMA ENCONTRADA***\n\nTempo de execução: {time.time() - start}s")
+    f.write(f"Iterações: {iter}\nCortes gerados no estágio 0: {pools[0]['n']}\n")
+    f.write(f"Total de cortes: {sum(pool['n'] for pool in pools)}\nCortes repetidos (não adicionados): {cortes_repetidos}")
+    f.write(f"\nCortes não violados (descartados) por estágio: {cortes_descartados[:H - 1]}\nResoluções: {resolucoes}")
+    if revalidacao:
+        f.write(f"\nRevalidação dos cortes de {cortesIniciais}: {formataRevalidacao(revalidacao)}\nPor estágio (antigos, "
+            f"mantidos, inválidos): {list(zip(revalidacao['antigos'], revalidacao['mantidos'], revalidacao['invalidos']))}")
+    if regiao:
+        f.write(f"\nRegião de confiança: {passosSerios} passos sérios, {resolucoesRegiao} resoluções extras do primeiro estágio, "
+            f"raio final {raio}")
+    if interna:
+        f.write(f"\n\nUB determinístico (aproximação interna) = {UBinterno}\ngap determinístico = {UBinterno} - {LB} = "
+            f"{UBinterno - LB} ({(UBinterno - LB)*100 / LB})%\nAproximação interna por iteração:\n")
+        for estatistica in estatisticaInterna:
+            f.write(f"{estatistica['iteracao']}: {formataInterna(estatistica)}\n")
+    if controle:
+        f.write("\n\nAmostragem adaptativa por iteração (semilargura do intervalo de confiança do UB):\n")
+        for registro in controle["historico"]:
+            f.write(f"{registro['iteracao']}: {formataControle(registro)}\n")
+    if conexoes:
+        f.write(f"\n\nPasso backward distribuído em {len(conexoes)} trabalhadores, por iteração:\n")
+        for estatistica in rede:
+            f.write(f"{estatistica['iteracao']}: {formataRede(estatistica)}\n")
+    if memoria:
+        f.write("\n\nMemória por iteração (cortes: pool de cortes; buffers: soluções das amostras; pyomo: modelos):\n")
+        for medida in medidas:
+            f.write(f"{medida['iteracao']}: {formataMemoria(medida)}\n")
+        finalizaMemoria()
+    print(f"\n\n***{titulo}***\n\nTempo de execução: {time.time() - start}s")
     print(f"z* estocástico = {UB}\ngap estocástico = {UB} - {LB} = {UB - LB} ({(UB - LB)*100 / LB})%")
-    print(f"Iterações: {iter}\nCortes gerados no estágio 0: {len(eLists[0])}")
-    print(f"Total de cortes: {sum(len(eList) for eList in eLists)}\nCortes repetidos (não adicionados): {cortes_repetidos}")
-    obtemSolucaoViavel()    
+    print(f"Iterações: {iter}\nCortes gerados no estágio 0: {pools[0]['n']}")
+    print(f"Total de cortes: {sum(pool['n'] for pool in pools)}\nCortes repetidos (não adicionados): {cortes_repetidos}")
+    print(f"Cortes não violados (descartados) por estágio: {cortes_descartados[:H - 1]}\nResoluções: {resolucoes}")
+    if revalidacao:
+        print(f"Revalidação dos cortes: {formataRevalidacao(revalidacao)}")
+    if regiao:
+        print(f"Região de confiança: {passosSerios} passos sérios, {resolucoesRegiao} resoluções extras do primeiro estágio, raio final {raio}")
+    if interna:
+        print(f"UB determinístico (aproximação interna) = {UBinterno}\ngap determinístico = {UBinterno} - {LB} = "
+            f"{UBinterno - LB} ({(UBinterno - LB)*100 / LB})%")
+    tempo = time.time() - start
+    if salvaCortes:
+        salvaPools(salvaCortes, pools)
+    resolucoesAlgoritmo = resolucoes        # sem as resoluções da avaliação exata
+    if orcamento:           # sem a avaliação exata, que percorre a árvore inteira
+        UBexato = None
+        print(f"\nEstágio 0: {decisao}")
+        f.write(f"\nEstágio 0: {decisao}\n")
+        if politica:        # só o primeiro estágio
+            with open(politica, 'w') as arquivo:
+                json.dump({"H": H, "g": len(models[1].S), "decisao": decisao}, arquivo)
+    else:
+        UBexato = obtemSolucaoViavel()
+    f.close()
+    if incumbente:
+        if UBexato is None:
+            registraLimites(parada, LB, min(UB, UBinterno), semilargura)
+        else:               # o UB exato substitui o estatístico
+            registraLimites(parada, LB, UBexato)
+        escreveIncumbente(incumbente, parada, criterio, iter, resolucoesAlgoritmo, decisao)
+    return {"LB": LB, "UB": UB, "UBexato": UBexato, "iteracoes": iter, "tempo": tempo, "construcao": construcao,
+        "resolucoes": resolucoes, "cortes": sum(pool['n'] for pool in pools), "cortes_repetidos": cortes_repetidos,
+        "cortes_descartados": cortes_descartados[:H - 1], "memoria": medidas, "rede": rede, "passos_serios": passosSerios, "resolucoes_regiao": resolucoesRegiao,
+        "UBinterno": UBinterno, "interna": estatisticaInterna,
+        "amostragem": controle["historico"] if controle else [], "orcamento_esgotado": orcamentoEsgotado,
+        "parada": descreveCriterio(criterio) if criterio else "convergência", "decisao": decisao,
+        "revalidacao": revalidacao}
+
+# Trabalhador do SDDP assíncrono: até o coordenador sinalizar a parada, repete passos que amostram um caminho da árvore de
+# cenários, resolvem o passo forward sobre ele e geram um corte de Benders para cada estágio no passo backward. Os cortes
+# vão para o pool compartilhado (uma lista do gerenciador por estágio), do qual os cortes novos de todos os trabalhadores
+# são lidos antes de cada resolução. Ao final de cada passo, envia ao coordenador o custo do caminho e o número de cortes
+# gerados. Retorna os números de passos, de resoluções e de cortes repetidos ou não violados no ponto de teste (não
+# enviados)
+def trabalhadorAssincrono(file, H, semente, compartilhado):
+    seed(semente)
+    opt = SolverFactory("cplex")
+    inst = criaInstancia(file, H)
+    models, cenarios = inst["models"], inst["cenarios"]
+    pools = [criaPool(len(inst["variaveisCorte"][t])) for t in range(H)]
+    destinos = [[(models[t].cortesOtimalidade, models[t].theta, inst["variaveisCorte"][t])] if t < H - 1 else []
+        for t in range(H)]
+    buffers = criaBuffers(1, H, len(inst["iP"]), len(inst["iA"]))
+    cortes, parar, fila = compartilhado["cortes"], compartilhado["parar"], compartilhado["fila"]
+    passos = resolucoes = repetidos = descartados = 0
+
+    # Traz do pool compartilhado os cortes do estágio t gerados desde a última leitura e os insere no modelo. Chamada uma vez
+    # por estágio em cada passo (cada leitura do pool é uma ida e volta ao gerenciador), não a cada resolução
+    def sincroniza(t):
+        if t < H - 1:
+            for E, e in cortes[t][pools[t]["n"]:]:
+                adicionaCorte(pools[t], E, e)
+            insereCortes(pools[t], destinos[t])
+
+    # Resolve o cenário s do estágio t, usando a solução atual do estágio t-1
+    def resolveCenario(t, s):
+        nonlocal resolucoes
+        resolucoes += 1
+        if t > 0:
+            atualizaEstagio(inst, buffers, t, 0, s)
+        opt.solve(models[t])
+
+    while not parar.is_set():
+        caminho = geraAmostra(1, cenarios)[0]
+        custo = 0
+        theta = [0] * H
+        for t in range(H):                      # passo forward
+            sincroniza(t)
+            resolveCenario(t, caminho[t])
+            armazenaEstagio(inst, buffers, 0, t)
+            custo += value(models[t].OBJ)
+            if t < H - 1:
+                theta[t] = models[t].theta.value
+                custo -= theta[t]
+        novos = 0
+        for t in range(H - 2, -1, -1):          # passo backward
+            sincroniza(t + 1)
+            corte = corteVazio(models[t], t, H)
+            for s, ps in cenarios[t+1]:
+                resolveCenario(t + 1, s)
+                acumulaCorte(corte, ps, obtemDuais(models[t+1]), models[t+1].d[s], inst["a"][t+1], models[t+1].sMin,
+                    models[t+1].sMax, inst["q"], termos(pools[t+1]))
+            e, E = vetorCorte(corte)
+            if violacaoCorte(E, e, pontoCorte(inst, buffers, 0, t), theta[t]) < VIOLACAO:
+                descartados += 1
+            elif corteExiste(pools[t], E, e, EPSILON):
+                repetidos += 1
+            else:
+                cortes[t].append((E.tolist(), e))
+                novos += 1
+        passos += 1
+        fila.put((custo, novos))
+    return {"passos": passos, "resolucoes": resolucoes, "cortes_repetidos": repetidos, "cortes_descartados": descartados}
+
+# Executa o SDDP assíncrono com processos trabalhadores (ver trabalhadorAssincrono) e retorna um dicionário com os limites,
+# o tempo e as estatísticas da execução. O coordenador lê do pool compartilhado os cortes do primeiro estágio e atualiza o
+# LB a cada M passos concluídos pelos trabalhadores, parando quando ele se estabiliza (como o critério estocástico do SDDP)
+# ou após limiteTempo segundos. O UB estatístico é calculado sobre os custos dos caminhos dos últimos M passos.
+def sddpAssincrono(file, H, M, processos, semente=None, limiteTempo=None):
+    inicio = time.time()
+    opt = SolverFactory("cplex")
+    inst = criaInstancia(file, H)
+    model = inst["models"][0]
+    pool = criaPool(len(inst["variaveisCorte"][0]))
+    destinos = [(model.cortesOtimalidade, model.theta, inst["variaveisCorte"][0])]
+
+    gerenciador = multiprocessing.Manager()
+    compartilhado = {"cortes": [gerenciador.list() for t in range(H - 1)], "parar": gerenciador.Event(),
+        "fila": gerenciador.Queue()}
+    executor = ProcessPoolExecutor(processos)
+    futuros = [executor.submit(trabalhadorAssincrono, file, H, None if semente is None else semente + i, compartilhado)
+        for i in range(processos)]
+    construcao = time.time() - inicio       # tempo de construção dos modelos do coordenador
+
+    LB = LBant = -1e9
+    UB = 1e9
+    iter = passos = cortes = 0
+    custos = []
+    f = open(f"{os.path.basename(file)}-M{M}-P{processos}.txt", 'w')
+    start = time.time()
+    while True:
+        try:
+            custo, novos = compartilhado["fila"].get(timeout=1)
+        except queue.Empty:
+            for futuro in futuros:
+                if futuro.done():
+                    futuro.result()         # propaga o erro de um trabalhador
+            if limiteTempo is not None and time.time() - start >= limiteTempo:
+                break
+            continue
+        passos += 1
+        cortes += novos
+        custos.append(custo)
+        if passos % M != 0:
+            continue
+
+        # Atualiza lower bound com os cortes do primeiro estágio gerados até aqui
+        iter += 1
+        for E, e in compartilhado["cortes"][0][pool["n"]:]:
+            adicionaCorte(pool, E, e)
+        insereCortes(pool, destinos)
+        opt.solve(model)
+        LBant = LB
+        LB = value(model.OBJ)
+
+        # Upper bound estatístico dos últimos M caminhos (amostrados com suas probabilidades)
+        media = sum(custos[-M:]) / M
+        desvio = (sum((c - media)**2 for c in custos[-M:]) / M)**0.5
+        UB = media + ZALPHA2 * desvio / M**0.5
+        print(f"LB = {LB}, UB = {UB}, passos = {passos}, cortes = {cortes} ({cortes / (time.time() - start):.1f} cortes/s)")
+        if LB - LBant < EPSILON:
+            break                           # LB estabilizado
+        if limiteTempo is not None and time.time() - start >= limiteTempo:
+            break
+    compartilhado["parar"].set()
+    estatisticas = [futuro.result() for futuro in futuros]
+    executor.shutdown()
+    gerenciador.shutdown()
+    tempo = time.time() - start
+
+    resumo = (f"Tempo de execução: {tempo}s\nProcessos: {processos}\nz* estocástico = {UB}\n"
+        f"gap estocástico = {UB} - {LB} = {UB - LB} ({(UB - LB)*100 / LB})%\nVerificações do LB: {iter}\n"
+        f"Passos: {passos}\nCortes gerados no estágio 0: {pool['n']}\nTotal de cortes: {cortes} "
+        f"({cortes / tempo:.2f} cortes/s)\nCortes repetidos (não adicionados): {sum(e['cortes_repetidos'] for e in estatisticas)}"
+        f"\nCortes não violados (descartados): {sum(e['cortes_descartados'] for e in estatisticas)}")
+    f.write(f"***SDDP ASSÍNCRONO***\n\n{resumo}\n")
     f.close()
+    print(f"\n\n***SDDP ASSÍNCRONO***\n\n{resumo}")
+    return {"LB": LB, "UB": UB, "iteracoes": iter, "passos": passos, "tempo": tempo, "construcao": construcao,
+        "resolucoes": sum(e["resolucoes"] for e in estatisticas), "cortes": cortes, "cortes_por_segundo": cortes / tempo,
+        "cortes_repetidos": sum(e["cortes_repetidos"] for e in estatisticas),
+        "cortes_descartados": sum(e["cortes_descartados"] for e in estatisticas)}
+
+# Trabalhador remoto do SDDP distribuído: conecta-se ao coordenador em (host, porta), monta os modelos da instância file
+# com H estágios e, até receber FIM, resolve as tarefas do passo backward: recebe os cortes novos do estágio t+1 e um
+# ponto de teste do estágio t, resolve todos os cenários do estágio t+1 a partir dele e devolve o corte de Benders agregado
+def trabalhadorRemoto(file, H, host, porta):
+    opt = SolverFactory("cplex")
+    inst = criaInstancia(file, H)
+    models, cenarios = inst["models"], inst["cenarios"]
+    dimensoes = [len(inst["variaveisCorte"][t]) for t in range(H)]
+    pools = [criaPool(dimensoes[t]) for t in range(H)]
+    destinos = [[(models[t].cortesOtimalidade, models[t].theta, inst["variaveisCorte"][t])] if t < H - 1 else []
+        for t in range(H)]
+    buffers = criaBuffers(1, H, len(inst["iP"]), len(inst["iA"]))
+    sAtual, vAtual, xAtual, z1Atual, z2Atual, origem = buffers
+    nP, nA = len(inst["iP"]), len(inst["iA"])
+
+    sock = socket.create_connection((host, porta))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    envia(sock, INICIO, codificaInicio(dimensoes))
+    while True:
+        tipo, conteudo = recebe(sock)
+        if tipo == FIM:
+            break
+        t, identificador, cortes, ponto = decodificaTarefa(conteudo, dimensoes)
+        inicio = time.perf_counter()
+        for linha in cortes:
+            adicionaCorte(pools[t+1], linha[1:], linha[0])
+        insereCortes(pools[t+1], destinos[t+1])
+
+        # Ponto de teste: s, v, x, z1 e z2 do estágio t
+        sAtual[0, t] = ponto[0]
+        vAtual[0, t] = ponto[1:1 + nP]
+        xAtual[0, t] = ponto[1 + nP:1 + nP + nA]
+        z1Atual[0, t] = ponto[1 + nP + nA:1 + nP + 2*nA]
+        if t < H - 2:
+            z2Atual[0, t] = ponto[1 + nP + 2*nA:]
+
+        corte = corteVazio(models[t], t, H)
+        for s, ps in cenarios[t+1]:
+            atualizaEstagio(inst, buffers, t + 1, 0, s)
+            opt.solve(models[t+1])
+            acumulaCorte(corte, ps, obtemDuais(models[t+1]), models[t+1].d[s], inst["a"][t+1], models[t+1].sMin,
+                models[t+1].sMax, inst["q"], termos(pools[t+1]))
+        e, E = vetorCorte(corte)
+        envia(sock, CORTE, codificaCorte(identificador, time.perf_counter() - inicio, e, E))
+    sock.close()
+
+# Aguarda n trabalhadores remotos na porta dada e retorna seus sockets e os processos locais. Se locais == True, inicia os
+# n trabalhadores como processos nesta máquina (com porta == 0, numa porta livre qualquer)
+def conectaTrabalhadores(n, porta, locais=False, file=None, H=None):
+    servidor = socket.create_server(("", porta))
+    servidor.listen(n)
+    processos = []
+    if locais:
+        porta = servidor.getsockname()[1]
+        for i in range(n):
+            processo = multiprocessing.Process(target=trabalhadorRemoto, args=(file, H, "127.0.0.1", porta))
+            processo.start()
+            processos.append(processo)
+    conexoes = []
+    for i in range(n):
+        sock, endereco = servidor.accept()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conexoes.append(sock)
+    servidor.close()
+    return conexoes, processos
+
+# Encerra os trabalhadores remotos e aguarda os processos locais
+def encerraTrabalhadores(conexoes, processos):
+    for sock in conexoes:
+        envia(sock, FIM)
+        sock.close()
+    for processo in processos:
+        processo.join()
+
+# Serviço de replanejamento em horizonte decrescente: mantém os modelos e os pools de cortes em memória e atende pedidos
+# JSON, um por linha, lidos de entrada, escrevendo uma resposta por linha em saida. Como os cenários de cada estágio são
+# independentes dos anteriores, os cortes do estágio t continuam válidos depois que os estágios anteriores são executados,
+# e cada replanejamento parte da aproximação do anterior. Pedidos:
+# {"comando": "planeja"}: executa o SDDP a partir do estágio raiz atual e retorna a sua decisão
+# {"comando": "avanca", "demanda": d, "estado": {...}}: executa a decisão do estágio raiz (ou o estado dado, com s, v, x,
+#   z2 e z1 como na resposta), avança a raiz para o estágio seguinte com a demanda observada d e replaneja
+# {"comando": "fim"}: encerra o serviço
+# Cada resposta tem o estágio raiz, sua decisão, o LB, as iterações, as resoluções e o tempo do replanejamento
+# M: amostras por iteração; limiteIteracoes: iterações máximas de cada replanejamento (o SDDP para antes se o LB
+# estabilizar)
+def servicoReplanejamento(file, H, M, semente=None, limiteIteracoes=100, entrada=sys.stdin, saida=sys.stdout):
+    seed(semente)
+    opt = SolverFactory("cplex")
+    inst = criaInstancia(file, H)
+    models, cenarios = inst["models"], inst["cenarios"]
+    pools = [criaPool(len(inst["variaveisCorte"][t])) for t in range(H)]
+    destinos = [[(models[t].cortesOtimalidade, models[t].theta, inst["variaveisCorte"][t])] if t < H - 1 else []
+        for t in range(H)]
+    buffers = criaBuffers(M, H, len(inst["iP"]), len(inst["iA"]))
+    origem = buffers[5]
+    raiz = 0                # estágio raiz atual
+    demanda = None          # demanda observada do estágio raiz (None no estágio 0, cuja demanda é dada)
+    resolucoes = 0
+
+    # Resolve o estágio t da amostra m no cenário s. No estágio raiz (s = None), usa a demanda observada
+    def resolve(t, m, s):
+        nonlocal resolucoes
+        resolucoes += 1
+        if t > 0:
+            atualizaEstagio(inst, buffers, t, m, cenarios[t][0][0] if s is None else s)
+            if s is None:
+                models[t].dk.set_value(demanda)
+        opt.solve(models[t])
+
+    # Retorna a decisão atual do estágio t (as variáveis de estado que o modelo tem)
+    def decisao(t):
+        res = {"s": value(models[t].s)}
+        for nome in ["v", "x", "z2", "z1"]:
+            var = models[t].find_component(nome)
+            if var is not None:
+                res[nome] = {c: value(var[c]) for c in var}
+        return res
+
+    # Fixa o estado executado do estágio t no seu modelo e na linha 0 dos buffers, compartilhada por todas as amostras. O
+    # estado é todo validado contra a decisão do estágio antes de qualquer escrita, para que um pedido inválido não deixe
+    # o modelo e os buffers pela metade
+    def fixaEstado(t, estado):
+        atual = decisao(t)
+        if not isinstance(estado, dict) or "s" not in estado:
+            raise ValueError("o estado deve ser um objeto com s e as variáveis do estágio")
+        for nome, valores in estado.items():
+            if nome not in atual:
+                raise ValueError(f"o estágio {t} não tem a variável {nome}")
+            if nome == "s":
+                float(valores)
+                continue
+            if not isinstance(valores, dict):
+                raise ValueError(f"{nome} deve ser um objeto com um valor por carga")
+            for c, valor in valores.items():
+                if str(c) not in {str(i) for i in atual[nome]}:
+                    raise ValueError(f"{nome} do estágio {t} não tem o índice {c}")
+                float(valor)
+        models[t].s.set_value(float(estado["s"]))
+        for nome in ["v", "x", "z2", "z1"]:
+            var = models[t].find_component(nome)
+            indices = {str(i): i for i in var} if var is not None else {}
+            for c, valor in estado.get(nome, {}).items():
+                var[indices[str(c)]].set_value(float(valor))
+        armazenaEstagio(inst, buffers, 0, t)
+        origem[:, t] = 0
+
+    # SDDP a partir do estágio raiz, com os pools de cortes atuais. Retorna o LB e o número de iterações
+    def planeja():
+        LB = -math.inf
+        for iteracao in range(1, limiteIteracoes + 1):
+            LBant = LB
+            resolve(raiz, 0, None)
+            LB = value(models[raiz].OBJ)
+            armazenaEstagio(inst, buffers, 0, raiz)
+            origem[:, raiz] = 0
+            if raiz == H - 1 or LB - LBant < EPSILON:
+                break
+
+            # Passo forward sobre M caminhos a partir da raiz
+            amostra = geraAmostra(M, cenarios)
+            theta = np.zeros((M, H))
+            theta[:, raiz] = models[raiz].theta.value
+            for m in range(M):
+                for t in range(raiz + 1, H):
+                    resolve(t, m, amostra[m][t])
+                    armazenaEstagio(inst, buffers, m, t)
+                    if t < H - 1:
+                        theta[m, t] = models[t].theta.value
+
+            # Passo backward até a raiz
+            for t in range(H - 2, raiz - 1, -1):
+                for m in (range(M) if t > raiz else [0]):
+                    corte = corteVazio(models[t], t, H)
+                    for s, ps in cenarios[t+1]:
+                        resolve(t + 1, m, s)
+                        acumulaCorte(corte, ps, obtemDuais(models[t+1]), models[t+1].d[s], inst["a"][t+1],
+                            models[t+1].sMin, models[t+1].sMax, inst["q"], termos(pools[t+1]))
+                    e, E = vetorCorte(corte)
+                    if violacaoCorte(E, e, pontoCorte(inst, buffers, m, t), theta[m, t]) >= VIOLACAO and\
+                            not corteExiste(pools[t], E, e, EPSILON):
+                        adicionaCorte(pools[t], E, e)
+                insereCortes(pools[t], destinos[t])
+        return LB, iteracao
+
+    for linha in entrada:
+        if not linha.strip():
+            continue
+        inicio = time.time()
+        resolucoesInicio = resolucoes
+        try:
+            pedido = json.loads(linha)
+            if not isinstance(pedido, dict):
+                raise ValueError("o pedido deve ser um objeto JSON")
+            comando = pedido.get("comando")
+            if comando == "fim":
+                break
+            if comando == "avanca":
+                if raiz == H - 1:
+                    raise ValueError("o estágio raiz já é o último")
+                observada = float(pedido["demanda"])
+                if "estado" in pedido:
+                    fixaEstado(raiz, pedido["estado"])
+                raiz += 1
+                demanda = observada
+            elif comando != "planeja":
+                raise ValueError(f"comando desconhecido: {comando}")
+            LB, iteracoes = planeja()
+            resposta = {"estagio": raiz, "decisao": decisao(raiz), "LB": LB, "iteracoes": iteracoes,
+                "resolucoes": resolucoes - resolucoesInicio, "tempo": time.time() - inicio}
+        except (ValueError, KeyError, TypeError) as erro:
+            resposta = {"erro": str(erro)}
+        saida.write(json.dumps(resposta, ensure_ascii=False) + "\n")
+        saida.flush()
 
 # Modo de execução:
 # python sddp.py <arquivo> <H> <M>
 # arquivo: nome do arquivo de entrada
 # H: número de estágios na instância
 # M: número de amostras a serem realizadas por iteração
+# Opções:
+# --semente: semente da amostragem
+# --memoria: mede a memória a cada iteração e a escreve no relatório
+# --assincrono n: executa o SDDP assíncrono com n processos trabalhadores (M: passos entre as atualizações do LB)
+# --limite-tempo s: limite de tempo do SDDP assíncrono
+# --regiao-confianca [raio aumento reducao minimo]: regulariza o primeiro estágio com uma região de confiança (padrão: REGIAO)
+# --interna: mantém a aproximação interna do custo futuro, que dá um limite superior determinístico
+# --adaptativo [minimo maximo]: ajusta M a cada iteração pela largura do intervalo de confiança do UB (M: M inicial)
+# --orcamento n: limite de resoluções do controle adaptativo de M
+# --regra-parada regra: critérios de parada adicionais, ex. "gap=0.01,lb=3,tempo=60,resolucoes=5000,iteracoes=100" (ver parada.py)
+# --incumbente arquivo: escreve em arquivo (JSON) os melhores limites e a decisão do primeiro estágio ao parar
+# --politica arquivo: escreve em arquivo (JSON) a decisão de cada nó da árvore (solução inicial do pde-mip.py)
+# --salva-cortes arquivo: salva ao final os cortes e pontos de teste de todos os estágios (formato .npz)
+# --cortes-iniciais arquivo: parte dos cortes salvos de uma execução numa instância parecida, revalidados nesta instância
+#   (--compara-frio: executa também a partida a frio e compara o tempo até a convergência)
+# --servico: executa o serviço de replanejamento (ver servicoReplanejamento), com pedidos JSON na entrada padrão
+# --limite-iteracoes n: iterações máximas de cada replanejamento do serviço
+# --trabalhadores n: gera os cortes do passo backward em n trabalhadores remotos, que se conectam na porta --porta
+#   (--locais: inicia os n trabalhadores nesta máquina)
+# --conecta host:porta: executa como trabalhador remoto do coordenador em host:porta (M é ignorado)
 if __name__ == "__main__":
-    if len(sys.argv) == 4:
-        sddp(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
+    parser = argparse.ArgumentParser(description="SDDP para o Lot Sizing Estocástico")
+    parser.add_argument("arquivo", help="nome do arquivo de entrada")
+    parser.add_argument("H", type=int, help="número de estágios na instância")
+    parser.add_argument("M", type=int, help="número de amostras a serem realizadas por iteração (0: todos os cenários)")
+    parser.add_argument("--semente", type=int, help="semente da amostragem")
+    parser.add_argument("--memoria", action="store_true", help="mede a memória a cada iteração")
+    parser.add_argument("--assincrono", type=int, metavar="N", help="executa o SDDP assíncrono com N processos trabalhadores")
+    parser.add_argument("--limite-tempo", type=float, help="limite de tempo (s) do SDDP assíncrono")
+    parser.add_argument("--trabalhadores", type=int, metavar="N", help="número de trabalhadores remotos do passo backward")
+    parser.add_argument("--porta", type=int, default=0, help="porta em que os trabalhadores remotos se conectam")
+    parser.add_argument("--locais", action="store_true", help="inicia os trabalhadores remotos nesta máquina")
+    parser.add_argument("--conecta", metavar="HOST:PORTA", help="executa como trabalhador remoto")
+    parser.add_argument("--regiao-confianca", type=float, nargs='*', metavar="PARAMETRO",
+        help="regulariza o primeiro estágio com uma região de confiança: raio inicial, aumento, redução e raio mínimo")
+    parser.add_argument("--interna", action="store_true",
+        help="calcula um limite superior determinístico pela aproximação interna do custo futuro")
+    parser.add_argument("--adaptativo", type=int, nargs='*', metavar="LIMITE",
+        help="ajusta M a cada iteração pela largura do intervalo de confiança do UB, entre os limites mínimo e máximo")
+    parser.add_argument("--orcamento", type=int, help="limite de resoluções do controle adaptativo de M")
+    parser.add_argument("--regra-parada", type=lambda texto: leCriterios(texto, EPSILON), metavar="REGRA",
+        help="critérios de parada adicionais: gap=tolerância relativa, lb=janela, tempo=s, resolucoes=n, iteracoes=n")
+    parser.add_argument("--incumbente", metavar="ARQUIVO",
+        help="escreve os melhores limites e a decisão do primeiro estágio ao parar (JSON)")
+    parser.add_argument("--politica", metavar="ARQUIVO", help="escreve a decisão de cada nó da árvore de cenários (JSON)")
+    parser.add_argument("--salva-cortes", metavar="ARQUIVO", help="salva os cortes e pontos de teste ao final (.npz)")
+    parser.add_argument("--cortes-iniciais", metavar="ARQUIVO", help="parte dos cortes salvos, revalidados nesta instância")
+    parser.add_argument("--compara-frio", action="store_true", help="compara com a partida a frio (com --cortes-iniciais)")
+    parser.add_argument("--servico", action="store_true", help="serviço de replanejamento com pedidos JSON na entrada padrão")
+    parser.add_argument("--limite-iteracoes", type=int, default=100, help="iterações máximas de cada replanejamento")
+    args = parser.parse_args()
+    if args.compara_frio and not args.cortes_iniciais:
+        parser.error("--compara-frio exige --cortes-iniciais")
+    adaptativo = None
+    if args.adaptativo is not None:
+        if args.M <= 0:
+            parser.error("o controle adaptativo exige M > 0")
+        adaptativo = dict(zip(["minimo", "maximo"], args.adaptativo), orcamento=args.orcamento)
+    regiao = None
+    if args.regiao_confianca is not None:
+        regiao = dict(REGIAO)
+        regiao.update(zip(["raio", "aumento", "reducao", "minimo"], args.regiao_confianca))
+    if args.servico:
+        if args.M <= 0:
+            parser.error("o serviço de replanejamento exige M > 0")
+        servicoReplanejamento(args.arquivo, args.H, args.M, args.semente, args.limite_iteracoes)
+    elif args.conecta:
+        host, porta = args.conecta.rsplit(":", 1)
+        trabalhadorRemoto(args.arquivo, args.H, host, int(porta))
+    elif args.trabalhadores:
+        if not args.locais and args.porta == 0:
+            parser.error("informe --porta para trabalhadores em outras máquinas")
+        conexoes, processos = conectaTrabalhadores(args.trabalhadores, args.porta, args.locais, args.arquivo, args.H)
+        sddp(args.arquivo, args.H, args.M, args.semente, args.memoria, conexoes, regiao, interna=args.interna,
+            adaptativo=adaptativo, criterios=args.regra_parada, incumbente=args.incumbente,
+            politica=args.politica, cortesIniciais=args.cortes_iniciais, salvaCortes=args.salva_cortes)
+        encerraTrabalhadores(conexoes, processos)
+    elif args.assincrono:
+        if args.M <= 0:
+            parser.error("o SDDP assíncrono exige M > 0")
+        sddpAssincrono(args.arquivo, args.H, args.M, args.assincrono, args.semente, args.limite_tempo)
     else:
-        print("Modo de execução:\npython sddp.py <arquivo> <H> <M>\nonde:")
-        print("arquivo: nome do arquivo de entrada")
-        print("H: número de estágios na instância")
-        print("M: número de amostras a serem realizadas por iteração")
+        execucoes = []
+        if args.compara_frio:       # partida a frio: só o relatório, com o sufixo -frio, para não ser sobrescrita
+            execucoes.append(sddp(args.arquivo, args.H, args.M, args.semente, args.memoria, regiao=regiao,
+                interna=args.interna, adaptativo=adaptativo, criterios=args.regra_parada,
+                relatorio=f"{os.path.basename(args.arquivo)}-M{args.M}-frio.txt"))
+        execucoes.append(sddp(args.arquivo, args.H, args.M, args.semente, args.memoria, regiao=regiao,
+            interna=args.interna, adaptativo=adaptativo, criterios=args.regra_parada, incumbente=args.incumbente,
+            politica=args.politica, cortesIniciais=args.cortes_iniciais, salvaCortes=args.salva_cortes))
+        if len(execucoes) == 2:
+            frio, quente = execucoes
+            print(f"\nPartida a frio: {frio['tempo']:.2f}s, {frio['iteracoes']} iterações, {frio['resolucoes']} resoluções, "
+                f"LB = {frio['LB']}")
+            print(f"Partida a quente: {quente['tempo']:.2f}s (revalidação: {quente['revalidacao']['tempo']:.2f}s), "
+                f"{quente['iteracoes']} iterações, {quente['resolucoes']} resoluções, LB = {quente['LB']}")
+            print(f"Ganho de tempo até a convergência: {frio['tempo'] / max(quente['tempo'], 1e-9):.2f}x")